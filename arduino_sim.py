@@ -0,0 +1,223 @@
+import argparse
+import collections
+import logging
+import os
+import random
+import select
+import threading
+import time
+import tty
+from typing import Deque, Dict, Optional, Sequence, Tuple
+
+from serial_protocol import ACK, HELLO, MARK, VOTE, Frame, FrameDecoder
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# protocol="line" matches precodes/evm_arduino.py: Serial.println() of "1"-"3" per party button,
+# plus "4" for the officer's mark-as-voted button. protocol="framed" speaks serial_protocol,
+# keeping every frame until the host ACKs it and resending from the oldest after a timeout.
+EVENTS = ("1", "2", "3", "4")
+
+class VirtualEVMDevice:
+    def __init__(self, rate: float = 2.0, burst_size: int = 1, burst_interval: float = 0.0,
+                 jitter: float = 0.0, weights: Sequence[float] = (1, 1, 1, 0),
+                 count: Optional[int] = None, duration: Optional[float] = None, seed: Optional[int] = None,
+                 protocol: str = "line", corrupt_rate: float = 0.0, duplicate_rate: float = 0.0,
+                 retransmit_timeout: float = 0.2, window: int = 64):
+        self.rate = rate
+        self.burst_size = burst_size
+        self.burst_interval = burst_interval
+        self.jitter = jitter
+        self.weights = list(weights)
+        self.count = count
+        self.duration = duration
+        self.rng = random.Random(seed)
+
+        self.master_fd, self.slave_fd = os.openpty()
+        # Raw mode so the reader sees exactly the bytes a USB-serial Arduino would send.
+        tty.setraw(self.slave_fd)
+        self.port_name = os.ttyname(self.slave_fd)
+
+        self.sent: Dict[str, int] = {event: 0 for event in EVENTS}
+        self.dropped = 0
+
+        self.protocol = protocol
+        self.corrupt_rate = corrupt_rate
+        self.duplicate_rate = duplicate_rate
+        self.retransmit_timeout = retransmit_timeout
+        self.window = window
+        self.next_seq = 0
+        self.unacked: Deque[Tuple[int, bytes]] = collections.deque()
+        self.oldest_sent_at = 0.0
+        self.decoder = FrameDecoder()
+        self.acks = 0
+        self.retransmits = 0
+        self.corrupted = 0
+        self.duplicated = 0
+        self.write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def total_sent(self) -> int:
+        return sum(self.sent.values())
+
+    def start(self) -> None:
+        if self.protocol == "framed":
+            self._send_frame(HELLO, b"")
+        self._thread = threading.Thread(target=self._run, name="virtual-evm", daemon=True)
+        self._thread.start()
+        logging.info(f"Virtual EVM device listening on {self.port_name}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def wait(self) -> None:
+        if self._thread:
+            self._thread.join()
+
+    def close(self) -> None:
+        self.stop()
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def send(self, event: str) -> bool:
+        if self.protocol == "framed":
+            # A full window means the host stopped acknowledging; wait for it like real firmware.
+            while len(self.unacked) >= self.window and not self._stop.is_set():
+                self.service(0.01)
+            if event == "4":
+                self._send_frame(MARK, b"")
+            else:
+                self._send_frame(VOTE, bytes([int(event)]))
+            self.sent[event] += 1
+            return True
+        # Back-pressure from a reader that stopped draining the pty is counted, not blocked on.
+        _, writable, _ = select.select([], [self.master_fd], [], 0.5)
+        if not writable:
+            self.dropped += 1
+            return False
+        os.write(self.master_fd, f"{event}\r\n".encode("ascii"))
+        self.sent[event] += 1
+        return True
+
+    def _send_frame(self, type: int, payload: bytes) -> None:
+        seq = self.next_seq
+        self.next_seq = (self.next_seq + 1) & 0xFFFF
+        data = Frame(type, seq, payload).encode()
+        if not self.unacked:
+            self.oldest_sent_at = time.monotonic()
+        self.unacked.append((seq, data))
+        self._write(data)
+
+    def _write(self, data: bytes) -> None:
+        # Faults are injected on the wire only; the retained copy stays intact for resending.
+        if self.corrupt_rate and self.rng.random() < self.corrupt_rate:
+            damaged = bytearray(data)
+            damaged[self.rng.randrange(len(damaged))] ^= 1 << self.rng.randrange(8)
+            data = bytes(damaged)
+            self.corrupted += 1
+        with self.write_lock:
+            os.write(self.master_fd, data)
+            if self.duplicate_rate and self.rng.random() < self.duplicate_rate:
+                os.write(self.master_fd, data)
+                self.duplicated += 1
+
+    def service(self, timeout: float = 0.0) -> None:
+        # Reads host ACKs and resends everything unacknowledged once the oldest frame times out.
+        readable, _, _ = select.select([self.master_fd], [], [], timeout)
+        if readable:
+            for frame in self.decoder.feed(os.read(self.master_fd, 4096)):
+                if frame.type == ACK and len(frame.payload) == 2:
+                    self.acks += 1
+                    acked = int.from_bytes(frame.payload, "little")
+                    advanced = False
+                    while self.unacked and (acked - self.unacked[0][0]) & 0xFFFF < 0x8000:
+                        self.unacked.popleft()
+                        self.oldest_sent_at = time.monotonic()
+                        advanced = True
+                    if not advanced and self.unacked:
+                        # An ACK that moves nothing reports a gap: resend now rather than at the timeout.
+                        self.oldest_sent_at = 0.0
+        if self.unacked and time.monotonic() - self.oldest_sent_at >= self.retransmit_timeout:
+            self.retransmits += 1
+            self.oldest_sent_at = time.monotonic()
+            for _, data in list(self.unacked):
+                self._write(data)
+
+    def drain(self, timeout: float = 5.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while self.unacked and time.monotonic() < deadline:
+            self.service(0.01)
+        return not self.unacked
+
+    def _next_gap(self, base: float) -> float:
+        if self.jitter:
+            base *= 1 + self.rng.uniform(-self.jitter, self.jitter)
+        return max(0.0, base)
+
+    def _run(self) -> None:
+        started = time.monotonic()
+        deadline = started + self.duration if self.duration else None
+        next_at = started
+        interval = 1.0 / self.rate if self.rate > 0 else 0.0
+        in_burst = 0
+        while not self._stop.is_set():
+            if self.count is not None and self.total_sent >= self.count:
+                break
+            now = time.monotonic()
+            if deadline and now >= deadline:
+                break
+            if next_at > now:
+                if self.protocol == "framed":
+                    self.service(min(next_at - now, 0.01))
+                else:
+                    self._stop.wait(next_at - now)
+                continue
+
+            self.send(self.rng.choices(EVENTS, weights=self.weights)[0])
+            in_burst += 1
+            # Within a burst events go out at `rate`; between bursts the device idles.
+            if self.burst_size > 1 and in_burst >= self.burst_size:
+                in_burst = 0
+                next_at += self._next_gap(self.burst_interval)
+            else:
+                next_at += self._next_gap(interval)
+        if self.protocol == "framed":
+            self.drain()
+            logging.info(f"Framed link: {self.acks} ACKs, {self.retransmits} retransmit rounds, {self.corrupted} corrupted "
+                         f"and {self.duplicated} duplicated writes, {len(self.unacked)} frame(s) never acknowledged")
+        logging.info(f"Virtual EVM device stopped after {self.total_sent} events ({self.dropped} dropped): {self.sent}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate the EVM Arduino on a pseudo-terminal.")
+    parser.add_argument("--rate", type=float, default=2.0, help="events per second (within a burst when bursting)")
+    parser.add_argument("--burst-size", type=int, default=1, help="events sent back to back per burst")
+    parser.add_argument("--burst-interval", type=float, default=1.0, help="idle seconds between bursts")
+    parser.add_argument("--jitter", type=float, default=0.0, help="relative jitter on every gap, e.g. 0.2 for +/-20%%")
+    parser.add_argument("--weights", type=float, nargs=4, default=[1, 1, 1, 0], metavar=("P1", "P2", "P3", "MARK"),
+                        help="relative frequency of events 1, 2, 3 and 4")
+    parser.add_argument("--count", type=int, help="stop after this many events")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--protocol", choices=["line", "framed"], default="line")
+    parser.add_argument("--corrupt-rate", type=float, default=0.0, help="framed only: chance a write has a bit flipped")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="framed only: chance a write is sent twice")
+    args = parser.parse_args()
+
+    device = VirtualEVMDevice(args.rate, args.burst_size, args.burst_interval, args.jitter, args.weights,
+                              args.count, args.duration, args.seed, args.protocol, args.corrupt_rate, args.duplicate_rate)
+    print(f"Point the EVM at {device.port_name}, e.g. EVM_SERIAL_PORT={device.port_name} "
+          f"EVM_SERIAL_PROTOCOL={args.protocol} python evm_new.py")
+    device.start()
+    try:
+        device.wait()
+    except KeyboardInterrupt:
+        device.stop()
+    finally:
+        device.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from metrics import registry
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+AUDIT_RECORDS = registry.counter("evm_audit_records_total", "Audit records appended", ["kind"])
+AUDIT_FSYNC_SECONDS = registry.histogram("evm_audit_fsync_seconds", "Audit batch write and fsync time").labels()
+AUDIT_BATCH_RECORDS = registry.histogram("evm_audit_batch_records", "Records made durable per fsync",
+                                         buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)).labels()
+AUDIT_WRITE_ERRORS = registry.counter("evm_audit_write_errors_total", "Audit batches that failed to write").labels()
+
+# The `prev` of the first record.
+GENESIS = "0" * 64
+
+def _canonical(record: dict) -> bytes:
+    return json.dumps(record, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def _digest(record: dict) -> str:
+    # Covers every field but the hash itself, `prev` included, which is what chains the records.
+    return hashlib.sha256(_canonical(record)).hexdigest()
+
+class AuditLog:
+    # Append-only JSON lines, one per vote or marking event, each carrying the hash of the one
+    # before it, so editing, dropping or reordering a record breaks the chain from there on.
+    # append() only hashes and queues: a writer thread writes whatever has queued and fsyncs
+    # once per batch, every `flush_interval` seconds or at `max_batch` records, so the cost of
+    # an fsync is shared by everything that arrived meanwhile. A power cut can lose at most the
+    # last interval. Every `checkpoint_every` records the (seq, byte offset, hash) is added to
+    # a sidecar index, which lets verify() check the file in independent chunks. A batch that
+    # fails to write is cut back off the file and retried ahead of everything queued after it,
+    # since every later record's hash already chains to it.
+    def __init__(self, path: str, flush_interval: float = 0.05, max_batch: int = 512,
+                 checkpoint_every: int = 1000, retry_interval: float = 1.0):
+        self.path = path
+        self.index_path = f"{path}.checkpoints"
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.checkpoint_every = checkpoint_every
+        self.retry_interval = retry_interval
+        self.seq, self.head, self.offset = self._recover()
+        self.durable_seq = self.seq
+        # Unbuffered, so a failed write leaves nothing behind in a buffer to be flushed later.
+        self.file = open(path, "ab", buffering=0)
+        self.index = open(self.index_path, "a", encoding="utf-8")
+        self.pending: List[Tuple[int, str, bytes]] = []
+        self.pending_checkpoints: List[str] = []
+        # Set after a failed write: bytes past `offset` may be a partial batch.
+        self._torn = False
+        self.cond = threading.Condition()
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name="evm-audit", daemon=True)
+        self._writer.start()
+
+    def _recover(self) -> Tuple[int, str, int]:
+        # Continues the chain from the last complete record; a line torn by a crash mid-write
+        # is cut off, since it was never reported durable.
+        if not os.path.exists(self.path):
+            return 0, GENESIS, 0
+        with open(self.path, "r+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            tail = b""
+            position = size
+            while position > 0 and tail.count(b"\n") < 2:
+                step = min(position, 64 * 1024)
+                position -= step
+                f.seek(position)
+                tail = f.read(step) + tail
+            end = tail.rfind(b"\n") + 1
+            if position + end < size:
+                logging.warning(f"Audit log {self.path} ends in a torn record; truncating {size - position - end} byte(s)")
+                f.truncate(position + end)
+                os.fsync(f.fileno())
+            lines = tail[:end].splitlines()
+        if not lines or not lines[-1]:
+            return 0, GENESIS, position + end
+        last = json.loads(lines[-1])
+        return last["seq"], last["hash"], position + end
+
+    def append(self, kind: str, data: dict) -> int:
+        with self.cond:
+            if self._closed:
+                raise ValueError("audit log is closed")
+            self.seq += 1
+            record = {"seq": self.seq, "ts": time.time(), "kind": kind, "data": data, "prev": self.head}
+            self.head = record["hash"] = _digest(record)
+            self.pending.append((self.seq, self.head, _canonical(record) + b"\n"))
+            if len(self.pending) >= self.max_batch:
+                self.cond.notify_all()
+            seq = self.seq
+        AUDIT_RECORDS.labels(kind).inc()
+        return seq
+
+    def _run(self) -> None:
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self._closed or len(self.pending) >= self.max_batch, self.flush_interval)
+                batch, self.pending = self.pending, []
+                closing = self._closed
+            if not batch:
+                if closing:
+                    return
+                continue
+            if self._write(batch):
+                self._write_checkpoints()
+                continue
+            with self.cond:
+                self.pending[:0] = batch
+                if closing:
+                    logging.error(f"Audit log {self.path} closed with {len(self.pending)} record(s) unwritten")
+                    return
+                self.cond.wait_for(lambda: self._closed, self.retry_interval)
+
+    def _write(self, batch: List[Tuple[int, str, bytes]]) -> bool:
+        started = time.perf_counter()
+        offset = self.offset
+        checkpoints = []
+        for seq, digest, line in batch:
+            offset += len(line)
+            if seq % self.checkpoint_every == 0:
+                checkpoints.append(f"{seq} {offset} {digest}\n")
+        try:
+            if self._torn:
+                self.file.truncate(self.offset)
+                self._torn = False
+            data = memoryview(b"".join(line for _, _, line in batch))
+            while data:
+                data = data[self.file.write(data):]
+            os.fsync(self.file.fileno())
+        except OSError as e:
+            self._torn = True
+            AUDIT_WRITE_ERRORS.inc()
+            logging.error(f"Could not write {len(batch)} audit record(s) to {self.path}, retrying: {e}")
+            return False
+        self.offset = offset
+        # Only added once the records they point at are on disk.
+        self.pending_checkpoints.extend(checkpoints)
+        AUDIT_FSYNC_SECONDS.observe(time.perf_counter() - started)
+        AUDIT_BATCH_RECORDS.observe(len(batch))
+        with self.cond:
+            self.durable_seq = batch[-1][0]
+            self.cond.notify_all()
+        return True
+
+    def _write_checkpoints(self) -> None:
+        # A failure here only costs verify() some parallelism, so they are simply retried with
+        # the next batch; a line written twice is skipped when the index is read.
+        if not self.pending_checkpoints:
+            return
+        try:
+            self.index.write("".join(self.pending_checkpoints))
+            self.index.flush()
+            os.fsync(self.index.fileno())
+        except OSError as e:
+            AUDIT_WRITE_ERRORS.inc()
+            logging.error(f"Could not write audit checkpoints to {self.index_path}: {e}")
+            return
+        self.pending_checkpoints.clear()
+
+    def sync(self, timeout: Optional[float] = None) -> bool:
+        # Waits until everything appended so far is on disk.
+        with self.cond:
+            target = self.seq
+            self.cond.notify_all()
+            return self.cond.wait_for(lambda: self.durable_seq >= target, timeout)
+
+    def close(self) -> None:
+        with self.cond:
+            if self._closed:
+                return
+            self._closed = True
+            self.cond.notify_all()
+        self._writer.join()
+        self.file.close()
+        self.index.close()
+        # Worth copying off the booth: with it, rewriting the whole chain is detectable too.
+        logging.info(f"Audit log {self.path} closed at record {self.seq}, head hash {self.head}")
+
+def _read_checkpoints(index_path: str) -> List[Tuple[int, int, str]]:
+    checkpoints = []
+    if not os.path.exists(index_path):
+        return checkpoints
+    with open(index_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                seq, offset, digest = line.split()
+                seq, offset = int(seq), int(offset)
+            except ValueError:
+                continue
+            if not checkpoints or offset > checkpoints[-1][1]:
+                checkpoints.append((seq, offset, digest))
+    return checkpoints
+
+def _verify_chunk(path: str, start: int, end: int, prev: str, seq: int) -> Tuple[int, str, Optional[str]]:
+    # Returns (records checked, hash of the last one, first error or None).
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    count = 0
+    for line in data.splitlines():
+        try:
+            record = json.loads(line)
+            digest = record.pop("hash")
+        except (ValueError, KeyError):
+            return count, prev, f"unreadable record after seq {seq - 1}"
+        if record.get("seq") != seq:
+            return count, prev, f"expected seq {seq}, found {record.get('seq')}"
+        if record.get("prev") != prev:
+            return count, prev, f"record {seq} does not follow record {seq - 1}"
+        if _digest(record) != digest:
+            return count, prev, f"record {seq} was altered"
+        prev = digest
+        seq += 1
+        count += 1
+    return count, prev, None
+
+def verify(path: str, workers: Optional[int] = None) -> dict:
+    # Each chunk between checkpoints is checked in its own process, starting from the previous
+    # checkpoint's hash; the chunk must then end on its own checkpoint's hash, so the index
+    # cannot be edited to hide a broken chunk either.
+    size = os.path.getsize(path)
+    checkpoints = _read_checkpoints(f"{path}.checkpoints")
+    errors = []
+    # A checkpoint is only written after its records are fsynced, so one past the end of the
+    # file means records were cut off the log.
+    for seq, offset, _ in checkpoints:
+        if offset > size:
+            errors.append(f"log ends at byte {size}, before checkpoint {seq} at byte {offset}: records were removed")
+    checkpoints = [checkpoint for checkpoint in checkpoints if checkpoint[1] <= size]
+    starts = [(0, GENESIS, 1)] + [(offset, digest, seq + 1) for seq, offset, digest in checkpoints]
+    ends = [offset for _, offset, _ in checkpoints] + [size]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_verify_chunk, path, start, end, prev, seq)
+                   for (start, prev, seq), end in zip(starts, ends)]
+        results = [future.result() for future in futures]
+
+    records = 0
+    for i, (count, last, error) in enumerate(results):
+        records += count
+        if error:
+            errors.append(error)
+        elif i < len(checkpoints) and last != checkpoints[i][2]:
+            errors.append(f"chain does not reach checkpoint {checkpoints[i][0]}")
+    return {"records": records, "chunks": len(results), "head": results[-1][1], "errors": errors}
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify a hash-chained EVM audit log.")
+    parser.add_argument("path", nargs="?", default=os.environ.get('EVM_AUDIT_LOG', 'audit.log'))
+    parser.add_argument("--workers", type=int, default=None, help="processes to verify chunks with (default: one per CPU)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    report = verify(args.path, args.workers)
+    print(f"Checked {report['records']} record(s) in {report['chunks']} chunk(s) "
+          f"in {time.perf_counter() - started:.2f} s; head hash {report['head']}")
+    if report["errors"]:
+        # A removed or inserted record shifts every later chunk, so the first error is the one to read.
+        for error in report["errors"][:5]:
+            print(f"AUDIT LOG BROKEN: {error}")
+        if len(report["errors"]) > 5:
+            print(f"... and {len(report['errors']) - 5} more broken chunk(s)")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+import psycopg2
+import serial
+
+from evm_engine import ArduinoManager, DatabaseManager, EVMEngine
+from migrations import run_migrations
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+FIRST_NAMES = ["Aarav", "Vivaan", "Aditya", "Ananya", "Diya", "Ishaan", "Kavya", "Meera", "Rohan", "Saanvi",
+               "Arjun", "Priya", "Rahul", "Sneha", "Vikram", "Lakshmi", "Karthik", "Divya", "Suresh", "Pooja"]
+LAST_NAMES = ["Sharma", "Reddy", "Rao", "Gupta", "Iyer", "Nair", "Patel", "Singh", "Kumar", "Das",
+              "Menon", "Joshi", "Verma", "Naidu", "Pillai", "Bose", "Chopra", "Mehta", "Kapoor", "Varma"]
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+class _RosterStream(io.RawIOBase):
+    # Feeds COPY ... FROM STDIN without materialising millions of rows in memory.
+    def __init__(self, size: int, seed: int):
+        self.rows = _roster_rows(size, seed)
+        self.pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while len(self.pending) < len(buffer):
+            chunk = "".join(row for _, row in zip(range(5000), self.rows))
+            if not chunk:
+                break
+            self.pending += chunk.encode("utf-8")
+        count = min(len(buffer), len(self.pending))
+        buffer[:count] = self.pending[:count]
+        self.pending = self.pending[count:]
+        return count
+
+def _roster_rows(size: int, seed: int) -> Iterator[str]:
+    rng = random.Random(seed)
+    for i in range(size):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}"
+        yield f"V{i:08d}\t{name}\thttps://example.invalid/photos/{i}.jpg\tf\n"
+
+def load_roster(db_manager: DatabaseManager, size: int, seed: int) -> None:
+    started = time.perf_counter()
+    with db_manager.transaction():
+        db_manager.execute("TRUNCATE voters")
+        db_manager.execute("TRUNCATE applied_writes")
+        db_manager.cursor.copy_expert(
+            "COPY voters (id, name, image_url, has_voted) FROM STDIN",
+            io.BufferedReader(_RosterStream(size, seed), buffer_size=1 << 20)
+        )
+        db_manager.execute("TRUNCATE parties RESTART IDENTITY")
+        db_manager.execute_many(
+            "INSERT INTO parties (name, votes) VALUES %s",
+            [(f"Party {party_id}", 0) for party_id in range(1, 4)],
+            values=True
+        )
+    db_manager.execute("ANALYZE voters")
+    print(f"Loaded {size} synthetic voters in {time.perf_counter() - started:.1f} s")
+
+def summarize(samples: List[float], wall: float) -> Dict[str, float]:
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "max_ms": ordered[-1] * 1000,
+        "throughput_per_s": len(ordered) / wall if wall > 0 else 0.0,
+    }
+
+def measure(iterations: int, setup: Callable[[int], None], operation: Callable[[], None]) -> Dict[str, float]:
+    samples = []
+    wall_started = time.perf_counter()
+    for i in range(iterations):
+        setup(i)
+        started = time.perf_counter()
+        operation()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples, time.perf_counter() - wall_started)
+
+@contextmanager
+def scratch_roster_files() -> Iterator[None]:
+    # Points the engine's snapshot and voted bitmap at a temporary directory, so a run neither
+    # loads a stale roster.snapshot from the working directory nor overwrites its voted.bitmap.
+    names = {'EVM_ROSTER_SNAPSHOT': 'roster.snapshot', 'EVM_VOTED_BITMAP': 'voted.bitmap'}
+    saved = {name: os.environ.get(name) for name in names}
+    with tempfile.TemporaryDirectory(prefix="evm-bench-") as directory:
+        os.environ.update({name: os.path.join(directory, filename) for name, filename in names.items()})
+        try:
+            yield
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+def bench_size(engine: EVMEngine, port, size: int, iterations: int, seed: int) -> Dict[str, Dict[str, float]]:
+    with scratch_roster_files():
+        try:
+            return _bench_size(engine, port, size, iterations, seed)
+        finally:
+            if engine.store is not None:
+                engine.store.close()
+                engine.store = None
+
+def _bench_size(engine: EVMEngine, port, size: int, iterations: int, seed: int) -> Dict[str, Dict[str, float]]:
+    rng = random.Random(seed)
+    # Operations that pull the whole roll get fewer rounds so 10M-voter runs finish.
+    full_scan_rounds = max(1, min(iterations, 1_000_000 // size))
+    results = {}
+    results["load_voter_store"] = measure(1, lambda i: None, engine.load_roster)
+    results["load_voter_store"]["store_mib"] = engine.store.nbytes() / 2**20
+    query = [""]
+
+    def set_search(i):
+        # The 40 names would all be cached after a few rounds, so each search starts cold.
+        engine.cache.invalidate()
+        query[0] = rng.choice([rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), f"V{rng.randrange(size):08d}"])
+    results["search_voter"] = measure(iterations, set_search, lambda: engine.search_voters(query[0]))
+
+    results["refresh_voter_list"] = measure(full_scan_rounds, lambda i: None, engine.list_voters)
+
+    def press_button(i):
+        port.write(f"{rng.randint(1, 3)}\n".encode())
+    results["increment_party_vote"] = measure(iterations, press_button, engine.poll_serial)
+
+    unvoted = rng.sample(range(size), min(size, full_scan_rounds))
+    voter_id = [""]
+
+    def select_voter(i):
+        voter_id[0] = f"V{unvoted[i]:08d}"
+    results["mark_as_voted"] = measure(len(unvoted), select_voter, lambda: engine.mark_voted(voter_id[0]))
+
+    results["end_voting"] = measure(iterations, lambda i: None, engine.results)
+    return results
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(report: dict, baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nComparison against {baseline_path} ({baseline.get('git_revision')}):")
+    for size, operations in report["results"].items():
+        for name, stats in operations.items():
+            old = baseline.get("results", {}).get(size, {}).get(name)
+            if not old:
+                continue
+            delta = (stats["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100 if old["p50_ms"] else 0.0
+            print(f"  {size:>10} {name:<22} p50 {old['p50_ms']:9.3f} -> {stats['p50_ms']:9.3f} ms ({delta:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the core EVM paths against a local Postgres stand-in.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="roster sizes to generate, e.g. 1000 10000 1000000 10000000")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=2024)
+    parser.add_argument("--dbname", default="evm_bench")
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--password", default="12345678")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", default="5432")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="previous report to diff p50 latencies against")
+    args = parser.parse_args()
+
+    if args.dbname == "evm_database":
+        parser.error("refusing to overwrite the election database; point --dbname at a scratch database")
+
+    conn = psycopg2.connect(dbname=args.dbname, user=args.user, password=args.password, host=args.host, port=args.port)
+    run_migrations(conn)
+    conn.close()
+
+    db_manager = DatabaseManager(args.dbname, args.user, args.password, args.host, args.port)
+    db_manager.connect()
+    arduino_manager = ArduinoManager("loop://", 9600)
+    arduino_manager.arduino = serial.serial_for_url("loop://", timeout=0.1)
+    engine = EVMEngine(db_manager, arduino_manager)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = {
+        "git_revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "iterations": args.iterations,
+        "seed": args.seed,
+        "results": {},
+    }
+    try:
+        for size in args.sizes:
+            load_roster(db_manager, size, args.seed)
+            report["results"][str(size)] = bench_size(engine, arduino_manager.arduino, size, args.iterations, args.seed)
+            for name, stats in report["results"][str(size)].items():
+                print(f"{size:>10} {name:<22} p50 {stats['p50_ms']:9.3f} ms  p99 {stats['p99_ms']:9.3f} ms  "
+                      f"{stats['throughput_per_s']:10.1f} ops/s")
+    finally:
+        db_manager.disconnect()
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -17,11 +17,12 @@ def delete_parties_table():
         conn = psycopg2.connect(**db_params)
         cursor = conn.cursor()
 
-        cursor.execute("DROP TABLE IF EXISTS parties")
+        # The table itself belongs to migrations.py; clear its rows and restart ids at 1.
+        cursor.execute("TRUNCATE parties RESTART IDENTITY")
         
         conn.commit()
 
-        logging.info("Parties table has been deleted successfully.")
+        logging.info("All parties have been deleted successfully.")
 
     except psycopg2.Error as e:
         logging.error(f"Database error: {e}")
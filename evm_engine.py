@@ -0,0 +1,1382 @@
+import psycopg2
+from psycopg2.extras import execute_batch, execute_values
+import serial
+import collections
+import datetime
+import glob
+import json
+import os
+import logging
+import selectors
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from serial.tools import list_ports
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union
+from audit_log import AuditLog
+from migrations import LATEST_VERSION, current_version
+from serial_protocol import FrameDecoder, SequenceTracker, frame_to_event
+from serial_replay import SerialRecorder
+from tracing import LatencyTracer, Trace
+from query_cache import VoterQueryCache
+from roster_snapshot import open_snapshot
+from voter_store import VoterRows, VoterStore
+from vote_outbox import OUTBOX_CONFLICTS, VoteOutbox
+from metrics import registry, start_metrics_server
+from profiling import checkpoint, slow_ops
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+T = TypeVar('T')
+
+# Children are bound once here so the hot paths only do a thread-local add.
+DB_QUERY_SECONDS = registry.histogram("evm_db_query_seconds", "Database round-trip time including commit").labels()
+DB_ERRORS = registry.counter("evm_db_errors_total", "Database errors by kind", ["kind"])
+DB_CONNECTION_ERRORS = DB_ERRORS.labels("connection")
+DB_QUERY_ERRORS = DB_ERRORS.labels("query")
+DB_RECONNECTS = registry.counter("evm_db_reconnects_total", "Successful database reconnects").labels()
+DB_HEALTHY = registry.gauge("evm_db_healthy", "1 while the database connection is usable").labels()
+DB_DOWNTIME = registry.gauge("evm_db_downtime_seconds", "Accumulated database downtime").labels()
+SERIAL_LINES = registry.counter("evm_serial_lines_total", "Lines read from the ballot unit").labels()
+SERIAL_BACKLOG = registry.gauge("evm_serial_backlog_bytes", "Bytes waiting in the serial input buffer").labels()
+SERIAL_UNITS_CONNECTED = registry.gauge("evm_serial_units_connected", "Ballot units with an open serial port").labels()
+UNIT_EVENTS = registry.counter("evm_unit_events_total", "Events read per ballot unit", ["unit"])
+UNIT_ERRORS = registry.counter("evm_unit_errors_total", "Serial errors per ballot unit by kind", ["unit", "kind"])
+UNIT_BACKLOG = registry.gauge("evm_unit_backlog_bytes", "Bytes received from a ballot unit but not yet handled", ["unit"])
+SERIAL_LINK_UP = registry.gauge("evm_serial_link_up", "1 while the ballot unit's serial port is open", ["unit"])
+SERIAL_LINK_LOSSES = registry.counter("evm_serial_link_losses_total", "Serial links lost, e.g. the board was unplugged", ["unit"])
+SERIAL_RECONNECTS = registry.counter("evm_serial_reconnects_total", "Serial links reopened after a loss", ["unit"])
+SERIAL_RECONNECT_SECONDS = registry.histogram("evm_serial_reconnect_seconds", "Time from losing a serial link to reopening it",
+                                              ["unit"], buckets=(0.5, 1, 2, 5, 10, 30, 60, 120, 300))
+VOTES = registry.counter("evm_votes_total", "Party votes recorded", ["party"])
+VOTE_ERRORS = registry.counter("evm_vote_errors_total", "Party votes that failed to record").labels()
+VOTERS_MARKED = registry.counter("evm_voters_marked_total", "Voters marked as voted").labels()
+
+
+class DatabaseManager:
+    def __init__(self, dbname: str, user: str, password: str, host: str, port: str,
+                 reconnect_attempts: int = 5, backoff_base: float = 0.2, backoff_max: float = 5.0,
+                 connect_timeout: int = 5, statement_timeout_ms: int = 10_000, primary: bool = True):
+        self.conn_params = {
+            "dbname": dbname,
+            "user": user,
+            "password": password,
+            "host": host,
+            "port": port,
+            # An unreachable server otherwise holds connect() for the OS TCP timeout.
+            "connect_timeout": connect_timeout,
+            # A half-open connection (server gone, no RST) is noticed within ~25 s instead of the
+            # kernel's retransmission timeout of many minutes, and no statement runs unbounded.
+            "keepalives": 1,
+            "keepalives_idle": 10,
+            "keepalives_interval": 5,
+            "keepalives_count": 3,
+            "tcp_user_timeout": 15_000,
+            "options": f"-c statement_timeout={statement_timeout_ms}"
+        }
+        self.conn: Optional[psycopg2.extensions.connection] = None
+        self.cursor: Optional[psycopg2.extensions.cursor] = None
+        self._transaction_depth = 0
+        self.channels: List[str] = []
+        self._missed: List[Tuple[str, Optional[str]]] = []
+
+        self.reconnect_attempts = reconnect_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.healthy = False
+        self.reconnect_count = 0
+        self.last_error: Optional[str] = None
+        self._down_since: Optional[float] = None
+        self._downtime = 0.0
+        if primary:
+            # Only the main session reports health; clones for background work would overwrite it.
+            DB_HEALTHY.set_function(lambda: self.healthy)
+            DB_DOWNTIME.set_function(lambda: self.connection_stats()["downtime_seconds"])
+
+    def clone(self, reconnect_attempts: Optional[int] = None) -> "DatabaseManager":
+        # A separate session with the same settings, for work that must not share this one.
+        params = self.conn_params
+        other = DatabaseManager(params["dbname"], params["user"], params["password"], params["host"], params["port"],
+                                reconnect_attempts=self.reconnect_attempts if reconnect_attempts is None else reconnect_attempts,
+                                backoff_base=self.backoff_base, backoff_max=self.backoff_max, primary=False)
+        other.conn_params = dict(params)
+        return other
+
+    def _open(self) -> None:
+        self.conn = psycopg2.connect(**self.conn_params)
+        self.cursor = self.conn.cursor()
+        if self.channels:
+            for channel in self.channels:
+                self.cursor.execute(f"LISTEN {channel}")
+                # Anything sent while the old session was gone is lost, so say so explicitly.
+                self._missed.append((channel, None))
+            self.conn.commit()
+        self.healthy = True
+        if self._down_since is not None:
+            self._downtime += time.monotonic() - self._down_since
+            self._down_since = None
+
+    def connect(self) -> None:
+        try:
+            logging.info(f"Attempting to connect to database: {self.conn_params['dbname']}")
+            self._open()
+            logging.info("Successfully connected to the database.")
+
+            # DDL is owned by migrations.py and applied at deploy time; launch only checks the version row.
+            version = current_version(self.conn)
+            if version is None or version < LATEST_VERSION:
+                raise psycopg2.ProgrammingError(
+                    f"Database schema is at version {version}, expected {LATEST_VERSION}. Run migrations.py first."
+                )
+
+        except psycopg2.Error as e:
+            logging.error(f"PostgreSQL error occurred: {e}")
+            raise
+        except Exception as e:
+            logging.error(f"Unexpected error during database connection: {e}")
+            raise
+
+    def disconnect(self) -> None:
+        if self.conn:
+            self.conn.close()
+            logging.info(f"Database connection closed. Connection stats: {self.connection_stats()}")
+
+    def _mark_down(self, error: Exception) -> None:
+        self.healthy = False
+        self.last_error = str(error)
+        if self._down_since is None:
+            self._down_since = time.monotonic()
+        if self.conn and not self.conn.closed:
+            try:
+                self.conn.close()
+            except psycopg2.Error:
+                pass
+
+    def _backoff(self, attempt: int) -> float:
+        return min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+
+    def _reconnect_once(self, attempt: int = 0) -> None:
+        self._open()
+        self.reconnect_count += 1
+        DB_RECONNECTS.inc()
+        logging.info(f"Reconnected to the database after {attempt + 1} attempt(s).")
+
+    def reconnect(self) -> None:
+        last_error: Optional[Exception] = None
+        for attempt in range(self.reconnect_attempts):
+            if attempt:
+                time.sleep(self._backoff(attempt))
+            try:
+                self._reconnect_once(attempt)
+                return
+            except psycopg2.OperationalError as e:
+                last_error = e
+                self.last_error = str(e)
+                logging.warning(f"Reconnect attempt {attempt + 1} failed: {e}")
+        raise last_error
+
+    def connection_stats(self) -> dict:
+        downtime = self._downtime
+        if self._down_since is not None:
+            downtime += time.monotonic() - self._down_since
+        return {
+            "healthy": self.healthy,
+            "reconnect_count": self.reconnect_count,
+            "downtime_seconds": downtime,
+            "last_error": self.last_error,
+        }
+
+    def _require_connection(self) -> None:
+        if not self.conn or not self.cursor:
+            logging.error("Database connection is not established.")
+            raise psycopg2.Error("Database connection is not established.")
+
+    def _run(self, action: Callable[[psycopg2.extensions.cursor], T], retry: bool = False,
+             query: str = "", params: Any = ()) -> T:
+        self._require_connection()
+        attempt = 0
+        while True:
+            try:
+                if self.conn.closed:
+                    if self._transaction_depth:
+                        raise psycopg2.InterfaceError("Connection lost inside a transaction.")
+                    # One connect per attempt; this loop owns the backoff, so a failed call makes
+                    # at most reconnect_attempts + 1 connects rather than a retry loop per attempt.
+                    if attempt:
+                        time.sleep(self._backoff(attempt))
+                    self._reconnect_once(attempt)
+                started = time.perf_counter()
+                result = action(self.cursor)
+                if self._transaction_depth == 0:
+                    self.conn.commit()
+                elapsed = time.perf_counter() - started
+                DB_QUERY_SECONDS.observe(elapsed)
+                slow_ops.check("db", " ".join(query.split()), elapsed, params)
+                return result
+            except psycopg2.errors.QueryCanceled as e:
+                # statement_timeout; an OperationalError subclass, but the session is fine.
+                logging.error(f"Database query timed out: {e}")
+                DB_QUERY_ERRORS.inc()
+                if self._transaction_depth == 0:
+                    self.conn.rollback()
+                raise
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                logging.error(f"Database connection error: {e}")
+                DB_CONNECTION_ERRORS.inc()
+                self._mark_down(e)
+                # Inside a transaction the earlier statements are gone with the connection,
+                # so only autonomous, safe-to-repeat statements are retried.
+                if not retry or self._transaction_depth or attempt >= self.reconnect_attempts:
+                    raise
+                attempt += 1
+            except psycopg2.Error as e:
+                logging.error(f"Database error: {e}")
+                DB_QUERY_ERRORS.inc()
+                if self._transaction_depth == 0:
+                    self.conn.rollback()
+                raise
+
+    def fetch_one(self, query: str, params: tuple = (), retry: bool = True,
+                  idempotency_key: Optional[str] = None) -> Optional[Tuple]:
+        # With an idempotency key, as for execute(); a key already applied returns None.
+        def action(cursor):
+            if idempotency_key is not None and not self._claim(cursor, idempotency_key):
+                return None
+            cursor.execute(query, params)
+            return cursor.fetchone()
+        return self._run(action, retry, query, params)
+
+    def fetch_all(self, query: str, params: tuple = (), retry: bool = True) -> List[Tuple]:
+        def action(cursor):
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        return self._run(action, retry, query, params)
+
+    def listen(self, channel: str) -> None:
+        if not channel.isidentifier():
+            raise ValueError(f"Invalid notification channel: {channel!r}")
+        if channel not in self.channels:
+            self.channels.append(channel)
+            self.execute(f"LISTEN {channel}", retry=True)
+
+    def notifications(self) -> List[Tuple[str, Optional[str]]]:
+        # Drains NOTIFYs already read off the socket; no query is sent. A None payload means the
+        # session was re-established and notifications on that channel may have been missed.
+        drained, self._missed = self._missed, []
+        if self.conn is None:
+            return drained
+        if self.conn.closed:
+            return drained + [(channel, None) for channel in self.channels]
+        try:
+            if self._transaction_depth == 0:
+                self.conn.poll()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            DB_CONNECTION_ERRORS.inc()
+            self._mark_down(e)
+            return drained + [(channel, None) for channel in self.channels]
+        while self.conn.notifies:
+            notify = self.conn.notifies.pop(0)
+            drained.append((notify.channel, notify.payload))
+        return drained
+
+    def iter_rows(self, query: str, params: tuple = (), batch_size: int = 10_000) -> Iterator[Tuple]:
+        # Server-side cursor, so a whole roll streams through in batches instead of one fetchall.
+        self._require_connection()
+        if self.conn.closed:
+            self.reconnect()
+        with self.transaction():
+            with self.conn.cursor(name=f"iter_rows_{uuid.uuid4().hex}") as cursor:
+                cursor.itersize = batch_size
+                started = time.perf_counter()
+                cursor.execute(query, params)
+                yield from cursor
+                DB_QUERY_SECONDS.observe(time.perf_counter() - started)
+
+    def execute(self, query: str, params: tuple = (), retry: Optional[bool] = None,
+                idempotency_key: Optional[str] = None) -> int:
+        # With an idempotency key the key is recorded in the same transaction as the write,
+        # so replaying it after a dropped commit is a no-op and the call becomes retryable
+        # unless retry=False is passed.
+        def action(cursor):
+            if idempotency_key is not None and not self._claim(cursor, idempotency_key):
+                return 0
+            cursor.execute(query, params)
+            return cursor.rowcount
+        return self._run(action, idempotency_key is not None if retry is None else retry, query, params)
+
+    def _claim(self, cursor: psycopg2.extensions.cursor, idempotency_key: str) -> bool:
+        cursor.execute(
+            "INSERT INTO applied_writes (idempotency_key) VALUES (%s) ON CONFLICT DO NOTHING",
+            (idempotency_key,)
+        )
+        return cursor.rowcount == 1
+
+    def execute_many(self, query: str, params_list: Sequence[tuple], page_size: int = 100,
+                     values: bool = False, template: Optional[str] = None) -> None:
+        # values=True expects a single "VALUES %s" placeholder and sends each page as one
+        # multi-row statement; otherwise the statement is repeated via execute_batch.
+        def action(cursor):
+            if values:
+                execute_values(cursor, query, params_list, template=template, page_size=page_size)
+            else:
+                execute_batch(cursor, query, params_list, page_size=page_size)
+        self._run(action, query=query, params=f"{len(params_list)} row(s)")
+
+    @contextmanager
+    def transaction(self) -> Iterator["DatabaseManager"]:
+        self._require_connection()
+        if self._transaction_depth == 0 and self.conn.closed:
+            self.reconnect()
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            # BaseException, not Exception: a generator closed mid-transaction (GeneratorExit)
+            # must still unwind the depth, or every later statement stays uncommitted.
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0 and not self.conn.closed:
+                self.conn.rollback()
+            raise
+        else:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                try:
+                    self.conn.commit()
+                except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                    self._mark_down(e)
+                    raise
+
+    def execute_query(self, query: str, params: tuple = ()) -> List[Tuple]:
+        def action(cursor):
+            cursor.execute(query, params)
+            return cursor.fetchall() if cursor.description is not None else []
+        return self._run(action, query=query, params=params)
+
+    def commit(self) -> None:
+        if self.conn:
+            self.conn.commit()
+
+class ArduinoManager:
+    # protocol="line" is the original firmware's Serial.println() text; "framed" is
+    # serial_protocol's checksummed, sequenced frames, acknowledged back to the device.
+    def __init__(self, port: str, baudrate: int, recorder: Optional[SerialRecorder] = None,
+                 protocol: str = "line", unit_id: Optional[str] = None):
+        if protocol not in ("line", "framed"):
+            raise ValueError(f"Unknown serial protocol: {protocol!r}")
+        self.port = port
+        self.unit_id = unit_id or port
+        self.baudrate = baudrate
+        self.arduino: Optional[serial.Serial] = None
+        self.recorder = recorder
+        self._recording_failed = False
+        self.protocol = protocol
+        self.last_received_at: Optional[float] = None
+        self.buffer = bytearray()
+        self._buffered_at: Optional[float] = None
+        self.decoder = FrameDecoder()
+        self.sequence = SequenceTracker()
+        self.pending: Deque[Tuple[str, int, int, float]] = collections.deque()
+        self._in_hand: Optional[Tuple[int, int]] = None
+        self.link_lost_at: Optional[float] = None
+        self.on_link_lost: Optional[Callable[["ArduinoManager"], None]] = None
+        self.supervisor: Optional[LinkSupervisor] = None
+        SERIAL_BACKLOG.set_function(self.backlog)
+        SERIAL_LINK_UP.labels(self.unit_id).set_function(lambda: self.arduino is not None)
+
+    def _open(self) -> None:
+        self.arduino = serial.Serial(port=self.port, baudrate=self.baudrate, timeout=0.1)
+        logging.info(f"Successfully connected to Arduino {self.unit_id} at {self.baudrate} baud ({self.protocol} protocol).")
+
+    def connect(self) -> None:
+        try:
+            self._open()
+        except serial.SerialException as e:
+            logging.error(f"Error connecting to Arduino: {e}")
+            if self.link_lost_at is None:
+                self.link_lost_at = time.monotonic()
+            raise
+
+    def reconnect(self) -> None:
+        self._open()
+        self.sequence.link_restored()
+        SERIAL_RECONNECTS.labels(self.unit_id).inc()
+        if self.link_lost_at is not None:
+            SERIAL_RECONNECT_SECONDS.labels(self.unit_id).observe(time.monotonic() - self.link_lost_at)
+            self.link_lost_at = None
+
+    def supervise(self) -> None:
+        if self.supervisor is None:
+            self.supervisor = LinkSupervisor([self])
+        self.supervisor.start()
+
+    def _close_port(self) -> None:
+        if self.arduino:
+            try:
+                self.arduino.close()
+            except (serial.SerialException, OSError) as e:
+                logging.warning(f"Error closing serial port {self.port}: {e}")
+            self.arduino = None
+
+    def _link_lost(self, error: Exception) -> None:
+        logging.error(f"Lost the serial link to {self.unit_id} on {self.port}: {error}")
+        SERIAL_LINK_LOSSES.labels(self.unit_id).inc()
+        if self.on_link_lost:
+            self.on_link_lost(self)
+        self.link_lost_at = time.monotonic()
+        # Complete lines and decoded frames stay queued and are still handed out; only a partial
+        # line or frame, whose rest went with the link, is dropped.
+        del self.buffer[self.buffer.rfind(b"\n") + 1:]
+        self.decoder.buffer.clear()
+        self._close_port()
+
+    def disconnect(self) -> None:
+        if self.supervisor:
+            self.supervisor.stop()
+        self._close_port()
+
+    def fileno(self) -> int:
+        return self.arduino.fileno()
+
+    def backlog(self) -> int:
+        waiting = 0
+        if self.arduino:
+            try:
+                waiting = self.arduino.in_waiting
+            except (serial.SerialException, OSError):
+                pass
+        return waiting + len(self.buffer) + len(self.decoder.buffer)
+
+    @property
+    def ack_pending(self) -> bool:
+        return self._in_hand is not None or self.sequence.unacked > 0 or self.sequence.ack_due
+
+    def wait(self, timeout: float) -> None:
+        time.sleep(timeout)
+
+    def read_data(self) -> str:
+        if self.protocol == "framed":
+            return self._read_frame()
+        return self._read_line()
+
+    def _receive(self) -> bytes:
+        # Only port access counts as losing the link: pyserial raises on the next access after an
+        # unplug. What was already buffered is still handed out; the supervisor reopens the port.
+        try:
+            if self.arduino and self.arduino.in_waiting:
+                return self.arduino.read(self.arduino.in_waiting)
+        except (serial.SerialException, OSError) as e:
+            self._link_lost(e)
+        return b""
+
+    def _send(self, data: bytes) -> None:
+        try:
+            self.arduino.write(data)
+        except (serial.SerialException, OSError) as e:
+            self._link_lost(e)
+
+    def _record(self, raw: bytes) -> None:
+        # A recording is a diagnostic: a full disk must cost neither the vote nor the link.
+        try:
+            self.recorder.record(raw)
+        except (OSError, ValueError) as e:
+            if not self._recording_failed:
+                logging.error(f"Could not record serial data from {self.unit_id}, skipping it: {e}")
+            self._recording_failed = True
+        else:
+            self._recording_failed = False
+
+    def _read_line(self) -> str:
+        # Buffered rather than readline() so a half-received line never blocks the reader.
+        if b"\n" not in self.buffer:
+            chunk = self._receive()
+            if chunk:
+                self.buffer += chunk
+                self._buffered_at = time.perf_counter()
+        end = self.buffer.find(b"\n") + 1
+        if not end:
+            return ""
+        raw = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        self.last_received_at = self._buffered_at
+        SERIAL_LINES.inc()
+        if self.recorder:
+            self._record(raw)
+        return raw.decode('utf-8', errors='replace').strip()
+
+    def _read_frame(self) -> str:
+        # The engine handles each event before reading the next, so by the time we are called
+        # again the previous one is done and may be acknowledged.
+        if self._in_hand is not None:
+            self.sequence.complete(*self._in_hand)
+            self._in_hand = None
+        if not self.pending:
+            chunk = self._receive()
+            received_at = time.perf_counter()
+            for frame in self.decoder.feed(chunk) if chunk else ():
+                if self.sequence.accept(frame):
+                    event = frame_to_event(frame)
+                    if event is None:
+                        logging.warning(f"Ignoring unknown serial frame {frame!r}")
+                        self.sequence.complete(frame.seq)
+                    else:
+                        self.pending.append((event, frame.seq, self.sequence.generation, received_at))
+        if self.arduino:
+            ack = self.sequence.pending_ack()
+            if ack:
+                # A lost ACK is repeated by link_restored() once the port is reopened.
+                self._send(ack)
+        if not self.pending:
+            return ""
+        event, seq, generation, self.last_received_at = self.pending.popleft()
+        self._in_hand = (seq, generation)
+        SERIAL_LINES.inc()
+        if self.recorder:
+            # Recorded as the equivalent text line so recordings replay the same either way.
+            self._record(f"{event}\r\n".encode("ascii"))
+        return event
+
+class LinkSupervisor:
+    # Reopens serial links that were lost (or never came up) on its own thread, so neither the
+    # reader nor the Tk loop waits on a port that can take seconds to fail. Each unit backs off
+    # exponentially between attempts, like DatabaseManager.reconnect.
+    def __init__(self, units: Sequence[ArduinoManager],
+                 on_reconnect: Optional[Callable[[ArduinoManager], None]] = None,
+                 backoff_base: float = 0.5, backoff_max: float = 10.0, check_interval: float = 0.25):
+        self.units = list(units)
+        self.on_reconnect = on_reconnect
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.check_interval = check_interval
+        self._attempts: Dict[str, int] = {}
+        self._next_attempt_at: Dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="evm-serial-supervisor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            for unit in self.units:
+                if unit.arduino is None:
+                    self._try_reconnect(unit)
+            self._stop.wait(self.check_interval)
+
+    def _try_reconnect(self, unit: ArduinoManager) -> None:
+        now = time.monotonic()
+        if now < self._next_attempt_at.get(unit.unit_id, 0.0):
+            return
+        attempt = self._attempts.get(unit.unit_id, 0) + 1
+        try:
+            unit.reconnect()
+        except serial.SerialException as e:
+            if attempt == 1 or self.backoff_base * (2 ** (attempt - 1)) < self.backoff_max:
+                logging.warning(f"Reconnect attempt {attempt} for ballot unit {unit.unit_id} failed: {e}")
+            self._attempts[unit.unit_id] = attempt
+            self._next_attempt_at[unit.unit_id] = now + min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+            return
+        logging.info(f"Ballot unit {unit.unit_id} is back after {attempt} attempt(s).")
+        self._attempts.pop(unit.unit_id, None)
+        self._next_attempt_at.pop(unit.unit_id, None)
+        if self.on_reconnect:
+            self.on_reconnect(unit)
+
+def discover_ports(spec: str) -> List[Tuple[str, str]]:
+    # Comma-separated entries, each "unit=port" or a bare port whose file name becomes the unit
+    # id. A port may be a glob such as /dev/ttyACM* or "auto" for every USB serial adapter.
+    units: List[Tuple[str, str]] = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        unit_id, _, port = entry.rpartition("=")
+        if port == "auto":
+            devices = sorted(info.device for info in list_ports.comports() if info.vid is not None)
+        elif any(c in port for c in "*?["):
+            devices = sorted(glob.glob(port))
+        else:
+            devices = [port]
+        for index, device in enumerate(devices, 1):
+            if unit_id:
+                units.append((unit_id if len(devices) == 1 else f"{unit_id}{index}", device))
+            else:
+                units.append((os.path.basename(device), device))
+    unit_ids = [unit_id for unit_id, _ in units]
+    duplicates = sorted({unit_id for unit_id in unit_ids if unit_ids.count(unit_id) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate ballot unit ids: {', '.join(duplicates)}")
+    return units
+
+class DeviceManager:
+    # Many ballot units behind one reader thread. Every open port is registered with a selector
+    # and ready units are drained round-robin, one event per turn, so a chatty unit cannot
+    # starve the rest. It reads like a single ArduinoManager to the engine: read_data() returns
+    # the next event and unit_id says whose it was.
+    def __init__(self, ports: Sequence[Tuple[str, str]], baudrate: int,
+                 recorder: Optional[SerialRecorder] = None, protocol: str = "line"):
+        self.units: Dict[str, ArduinoManager] = {
+            unit_id: ArduinoManager(port, baudrate, recorder, protocol, unit_id) for unit_id, port in ports
+        }
+        self.selector = selectors.DefaultSelector()
+        # Windows serial handles cannot be selected; such units are checked with in_waiting.
+        self.polled: List[ArduinoManager] = []
+        self.ready: "collections.OrderedDict[str, ArduinoManager]" = collections.OrderedDict()
+        self.unit_id: Optional[str] = None
+        self.last_received_at: Optional[float] = None
+        self._crc_errors_seen: Dict[str, int] = {}
+        # Filled by the supervisor thread, registered by the reader thread that owns the selector.
+        self.reconnected: Deque[ArduinoManager] = collections.deque()
+        self.supervisor = LinkSupervisor(list(self.units.values()), on_reconnect=self.reconnected.append)
+        SERIAL_BACKLOG.set_function(lambda: sum(unit.backlog() for unit in self.units.values()))
+        SERIAL_UNITS_CONNECTED.set_function(lambda: sum(1 for unit in self.units.values() if unit.arduino))
+        for unit_id, unit in self.units.items():
+            unit.on_link_lost = self._unregister
+            UNIT_BACKLOG.labels(unit_id).set_function(unit.backlog)
+
+    def connect(self) -> None:
+        for unit in self.units.values():
+            try:
+                unit.connect()
+            except serial.SerialException:
+                UNIT_ERRORS.labels(unit.unit_id, "open").inc()
+                continue
+            self._register(unit)
+        connected = sum(1 for unit in self.units.values() if unit.arduino)
+        if not connected:
+            raise serial.SerialException(f"None of the {len(self.units)} ballot unit(s) could be opened")
+        logging.info(f"Reading {connected} of {len(self.units)} ballot unit(s)")
+
+    def _register(self, unit: ArduinoManager) -> None:
+        try:
+            self.selector.register(unit.fileno(), selectors.EVENT_READ, unit)
+        except (AttributeError, OSError, ValueError):
+            self.polled.append(unit)
+        # Anything that arrived while the port was being opened is picked up on the first read.
+        self.ready[unit.unit_id] = unit
+
+    def _unregister(self, unit: ArduinoManager) -> None:
+        # Called by the unit as its link drops, before the port is closed. It stays in `ready`
+        # so whatever it had already buffered is still read out.
+        UNIT_ERRORS.labels(unit.unit_id, "io").inc()
+        if unit in self.polled:
+            self.polled.remove(unit)
+        else:
+            try:
+                self.selector.unregister(unit.fileno())
+            except (AttributeError, KeyError, OSError, ValueError):
+                pass
+
+    def supervise(self) -> None:
+        self.supervisor.start()
+
+    def _poll(self, timeout: float) -> None:
+        while self.reconnected:
+            unit = self.reconnected.popleft()
+            if unit.arduino:
+                self._register(unit)
+        if self.selector.get_map():
+            for key, _ in self.selector.select(0 if self.polled else timeout):
+                self.ready[key.data.unit_id] = key.data
+        elif timeout:
+            time.sleep(timeout)
+        for unit in list(self.polled):
+            try:
+                waiting = unit.arduino.in_waiting
+            except (serial.SerialException, OSError):
+                # Read it anyway; the unit notices the lost link and unregisters itself.
+                waiting = True
+            if waiting:
+                self.ready[unit.unit_id] = unit
+        for unit_id, unit in self.units.items():
+            # Quiet framed units still owe the device its batched ACK.
+            if unit.arduino and unit.protocol == "framed" and unit.ack_pending:
+                self.ready.setdefault(unit_id, unit)
+
+    def _count_errors(self, unit: ArduinoManager) -> None:
+        crc_errors = unit.decoder.crc_errors
+        new = crc_errors - self._crc_errors_seen.get(unit.unit_id, 0)
+        if new > 0:
+            UNIT_ERRORS.labels(unit.unit_id, "crc").inc(new)
+        self._crc_errors_seen[unit.unit_id] = crc_errors
+
+    def read_data(self) -> str:
+        if not self.ready:
+            self._poll(0)
+        while self.ready:
+            unit_id, unit = self.ready.popitem(last=False)
+            event = unit.read_data()
+            self._count_errors(unit)
+            if event:
+                # Back of the queue: it may have more, but everyone else goes first.
+                self.ready[unit_id] = unit
+                self.unit_id = unit_id
+                self.last_received_at = unit.last_received_at
+                UNIT_EVENTS.labels(unit_id).inc()
+                return event
+        return ""
+
+    def wait(self, timeout: float) -> None:
+        if not self.ready:
+            self._poll(timeout)
+
+    def disconnect(self) -> None:
+        self.supervisor.stop()
+        for unit in self.units.values():
+            unit.disconnect()
+        self.selector.close()
+
+def serial_from_env(recorder: Optional[SerialRecorder] = None):
+    # EVM_SERIAL_PORTS (see discover_ports) attaches several ballot units; otherwise the single
+    # EVM_SERIAL_PORT of a polling-booth terminal.
+    baudrate = int(os.environ.get('EVM_SERIAL_BAUD', '9600'))
+    protocol = os.environ.get('EVM_SERIAL_PROTOCOL', 'line')
+    ports = os.environ.get('EVM_SERIAL_PORTS')
+    if ports:
+        return DeviceManager(discover_ports(ports), baudrate, recorder, protocol)
+    return ArduinoManager(os.environ.get('EVM_SERIAL_PORT', 'COM4'), baudrate, recorder, protocol)
+
+class Voter:
+    __slots__ = ("id", "name", "image_url", "has_voted")
+
+    def __init__(self, id: str, name: str, image_url: str, has_voted: bool):
+        self.id = id
+        self.name = name
+        self.image_url = image_url
+        self.has_voted = has_voted
+
+
+class EngineEvent:
+    def __init__(self, kind: str, party_id: Optional[int] = None, voter_id: Optional[str] = None,
+                 tally: Optional[Dict[int, int]] = None, trace: Optional[Trace] = None,
+                 has_voted: Optional[bool] = None, voted_by: Optional[str] = None,
+                 unit_id: Optional[str] = None, outbox_depth: Optional[int] = None):
+        self.kind = kind
+        self.party_id = party_id
+        self.voter_id = voter_id
+        self.tally = tally
+        self.trace = trace
+        self.has_voted = has_voted
+        self.voted_by = voted_by
+        self.unit_id = unit_id
+        self.outbox_depth = outbox_depth
+
+class MarkResult:
+    def __init__(self, won: bool, voted_by: Optional[str] = None, voted_at: Any = None):
+        self.won = won
+        self.voted_by = voted_by
+        self.voted_at = voted_at
+
+class EVMEngine:
+    # Owns serial ingestion, the DB writes and the tally so they run without Tk. Subscribers are
+    # called on whichever thread produced the event; GUIs should hand events to their own loop.
+    def __init__(self, db_manager: DatabaseManager, arduino_manager: Union[ArduinoManager, DeviceManager],
+                 tracer: Optional[LatencyTracer] = None, party_ids: Sequence[int] = (1, 2, 3),
+                 terminal_id: Optional[str] = None, outbox: Optional[VoteOutbox] = None,
+                 audit: Optional[AuditLog] = None):
+        self.db_manager = db_manager
+        self.terminal_id = terminal_id or os.environ.get('EVM_TERMINAL_ID') or socket.gethostname()
+        self.arduino_manager = arduino_manager
+        self.tracer = tracer or LatencyTracer()
+        self.party_ids = list(party_ids)
+        self.tally: Dict[int, int] = {party_id: 0 for party_id in self.party_ids}
+        self.store: Optional[VoterStore] = None
+        self.cache = VoterQueryCache()
+        self._listening = False
+        self.lock = threading.RLock()
+        self.subscribers: List[Callable[[EngineEvent], None]] = []
+        self._stop = threading.Event()
+        self._reader: Optional[threading.Thread] = None
+        self._next_notify_at = 0.0
+        # With an outbox, writes that cannot reach the database are buffered locally instead of
+        # failing; `online` is cleared on the first connection error and set again by the
+        # replay thread once the outbox has drained.
+        self.outbox = outbox
+        self.online = True
+        self._replayer: Optional[threading.Thread] = None
+        # Records are appended under the lock, so the log's order is the order writes committed.
+        self.audit = audit
+
+    def _audit(self, kind: str, **data: Any) -> None:
+        if self.audit is not None:
+            self.audit.append(kind, data)
+
+    def subscribe(self, callback: Callable[[EngineEvent], None]) -> None:
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[EngineEvent], None]) -> None:
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def _publish(self, event: EngineEvent) -> None:
+        for callback in list(self.subscribers):
+            try:
+                callback(event)
+            except Exception as e:
+                logging.error(f"Engine subscriber failed on {event.kind}: {e}")
+
+    def load_roster(self) -> VoterStore:
+        bitmap_path = os.environ.get('EVM_VOTED_BITMAP', 'voted.bitmap')
+        snapshot_path = os.environ.get('EVM_ROSTER_SNAPSHOT', 'roster.snapshot')
+        with self.lock:
+            if self.store is not None:
+                self.store.close()
+                self.store = None
+            if os.path.exists(snapshot_path):
+                try:
+                    self.store = open_snapshot(snapshot_path, bitmap_path)
+                    self.sync_roster()
+                    return self.store
+                except ValueError as e:
+                    logging.error(f"Ignoring roster snapshot: {e}")
+            self.store = VoterStore.from_database(self.db_manager, bitmap_path)
+            return self.store
+
+    def sync_roster(self) -> int:
+        # Pulls only voters rows changed since the store's watermark. A delete or rename cannot
+        # be patched into the store, so either one triggers a full reload from the database.
+        with self.lock:
+            rows = self.db_manager.iter_rows(
+                "SELECT id, name, has_voted, row_version FROM voters WHERE row_version > %s ORDER BY row_version",
+                (self.store.watermark,)
+            )
+            before = self.store.watermark
+            count = [0]
+
+            def counted():
+                for row in rows:
+                    count[0] += 1
+                    yield row
+            applied = self.store.apply_delta(counted())
+            # Drained rather than closed, so iter_rows ends its transaction normally; a rename
+            # leads to a full reload anyway, which reads at least as many rows again.
+            collections.deque(rows, maxlen=0)
+            total = self.db_manager.fetch_one("SELECT count(*) FROM voters")[0]
+            if not applied or total != len(self.store):
+                logging.warning("Voter store no longer matches the voters table; reloading it in full")
+                bitmap_path = self.store.voted.path
+                self.store.close()
+                self.store = VoterStore.from_database(self.db_manager, bitmap_path)
+            elif count[0]:
+                logging.info(f"Applied {count[0]} voter change(s) to the voter store")
+            return count[0]
+
+    def has_voted(self, voter_id: str) -> Optional[bool]:
+        # None when the voter is not in the in-memory store and only the database can tell.
+        with self.lock:
+            ordinal = self.store.ordinal(voter_id) if self.store is not None else None
+            return self.store.has_voted(ordinal) if ordinal is not None else None
+
+    def turnout(self) -> Tuple[int, int]:
+        with self.lock:
+            if self.store is not None:
+                return self.store.voted_count(), len(self.store)
+            return self.db_manager.fetch_one("SELECT count(*) FILTER (WHERE has_voted), count(*) FROM voters")
+
+    def apply_notifications(self) -> None:
+        # Cached results are only trusted while LISTEN is active, so it starts before the first lookup.
+        with self.lock:
+            if not self.online:
+                # Reconnecting here would stall the caller; the session comes back after replay
+                # and its reconnect reports the missed notifications then.
+                return
+            if self.outbox is not None and self.db_manager.conn is not None and self.db_manager.conn.closed:
+                self._go_offline(psycopg2.OperationalError("database connection lost"))
+                return
+            if not self._listening:
+                self.db_manager.listen("voters_changed")
+                self._listening = True
+            changes = []
+            bulk = False
+            for channel, payload in self.db_manager.notifications():
+                if channel != "voters_changed":
+                    continue
+                if payload in (None, "*"):
+                    bulk = True
+                    continue
+                change = json.loads(payload)
+                self.cache.invalidate(change["id"])
+                changes.append(change)
+            if bulk:
+                self.cache.invalidate()
+                if self.store is not None:
+                    self.sync_roster()
+                self._publish(EngineEvent("roster_changed"))
+                return
+            for change in changes:
+                self._apply_voter_change(change)
+
+    def _apply_voter_change(self, change: dict) -> None:
+        # One voters row changed on some terminal; patch it in rather than reloading the roll.
+        if self.store is not None:
+            row = (change["id"], change["name"], change["has_voted"], change["row_version"])
+            if change["op"] == "DELETE" or not self.store.apply_delta([row]):
+                self.sync_roster()
+                self._publish(EngineEvent("roster_changed"))
+                return
+        # This terminal's own marks were already published by mark_voted.
+        if change["has_voted"] and change["voted_by"] == self.terminal_id:
+            return
+        self._publish(EngineEvent("voter_marked" if change["has_voted"] else "voter_changed",
+                                  voter_id=change["id"], has_voted=change["has_voted"],
+                                  voted_by=change["voted_by"]))
+
+    def search_voters(self, query: str, within: Optional[Sequence[Tuple]] = None,
+                      should_stop: Optional[Callable[[], bool]] = None) -> Sequence[Tuple]:
+        # With the voter store the result is a VoterRows view; rows are built as they are read.
+        # A store scan raises SearchCancelled once `should_stop` returns True.
+        if isinstance(within, VoterRows):
+            return within.filter(query, should_stop)
+        if within is not None:
+            # Refines an earlier result set the query extends, using the same matching as ILIKE.
+            folded = query.lower()
+            return [row for row in within if folded in row[1].lower() or folded in row[0].lower()]
+        while True:
+            with self.lock:
+                self.apply_notifications()
+                rows = self.cache.get_search(query)
+                if rows is not None:
+                    return rows
+                store = self.store
+                if store is None:
+                    rows = self.db_manager.fetch_all(
+                        "SELECT id, name, image_url, has_voted FROM voters WHERE name ILIKE %s OR id ILIKE %s",
+                        ('%' + query + '%', '%' + query + '%')
+                    )
+                    self.cache.put_search(query, rows)
+                    return rows
+                seen = self.cache.invalidations
+            # The scan of the whole roll runs off the lock, so the serial reader and the voter list
+            # never wait on it. A store closed by a reload meanwhile is searched again afresh.
+            try:
+                rows = VoterRows(store, store.search(query, should_stop=should_stop))
+            except ValueError:
+                if self.store is store:
+                    raise
+                continue
+            with self.lock:
+                # As in prefetch_voters: a change applied meanwhile may not be in these results.
+                if self.store is store and self.cache.invalidations == seen:
+                    self.cache.put_search(query, rows)
+            return rows
+
+    def get_voter(self, voter_id: str) -> Optional[Voter]:
+        with self.lock:
+            self.apply_notifications()
+            voter_data = self.cache.get_voter(voter_id)
+            if voter_data is None and not self.online and self.store is not None:
+                # Offline the roster still has everything but the photo URL.
+                ordinal = self.store.ordinal(voter_id)
+                return Voter(*self.store.row(ordinal)) if ordinal is not None else None
+            if voter_data is None:
+                voter_data = self.db_manager.fetch_one(
+                    "SELECT id, name, image_url, has_voted FROM voters WHERE id = %s",
+                    (voter_id,)
+                )
+                if voter_data:
+                    self.cache.put_voter(voter_id, voter_data)
+        return Voter(*voter_data) if voter_data else None
+
+    def prefetch_voters(self, after: Optional[str] = None, limit: int = 25,
+                        db: Optional[DatabaseManager] = None) -> List[Voter]:
+        # Fills the voter cache for voters still to vote, a page at a time in id order. With `db`
+        # (a background caller's own session) the lock is not held across the round trip.
+        query = "SELECT id, name, image_url, has_voted FROM voters WHERE NOT has_voted AND id > %s ORDER BY id LIMIT %s"
+        params = (after or "", limit)
+        with self.lock:
+            if not self.online:
+                return []
+            self.apply_notifications()
+            seen = self.cache.invalidations
+            if db is None:
+                rows = self.db_manager.fetch_all(query, params)
+        if db is not None:
+            rows = db.fetch_all(query, params)
+        with self.lock:
+            self.apply_notifications()
+            # A change applied since the query may be newer than these rows; skip caching them.
+            if self.cache.invalidations == seen:
+                for row in rows:
+                    self.cache.put_voter(row[0], row)
+        return [Voter(*row) for row in rows]
+
+    def prefault_roster(self) -> None:
+        with self.lock:
+            store = self.store
+        if store is not None:
+            try:
+                store.prefault()
+            except ValueError:
+                # Closed by a reload meanwhile; the new store is not worth warming twice.
+                pass
+
+    def voter_window(self, rows: Sequence[Tuple], start: int, stop: int) -> Optional[List[Tuple]]:
+        # Builds only the rows on screen. None when `rows` views a store that has since been
+        # replaced (and closed) by a full reload.
+        with self.lock:
+            if isinstance(rows, VoterRows) and rows.store is not self.store:
+                return None
+            return list(rows[start:stop])
+
+    def list_voters(self) -> Sequence[Tuple]:
+        with self.lock:
+            if self.store is not None:
+                return VoterRows(self.store)
+            return self.db_manager.fetch_all("SELECT id, name, image_url, has_voted FROM voters")
+
+    def load_tally(self) -> Dict[int, int]:
+        with self.lock:
+            if not self.online:
+                # The local tally already counts every vote queued since the link dropped.
+                return dict(self.tally)
+            rows = self.db_manager.fetch_all(
+                "SELECT id, votes FROM parties WHERE id = ANY(%s)",
+                (self.party_ids,)
+            )
+            self.tally.update(dict(rows))
+            if self.outbox is not None:
+                # Votes still in the outbox were accepted here but are not in the table yet.
+                for party_id, count in self.outbox.pending_votes().items():
+                    self.tally[party_id] = self.tally.get(party_id, 0) + count
+            return dict(self.tally)
+
+    def results(self) -> List[Tuple]:
+        with self.lock:
+            return self.db_manager.fetch_all("SELECT id, name, votes FROM parties ORDER BY votes DESC")
+
+    def cast_vote(self, party_id: int, trace: Optional[Trace] = None, unit_id: Optional[str] = None) -> bool:
+        trace = trace or self.tracer.start("vote")
+        key = f"vote:{uuid.uuid4()}"
+        try:
+            with self.lock:
+                queued = self._buffering()
+                if not queued:
+                    try:
+                        # RETURNING hands back the committed count, other desks' votes included.
+                        row = self.db_manager.fetch_one(
+                            "UPDATE parties SET votes = votes + 1 WHERE id = %s RETURNING votes",
+                            (party_id,),
+                            idempotency_key=key,
+                            # With an outbox the vote is queued rather than held up by reconnects.
+                            retry=self.outbox is None
+                        )
+                    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                        if self.outbox is None:
+                            raise
+                        # The commit may still have landed; the key makes the replay a no-op then.
+                        self._go_offline(e)
+                        queued = True
+                if queued:
+                    self.outbox.append("vote", key, {"party_id": party_id})
+                    self.tally[party_id] = self.tally.get(party_id, 0) + 1
+                    depth = len(self.outbox)
+                # A replayed key (or an unknown party) returns no row, so re-read the table then.
+                elif row is not None:
+                    self.tally[party_id] = row[0]
+                else:
+                    self.load_tally()
+                self._audit("vote", party_id=party_id, unit_id=unit_id, key=key, queued=queued)
+                tally = dict(self.tally)
+            trace.mark("outbox" if queued else "db_commit")
+            VOTES.labels(party_id).inc()
+            logging.info(f"{'Queued' if queued else 'Incremented'} vote for Party {party_id}"
+                         + (f" from unit {unit_id}" if unit_id else ""))
+        except (psycopg2.Error, sqlite3.Error) as e:
+            VOTE_ERRORS.inc()
+            logging.error(f"Error incrementing party vote: {e}")
+            return False
+        self._publish(EngineEvent("vote", party_id=party_id, tally=tally, trace=trace, unit_id=unit_id))
+        if queued:
+            self._publish(EngineEvent("outbox", outbox_depth=depth))
+        trace.mark("publish")
+        self.tracer.finish(trace)
+        return True
+
+    def mark_voted(self, voter_id: str, trace: Optional[Trace] = None) -> MarkResult:
+        # The conditional UPDATE is the arbiter between desks: exactly one gets a row back.
+        # Offline the mark is queued and wins locally; replay reports it if another desk won.
+        trace = trace or self.tracer.start("mark")
+        with self.lock:
+            ordinal = self.store.ordinal(voter_id) if self.store is not None else None
+            if ordinal is not None and self.store.has_voted(ordinal):
+                # Rejected without a round trip; who marked the voter is not known locally.
+                self._audit("mark_rejected", voter_id=voter_id, voted_by=None)
+                return MarkResult(False)
+            queued = self._buffering()
+            retried = False
+            if not queued:
+                try:
+                    reconnects = self.db_manager.reconnect_count
+                    won = self.db_manager.fetch_one(
+                        """
+                        UPDATE voters SET has_voted = TRUE, voted_by = %s, voted_at = now()
+                        WHERE id = %s AND has_voted = FALSE
+                        RETURNING voted_by, voted_at
+                        """,
+                        (self.terminal_id, voter_id),
+                        retry=self.outbox is None
+                    )
+                    retried = self.db_manager.reconnect_count != reconnects
+                except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                    if self.outbox is None:
+                        raise
+                    self._go_offline(e)
+                    queued = True
+            if queued:
+                voted_at = datetime.datetime.now(datetime.timezone.utc)
+                payload = {"voter_id": voter_id, "voted_by": self.terminal_id, "voted_at": voted_at.isoformat()}
+                if self.outbox.append("mark", f"mark:{voter_id}", payload) is None:
+                    self._audit("mark_rejected", voter_id=voter_id, voted_by=self.terminal_id)
+                    return MarkResult(False, self.terminal_id)
+                won = (self.terminal_id, voted_at)
+                depth = len(self.outbox)
+            elif won is None:
+                winner = self.db_manager.fetch_one("SELECT voted_by, voted_at FROM voters WHERE id = %s", (voter_id,))
+                # A retried UPDATE whose first commit landed, but whose reply was lost, finds the
+                # voter marked by this very terminal; as in replay_outbox, that mark is ours.
+                if retried and winner is not None and winner[0] == self.terminal_id:
+                    won = winner
+            if won is None:
+                self._audit("mark_rejected", voter_id=voter_id, voted_by=winner[0] if winner else None)
+            else:
+                self._audit("mark", voter_id=voter_id, voted_by=self.terminal_id, queued=queued)
+            if ordinal is not None:
+                self.store.set_voted(ordinal)
+            self.cache.invalidate(voter_id)
+        trace.mark("outbox" if queued else "db_commit")
+        if won is None:
+            voted_by, voted_at = winner or (None, None)
+            logging.warning(f"Voter {voter_id} was already marked as voted by {voted_by or 'an unknown terminal'}")
+            return MarkResult(False, voted_by, voted_at)
+        VOTERS_MARKED.inc()
+        self._publish(EngineEvent("voter_marked", voter_id=voter_id, trace=trace, has_voted=True, voted_by=self.terminal_id))
+        if queued:
+            self._publish(EngineEvent("outbox", outbox_depth=depth))
+        trace.mark("publish")
+        self.tracer.finish(trace)
+        return MarkResult(True, *won)
+
+    def _buffering(self) -> bool:
+        # Once anything is queued, later writes queue behind it so the replay keeps their order.
+        return self.outbox is not None and (not self.online or len(self.outbox) > 0)
+
+    def _go_offline(self, error: Exception) -> None:
+        if self.online:
+            logging.warning(f"Database unreachable ({error}); buffering votes and marks in {self.outbox.path}")
+            self.online = False
+        self._start_replayer()
+
+    def _start_replayer(self) -> None:
+        # Called with the lock held; the replayer clears _replayer under it before exiting.
+        if self._replayer is None:
+            self._replayer = threading.Thread(target=self._replay_forever, name="evm-outbox", daemon=True)
+            self._replayer.start()
+
+    def replay_outbox(self, db: DatabaseManager, batch_size: int = 200) -> int:
+        # Replays the oldest batch in one transaction on `db` and drops it from the outbox once
+        # committed. Votes take their keys into applied_writes, so a batch whose commit was lost
+        # on the way back is replayed without counting anything twice. The engine lock is only
+        # taken to drop the batch: writes made meanwhile queue behind it anyway, so neither the
+        # serial reader nor the GUI waits on a slow database here.
+        conflicts = []
+        entries = self.outbox.peek(batch_size)
+        if not entries:
+            return 0
+        votes = {entry.idempotency_key: entry.payload["party_id"] for entry in entries if entry.kind == "vote"}
+        with db.transaction():
+            if votes:
+                fresh = db.fetch_all(
+                    """
+                    INSERT INTO applied_writes (idempotency_key) SELECT unnest(%s::text[])
+                    ON CONFLICT DO NOTHING RETURNING idempotency_key
+                    """,
+                    (list(votes),)
+                )
+                counts = collections.Counter(votes[key] for (key,) in fresh)
+                if counts:
+                    db.execute(
+                        """
+                        UPDATE parties SET votes = votes + delta.n
+                        FROM unnest(%s::int[], %s::int[]) AS delta(id, n) WHERE parties.id = delta.id
+                        """,
+                        (list(counts), list(counts.values()))
+                    )
+            for entry in entries:
+                if entry.kind != "mark":
+                    continue
+                mark = entry.payload
+                won = db.fetch_one(
+                    """
+                    UPDATE voters SET has_voted = TRUE, voted_by = %s, voted_at = %s
+                    WHERE id = %s AND has_voted = FALSE
+                    RETURNING voted_by
+                    """,
+                    (mark["voted_by"], mark["voted_at"], mark["voter_id"])
+                )
+                if won is None:
+                    winner = db.fetch_one("SELECT voted_by FROM voters WHERE id = %s", (mark["voter_id"],))
+                    # Our own voted_by means the mark committed before the link dropped.
+                    if winner is not None and winner[0] != mark["voted_by"]:
+                        conflicts.append((mark["voter_id"], winner[0]))
+        with self.lock:
+            self.outbox.remove_through(entries[-1].seq)
+            for voter_id, voted_by in conflicts:
+                self._audit("mark_conflict", voter_id=voter_id, voted_by=voted_by)
+        for voter_id, voted_by in conflicts:
+            OUTBOX_CONFLICTS.inc()
+            logging.warning(f"Voter {voter_id} marked here while offline had already been marked by {voted_by}")
+            self._publish(EngineEvent("voter_marked", voter_id=voter_id, has_voted=True, voted_by=voted_by))
+        return len(entries)
+
+    def _replay_forever(self, backoff_base: float = 1.0, backoff_max: float = 10.0) -> None:
+        # Its own connection, so replay never waits on (or breaks) the main session.
+        db = self.db_manager.clone(reconnect_attempts=1)
+        delay = backoff_base
+        replayed = 0
+        try:
+            while not self._stop.wait(delay):
+                try:
+                    if db.conn is None or db.conn.closed:
+                        db.connect()
+                        delay = backoff_base
+                    while True:
+                        count = self.replay_outbox(db)
+                        if not count:
+                            break
+                        replayed += count
+                        self._publish(EngineEvent("outbox", outbox_depth=len(self.outbox)))
+                    with self.lock:
+                        if len(self.outbox):
+                            continue
+                        self.online = True
+                        try:
+                            tally = self.load_tally()
+                        except psycopg2.Error:
+                            self.online = False
+                            raise
+                    logging.info(f"Database reachable again; replayed {replayed} buffered write(s)")
+                    self._publish(EngineEvent("outbox", tally=tally, outbox_depth=0))
+                    return
+                except psycopg2.Error as e:
+                    logging.warning(f"Outbox replay failed ({e}); {len(self.outbox)} write(s) still queued")
+                    delay = min(backoff_max, delay * 2)
+        finally:
+            with self.lock:
+                if self._replayer is threading.current_thread():
+                    self._replayer = None
+            db.disconnect()
+
+    def handle_serial_line(self, data: str, received_at: Optional[float] = None,
+                           unit_id: Optional[str] = None) -> None:
+        if data in ["1", "2", "3"]:
+            party_id = int(data)
+            trace = self.tracer.start("vote", received_at)
+            trace.mark("parse")
+            self.cast_vote(party_id, trace, unit_id)
+        elif data == "4":  # Assuming '4' is sent when a voter is marked as voted
+            # Which voter is meant is only known to the officer's screen, so the GUI decides.
+            trace = self.tracer.start("mark", received_at)
+            trace.mark("parse")
+            self._publish(EngineEvent("mark_requested", trace=trace, unit_id=unit_id))
+
+    def poll_serial(self, max_lines: int = 100) -> int:
+        handled = 0
+        while handled < max_lines:
+            data = self.arduino_manager.read_data()
+            if not data:
+                break
+            self.handle_serial_line(data, self.arduino_manager.last_received_at, self.arduino_manager.unit_id)
+            handled += 1
+        return handled
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._reader = threading.Thread(target=self.serve_forever, name="evm-serial-reader", daemon=True)
+        self._reader.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._reader and self._reader is not threading.current_thread():
+            self._reader.join()
+
+    def serve_forever(self, idle_wait: float = 0.005, notify_interval: float = 0.05) -> None:
+        if self.outbox is not None and len(self.outbox):
+            # Left over from an earlier offline period; new writes queue behind it until replayed.
+            with self.lock:
+                self._start_replayer()
+        while not self._stop.is_set():
+            checkpoint()
+            now = time.monotonic()
+            if now >= self._next_notify_at:
+                # Changes made at other desks arrive as NOTIFYs; draining them is a socket read.
+                self._next_notify_at = now + notify_interval
+                try:
+                    self.apply_notifications()
+                except psycopg2.Error as e:
+                    logging.error(f"Error applying voter changes from other terminals: {e}")
+            if not self.poll_serial():
+                self.arduino_manager.wait(idle_wait)
+
+def main():
+    db_manager = DatabaseManager(
+        dbname="evm_database",
+        user="postgres",
+        password="12345678",
+        host="localhost",
+        port="5432"
+    )
+    record_path = os.environ.get('EVM_RECORD_PATH')
+    recorder = SerialRecorder(record_path) if record_path else None
+    arduino_manager = serial_from_env(recorder)
+    outbox = VoteOutbox(os.environ.get('EVM_OUTBOX_PATH', 'outbox.db'))
+    audit = AuditLog(os.environ.get('EVM_AUDIT_LOG', 'audit.log'))
+    engine = EVMEngine(db_manager, arduino_manager, outbox=outbox, audit=audit)
+
+    metrics_port = os.environ.get('EVM_METRICS_PORT')
+    if metrics_port:
+        start_metrics_server(int(metrics_port))
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, lambda signum, frame: engine.stop())
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: engine.tracer.dump())
+
+    try:
+        db_manager.connect()
+        try:
+            arduino_manager.connect()
+        except serial.SerialException as e:
+            logging.warning(f"Ballot unit not available yet ({e}); retrying in the background.")
+        arduino_manager.supervise()
+        logging.info(f"Headless EVM engine running; tally {engine.load_tally()}")
+        engine.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except psycopg2.Error as e:
+        logging.error(f"PostgreSQL error: {e}")
+    except serial.SerialException as e:
+        logging.error(f"Arduino connection error: {e}")
+    finally:
+        logging.info(f"Headless EVM engine stopped; tally {engine.tally}")
+        if engine.store is not None:
+            engine.store.close()
+        outbox.close()
+        audit.close()
+        db_manager.disconnect()
+        arduino_manager.disconnect()
+        if recorder:
+            recorder.close()
+
+if __name__ == "__main__":
+    main()
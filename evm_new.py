@@ -1,123 +1,119 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import psycopg2
 import tkinter as tk
 from tkinter import ttk, messagebox, font
-from PIL import Image, ImageTk
 import serial
-import requests
-from io import BytesIO
 import os
 import logging
-from typing import List, Tuple, Optional
+import queue
+import signal
+import sqlite3
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+from evm_engine import DatabaseManager, EngineEvent, EVMEngine, Voter, serial_from_env
+from voter_store import SearchCancelled
+from serial_replay import SerialRecorder
+from vote_outbox import VoteOutbox
+from audit_log import AuditLog
+from warmup import WarmupScheduler
+from metrics import registry, start_metrics_server, timed
+from profiling import Profiler, slow_ops, watch_slow
+from tracing import Trace
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-class DatabaseManager:
-    def __init__(self, dbname: str, user: str, password: str, host: str, port: str):
-        self.conn_params = {
-            "dbname": dbname,
-            "user": user,
-            "password": password,
-            "host": host,
-            "port": port
-        }
-        self.conn: Optional[psycopg2.extensions.connection] = None
-        self.cursor: Optional[psycopg2.extensions.cursor] = None
-
-    def connect(self) -> None:
-        try:
-            logging.info(f"Attempting to connect to database: {self.conn_params['dbname']}")
-            self.conn = psycopg2.connect(**self.conn_params)
-            self.cursor = self.conn.cursor()
-            logging.info("Successfully connected to the database.")
-
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS voters (
-                    id TEXT PRIMARY KEY,
-                    name TEXT,
-                    image_url TEXT,
-                    has_voted BOOLEAN
-                )
-            """)
-            self.conn.commit()
-
-            self.cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'")
-            tables = self.cursor.fetchall()
-            logging.info(f"Tables in the database: {tables}")
-
-        except psycopg2.Error as e:
-            logging.error(f"PostgreSQL error occurred: {e}")
-            raise
-        except Exception as e:
-            logging.error(f"Unexpected error during database connection: {e}")
-            raise
-
-    def disconnect(self) -> None:
-        if self.conn:
-            self.conn.close()
-            logging.info("Database connection closed.")
-
-    def execute_query(self, query: str, params: tuple = ()) -> List[Tuple]:
-        if not self.conn or not self.cursor:
-            logging.error("Database connection is not established.")
-            raise psycopg2.Error("Database connection is not established.")
-        
-        try:
-            self.cursor.execute(query, params)
-            if query.strip().upper().startswith("SELECT"):
-                return self.cursor.fetchall()
-            else:
-                self.conn.commit()
-                return []
-        except psycopg2.Error as e:
-            logging.error(f"Database error: {e}")
-            raise
-
-    def commit(self) -> None:
-        if self.conn:
-            self.conn.commit()
-
-class ArduinoManager:
-    def __init__(self, port: str, baudrate: int):
-        self.port = port
-        self.baudrate = baudrate
-        self.arduino: Optional[serial.Serial] = None
-
-    def connect(self) -> None:
-        try:
-            self.arduino = serial.Serial(port=self.port, baudrate=self.baudrate, timeout=0.1)
-            logging.info("Successfully connected to Arduino.")
-        except serial.SerialException as e:
-            logging.error(f"Error connecting to Arduino: {e}")
-            raise
-
-    def read_data(self) -> str:
-        if self.arduino and self.arduino.in_waiting:
-            return self.arduino.readline().decode('utf-8').strip()
-        return ""
-
-class Voter:
-    def __init__(self, id: str, name: str, image_url: str, has_voted: bool):
-        self.id = id
-        self.name = name
-        self.image_url = image_url
-        self.has_voted = has_voted
+class StartupTimer:
+    def __init__(self, started: float):
+        self.started = started
+        self.last = started
+
+    def mark(self, phase: str) -> None:
+        now = time.perf_counter()
+        logging.info(f"Startup phase '{phase}' took {(now - self.last) * 1000:.1f} ms "
+                     f"({(now - self.started) * 1000:.1f} ms since launch)")
+        self.last = now
+
+startup_timer = StartupTimer(_IMPORT_STARTED)
+
+UI_HANDLER_SECONDS = registry.histogram("evm_ui_handler_seconds", "Time spent in Tk event handlers", ["handler"])
+SEARCH_DEBOUNCE_MS = int(os.environ.get('EVM_SEARCH_DEBOUNCE_MS', '250'))
+# Shorter queries match most of a large roll; they only run when the Search button is pressed.
+SEARCH_MIN_CHARS = int(os.environ.get('EVM_SEARCH_MIN_CHARS', '3'))
+WARMUP_VOTERS = int(os.environ.get('EVM_WARMUP_VOTERS', '300'))
+# Treeview row height, also used to work out how many rows fit on screen.
+LIST_ROW_HEIGHT = 25
+LIST_HEADING_HEIGHT = 25
+LIST_FALLBACK_ROWS = 40
+# Upper bound on repaints: state changes in between are folded into the next one.
+RENDER_INTERVAL_MS = int(os.environ.get('EVM_RENDER_INTERVAL_MS', '33'))
+
+UI_LOOP_LAG = registry.histogram("evm_ui_loop_lag_seconds", "How late the event poll ran; large values are UI stalls").labels()
 
 class EVMGUI:
-    def __init__(self, db_manager: DatabaseManager, arduino_manager: ArduinoManager):
-        self.db_manager = db_manager
-        self.arduino_manager = arduino_manager
+    def __init__(self, engine: EVMEngine):
+        self.engine = engine
+        self.tracer = engine.tracer
+        # Engine events may arrive on its serial thread; Tk is only touched from process_engine_events.
+        self.events: "queue.Queue[EngineEvent]" = queue.Queue()
+        engine.subscribe(self.events.put)
         self.root = tk.Tk()
         self.root.title("EVM Voter Management System")
         self.root.attributes('-fullscreen', True)
         self.root.bind('<Escape>', lambda e: self.root.attributes('-fullscreen', False))
+        self.root.bind('<F9>', lambda e: self.tracer.dump())
+        self.root.bind('<F10>', lambda e: self.toggle_profiling())
+        # Any key or click is the officer working; the warm-up steps aside until they pause.
+        self.root.bind_all('<KeyPress>', lambda e: self.warmup.foreground(), add='+')
+        self.root.bind_all('<ButtonPress>', lambda e: self.warmup.foreground(), add='+')
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.tracer.dump())
+        if hasattr(signal, 'SIGUSR2'):
+            signal.signal(signal.SIGUSR2, lambda signum, frame: self.toggle_profiling())
 
         self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", lambda *args: self.schedule_search())
+        # Each search bumps the generation; results from an older one are dropped on arrival.
+        self.search_generation = 0
+        self._search_job: Optional[str] = None
+        self._last_search: Optional[Tuple[str, Sequence[Tuple]]] = None
+        # Current list (search result or whole roll) and the index of its first row on screen.
+        self.voter_rows: Sequence[Tuple] = []
+        self.list_offset = 0
+        # Marks seen since the list was built; plain result lists do not update themselves.
+        self._voted_overrides: Dict[str, bool] = {}
+        self.search_results: "queue.Queue[Tuple[int, str, object]]" = queue.Queue()
+        self.search_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="voter-search")
         self.selected_voter: Optional[Voter] = None
+        self.image_client = None
+        self.warmup = WarmupScheduler(engine, limit=WARMUP_VOTERS)
+        self.image_results: "queue.Queue[Tuple[str, float, Future]]" = queue.Queue()
+        self._next_poll_at: Optional[float] = None
+        self.profiler = Profiler()
+        self._profile_stop_job: Optional[str] = None
+        # Parts of the window with pending changes, repainted together by render().
+        self.renderers: Dict[str, Callable[[], None]] = {"tally": self.update_party_votes_display}
+        self._dirty: Set[str] = set()
+        self._render_job: Optional[str] = None
+        self._render_traces: List[Trace] = []
+        self._party_votes_text: Dict[int, str] = {}
 
         self.setup_styles()
         self.create_widgets()
         self.create_party_votes_display()
 
+    def toggle_profiling(self) -> None:
+        if self._profile_stop_job:
+            self.root.after_cancel(self._profile_stop_job)
+            self._profile_stop_job = None
+        if self.profiler.running:
+            self.profiler.stop()
+            return
+        self.profiler.start()
+        window = float(os.environ.get('EVM_PROFILE_SECONDS', '30'))
+        self._profile_stop_job = self.root.after(int(window * 1000), self.toggle_profiling)
+
     def setup_styles(self):
         self.style = ttk.Style()
         self.style.theme_use('clam')
@@ -132,7 +128,7 @@ class EVMGUI:
         self.style.configure("TLabel", background=bg_color, foreground=text_color, font=('Helvetica', 12))
         self.style.configure("TButton", background=accent_color, foreground="white", font=('Helvetica', 12, 'bold'), padding=10)
         self.style.map("TButton", background=[('active', "#2980b9")])
-        self.style.configure("Treeview", background="white", foreground=text_color, rowheight=25, font=('Helvetica', 11))
+        self.style.configure("Treeview", background="white", foreground=text_color, rowheight=LIST_ROW_HEIGHT, font=('Helvetica', 11))
         self.style.configure("Treeview.Heading", font=('Helvetica', 12, 'bold'))
         self.style.map("Treeview", background=[('selected', accent_color)], foreground=[('selected', 'white')])
 
@@ -164,10 +160,16 @@ class EVMGUI:
         self.voter_tree.column('Voted', width=100)
         self.voter_tree.pack(expand=True, fill=tk.BOTH)
         self.voter_tree.bind('<<TreeviewSelect>>', self.on_voter_select)
+        # The tree only ever holds the rows on screen; scrolling moves a window over voter_rows.
+        self.voter_tree.bind('<Configure>', lambda e: self.render_voter_window())
+        self.voter_tree.bind('<MouseWheel>', lambda e: self.scroll_voter_list("scroll", -1 if e.delta > 0 else 1, "units"))
+        self.voter_tree.bind('<Button-4>', lambda e: self.scroll_voter_list("scroll", -1, "units"))
+        self.voter_tree.bind('<Button-5>', lambda e: self.scroll_voter_list("scroll", 1, "units"))
+        self.voter_tree.bind('<Up>', lambda e: self.step_voter_selection(-1))
+        self.voter_tree.bind('<Down>', lambda e: self.step_voter_selection(1))
 
-        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.voter_tree.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.voter_tree.configure(yscrollcommand=scrollbar.set)
+        self.voter_scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.scroll_voter_list)
+        self.voter_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
         details_frame = ttk.Frame(content_frame, padding="0 0 0 20")
         details_frame.pack(side=tk.LEFT, fill=tk.Y)
@@ -184,7 +186,8 @@ class EVMGUI:
         self.end_voting_button = ttk.Button(details_frame, text="End Voting", command=self.end_voting)
         self.end_voting_button.pack(fill=tk.X, pady=(10, 0))
 
-        self.placeholder_image = ImageTk.PhotoImage(Image.new('RGB', (200, 200), color='#d0d0d0'))
+        self.placeholder_image = tk.PhotoImage(width=200, height=200)
+        self.placeholder_image.put('#d0d0d0', to=(0, 0, 200, 200))
         self.voter_image_label.config(image=self.placeholder_image)
 
     def create_party_votes_display(self):
@@ -199,32 +202,122 @@ class EVMGUI:
             label.pack(anchor=tk.W)
             self.party_votes_labels[party_id] = label
 
+        # Stays empty while the database is reachable.
+        self.outbox_label = ttk.Label(votes_frame, text="", foreground="#c0392b", font=('Helvetica', 12, 'bold'))
+        self.outbox_label.pack(anchor=tk.W, pady=(10, 0))
+
+    def schedule_search(self) -> None:
+        if self._search_job:
+            self.root.after_cancel(self._search_job)
+            self._search_job = None
+        if 0 < len(self.search_var.get().strip()) < SEARCH_MIN_CHARS:
+            # A search still running for an earlier query is out of date all the same.
+            self.search_generation += 1
+            return
+        self._search_job = self.root.after(SEARCH_DEBOUNCE_MS, self.search_voter)
+
+    @timed(UI_HANDLER_SECONDS.labels("search_voter"))
+    @watch_slow("tk", "search_voter", lambda self: self.search_var.get())
     def search_voter(self) -> None:
+        if self._search_job:
+            self.root.after_cancel(self._search_job)
+            self._search_job = None
         query = self.search_var.get()
+        self.search_generation += 1
+        within = None
+        # Typing forward only narrows the match, so the previous results are filtered instead.
+        if self._last_search and self._last_search[0] and query.lower().startswith(self._last_search[0].lower()):
+            within = self._last_search[1]
+        self.search_executor.submit(self._run_search, self.search_generation, query, within)
+
+    def _run_search(self, generation: int, query: str, within: Optional[Sequence[Tuple]]) -> None:
+        if generation != self.search_generation:
+            return
         try:
-            voters = self.db_manager.execute_query(
-                "SELECT id, name, image_url, has_voted FROM voters WHERE name ILIKE %s OR id ILIKE %s",
-                ('%' + query + '%', '%' + query + '%')
-            )
-            self.update_voter_list(voters)
+            # Stops scanning the roll as soon as a newer search has been started.
+            result = self.engine.search_voters(query, within, lambda: generation != self.search_generation)
+        except SearchCancelled:
+            return
         except psycopg2.Error as e:
-            messagebox.showerror("Search Error", f"Unable to search for voter: {e}")
-
-    def update_voter_list(self, voters: List[Tuple]) -> None:
+            result = e
+        self.search_results.put((generation, query, result))
+
+    def show_search_results(self, generation: int, query: str, result) -> None:
+        if generation != self.search_generation:
+            return
+        if isinstance(result, psycopg2.Error):
+            messagebox.showerror("Search Error", f"Unable to search for voter: {result}")
+            return
+        self._last_search = (query, result)
+        self.update_voter_list(result)
+
+    def update_voter_list(self, voters: Sequence[Tuple]) -> None:
+        self.voter_rows = voters
+        self._voted_overrides.clear()
+        self.list_offset = 0
+        self.render_voter_window()
+
+    def visible_rows(self) -> int:
+        height = self.voter_tree.winfo_height()
+        # Before the first layout the widget reports a height of 1.
+        return max(1, (height - LIST_HEADING_HEIGHT) // LIST_ROW_HEIGHT) if height > 1 else LIST_FALLBACK_ROWS
+
+    def render_voter_window(self) -> None:
+        visible = self.visible_rows()
+        total = len(self.voter_rows)
+        self.list_offset = max(0, min(self.list_offset, total - visible))
+        rows = self.engine.voter_window(self.voter_rows, self.list_offset, self.list_offset + visible)
+        if rows is None:
+            # The roster was reloaded under this list; the roster_changed refresh replaces it.
+            return
         self.voter_tree.delete(*self.voter_tree.get_children())
-        for voter in voters:
-            self.voter_tree.insert('', 'end', values=(voter[0], voter[1], 'Yes' if voter[3] else 'No'))
-
+        for voter in rows:
+            # The voter id doubles as the item id so a single row can be updated in place.
+            voted = self._voted_overrides.get(voter[0], voter[3])
+            self.voter_tree.insert('', 'end', iid=voter[0], values=(voter[0], voter[1], 'Yes' if voted else 'No'))
+        if self.selected_voter and self.voter_tree.exists(self.selected_voter.id):
+            self.voter_tree.selection_set(self.selected_voter.id)
+        if total:
+            self.voter_scrollbar.set(self.list_offset / total, min(1.0, (self.list_offset + visible) / total))
+        else:
+            self.voter_scrollbar.set(0.0, 1.0)
+
+    def scroll_voter_list(self, action: str, amount, unit: Optional[str] = None) -> None:
+        # Speaks the Scrollbar command protocol: ("moveto", fraction) or ("scroll", n, units|pages).
+        if action == "moveto":
+            self.list_offset = int(float(amount) * len(self.voter_rows))
+        else:
+            step = self.visible_rows() if unit == "pages" else 1
+            self.list_offset += int(amount) * step
+        self.render_voter_window()
+
+    def step_voter_selection(self, step: int) -> Optional[str]:
+        # Arrow keys past the first or last row on screen move the window instead of stopping.
+        children = self.voter_tree.get_children()
+        focus = self.voter_tree.focus()
+        if not children or focus != children[0 if step < 0 else -1]:
+            return None
+        offset = self.list_offset
+        self.scroll_voter_list("scroll", step, "units")
+        if self.list_offset == offset:
+            return "break"
+        children = self.voter_tree.get_children()
+        target = children[0 if step < 0 else -1]
+        self.voter_tree.focus(target)
+        self.voter_tree.selection_set(target)
+        return "break"
+
+    @timed(UI_HANDLER_SECONDS.labels("on_voter_select"))
+    @watch_slow("tk", "on_voter_select", lambda self, event: self.voter_tree.selection())
     def on_voter_select(self, event) -> None:
         selection = self.voter_tree.selection()
-        if selection:
-            voter_id = self.voter_tree.item(selection[0])['values'][0]
+        if selection and not (self.selected_voter and self.selected_voter.id == selection[0]):
+            voter_id = selection[0]
             try:
-                voter_data = self.db_manager.execute_query(
-                    "SELECT id, name, image_url, has_voted FROM voters WHERE id = %s",
-                    (str(voter_id),)
-                )[0]
-                self.selected_voter = Voter(*voter_data)
+                voter = self.engine.get_voter(voter_id)
+                if voter is None:
+                    return
+                self.selected_voter = voter
                 self.display_voter_details()
             except psycopg2.Error as e:
                 messagebox.showerror("Error", f"Unable to fetch voter details: {e}")
@@ -237,76 +330,159 @@ class EVMGUI:
 
     def load_voter_image(self) -> None:
         self.voter_image_label.config(image=self.placeholder_image)
-        if self.selected_voter:
+        if self.selected_voter and self.selected_voter.image_url:
             try:
-                response = requests.get(self.selected_voter.image_url)
-                if response.status_code == 200 and response.headers['Content-Type'].startswith('image'):
-                    image = Image.open(BytesIO(response.content))
-                    image = image.resize((200, 200))
-                    photo = ImageTk.PhotoImage(image)
-                    self.voter_image_label.config(image=photo)
-                    self.voter_image_label.image = photo
+                if self.image_client is None:
+                    # Imported on first use so the window does not wait on PIL and requests at launch.
+                    from image_client import shared_client
+                    self.image_client = shared_client()
+                future = self.image_client.submit_thumbnail(self.selected_voter.image_url)
             except Exception as e:
                 logging.error(f"Error loading image: {e}")
-
-    def mark_as_voted(self) -> None:
+                return
+            voter_id = self.selected_voter.id
+            started = time.perf_counter()
+            # Fetched off the Tk thread; the placeholder stays up until the photo arrives.
+            future.add_done_callback(lambda done: self.image_results.put((voter_id, started, done)))
+
+    def show_voter_image(self, voter_id: str, started: float, future: Future) -> None:
+        url = self.selected_voter.image_url if self.selected_voter else None
+        slow_ops.check("image", "load_voter_image", time.perf_counter() - started, url)
+        # The officer may have moved on to another voter while this one was loading.
+        if not self.selected_voter or self.selected_voter.id != voter_id or future.cancelled():
+            return
+        try:
+            from PIL import ImageTk
+            photo = ImageTk.PhotoImage(future.result())
+        except Exception as e:
+            logging.error(f"Error loading image: {e}")
+            return
+        self.voter_image_label.config(image=photo)
+        self.voter_image_label.image = photo
+
+    @timed(UI_HANDLER_SECONDS.labels("mark_as_voted"))
+    @watch_slow("tk", "mark_as_voted", lambda self, trace=None: self.selected_voter and self.selected_voter.id)
+    def mark_as_voted(self, trace=None) -> None:
         if self.selected_voter and not self.selected_voter.has_voted:
             try:
-                self.db_manager.execute_query(
-                    "UPDATE voters SET has_voted = TRUE WHERE id = %s",
-                    (self.selected_voter.id,)
-                )
-                self.db_manager.commit()
-                messagebox.showinfo("Vote", f"{self.selected_voter.name} has been marked as voted.")
+                result = self.engine.mark_voted(self.selected_voter.id, trace)
                 self.selected_voter.has_voted = True
-                self.refresh_voter_list()
-            except psycopg2.Error as e:
+                self.mark_voted_button.config(state=tk.DISABLED)
+                # Shown once the handler has returned so the modal dialog is not counted as handler time.
+                name = self.selected_voter.name
+                if result.won:
+                    self.root.after_idle(lambda: messagebox.showinfo("Vote", f"{name} has been marked as voted."))
+                else:
+                    desk = f" (marked at {result.voted_by})" if result.voted_by else ""
+                    self.root.after_idle(lambda: messagebox.showwarning("Already Voted", f"{name} has already voted{desk}."))
+            except (psycopg2.Error, sqlite3.Error) as e:
+                # sqlite3 errors come from the offline outbox (disk full, file locked).
                 messagebox.showerror("Error", f"Unable to update database: {e}")
 
+    @timed(UI_HANDLER_SECONDS.labels("refresh_voter_list"))
+    @watch_slow("tk", "refresh_voter_list")
     def refresh_voter_list(self) -> None:
         try:
-            voters = self.db_manager.execute_query("SELECT id, name, image_url, has_voted FROM voters")
+            voters = self.engine.list_voters()
             self.update_voter_list(voters)
         except psycopg2.Error as e:
             messagebox.showerror("Error", f"Unable to refresh voter list: {e}")
 
     def update_party_votes_display(self):
-        try:
-            for party_id in range(1, 4):
-                votes = self.db_manager.execute_query(
-                    "SELECT votes FROM parties WHERE id = %s",
-                    (party_id,)
-                )[0][0]
-                self.party_votes_labels[party_id].config(text=f"Party {party_id}: {votes}")
-        except psycopg2.Error as e:
-            logging.error(f"Error updating party votes display: {e}")
-
-    def increment_party_vote(self, party_id: int):
-        try:
-            self.db_manager.execute_query(
-                "UPDATE parties SET votes = votes + 1 WHERE id = %s",
-                (party_id,)
-            )
-            self.db_manager.commit()
-            self.update_party_votes_display()
-            logging.info(f"Incremented vote for Party {party_id}")
-        except psycopg2.Error as e:
-            logging.error(f"Error incrementing party vote: {e}")
-
-    def check_arduino(self) -> None:
-        data = self.arduino_manager.read_data()
-        if data:
-            if data in ["1", "2", "3"]:
-                party_id = int(data)
-                self.increment_party_vote(party_id)
-            elif data == "4":  # Assuming '4' is sent when a voter is marked as voted
-                self.mark_as_voted()
-
-        self.root.after(100, self.check_arduino)
-
+        for party_id, label in self.party_votes_labels.items():
+            text = f"Party {party_id}: {self.engine.tally.get(party_id, 0)}"
+            if self._party_votes_text.get(party_id) != text:
+                label.config(text=text)
+                self._party_votes_text[party_id] = text
+
+    def request_render(self, part: str, trace: Optional[Trace] = None) -> None:
+        # Marks `part` dirty; however many events arrive, one render() per interval paints them.
+        self._dirty.add(part)
+        if trace:
+            self._render_traces.append(trace)
+        if self._render_job is None:
+            self._render_job = self.root.after(RENDER_INTERVAL_MS, self.render)
+
+    @timed(UI_HANDLER_SECONDS.labels("render"))
+    def render(self) -> None:
+        self._render_job = None
+        dirty, self._dirty = self._dirty, set()
+        for part in dirty:
+            self.renderers[part]()
+        now = time.perf_counter()
+        for trace in self._render_traces:
+            self.tracer.observe(trace.kind, "display", now - trace.started)
+        self._render_traces.clear()
+
+    def update_outbox_display(self, depth: int) -> None:
+        if depth or not self.engine.online:
+            self.outbox_label.config(text=f"Database offline — {depth} change(s) queued locally")
+        else:
+            self.outbox_label.config(text="")
+
+    def update_voter_row(self, voter_id: str, has_voted: bool) -> None:
+        # Only the changed row is touched, whichever desk made the change.
+        self._last_search = None
+        self._voted_overrides[voter_id] = has_voted
+        if self.voter_tree.exists(voter_id):
+            self.voter_tree.set(voter_id, 'Voted', 'Yes' if has_voted else 'No')
+        if self.selected_voter and self.selected_voter.id == voter_id:
+            self.selected_voter.has_voted = has_voted
+            self.mark_voted_button.config(state=tk.DISABLED if has_voted else tk.NORMAL)
+
+    @watch_slow("tk", "process_engine_events")
+    def process_engine_events(self) -> None:
+        now = time.perf_counter()
+        if self._next_poll_at is not None:
+            UI_LOOP_LAG.observe(max(0.0, now - self._next_poll_at))
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            self.handle_engine_event(event)
+        while True:
+            try:
+                search = self.search_results.get_nowait()
+            except queue.Empty:
+                break
+            self.show_search_results(*search)
+        while True:
+            try:
+                image = self.image_results.get_nowait()
+            except queue.Empty:
+                break
+            self.show_voter_image(*image)
+
+        self._next_poll_at = time.perf_counter() + 0.1
+        self.root.after(100, self.process_engine_events)
+
+    def handle_engine_event(self, event: EngineEvent) -> None:
+        self.warmup.foreground()
+        if event.kind == "vote":
+            # Its display latency is taken when render() has actually painted it.
+            self.request_render("tally", event.trace)
+            return
+        elif event.kind == "mark_requested":
+            self.mark_as_voted(event.trace)
+            return
+        elif event.kind in ("voter_marked", "voter_changed"):
+            self.update_voter_row(event.voter_id, event.has_voted)
+        elif event.kind == "roster_changed":
+            self._last_search = None
+            self.refresh_voter_list()
+        elif event.kind == "outbox":
+            self.update_outbox_display(event.outbox_depth)
+            if event.tally is not None:
+                self.request_render("tally")
+        if event.trace:
+            self.tracer.observe(event.trace.kind, "display", time.perf_counter() - event.trace.started)
+
+    @timed(UI_HANDLER_SECONDS.labels("end_voting"))
+    @watch_slow("tk", "end_voting")
     def end_voting(self):
         try:
-            parties = self.db_manager.execute_query("SELECT id, name, votes FROM parties ORDER BY votes DESC")
+            parties = self.engine.results()
             total_votes = sum(party[2] for party in parties)
             
             result_window = tk.Toplevel(self.root)
@@ -338,12 +514,38 @@ class EVMGUI:
             messagebox.showerror("Error", f"Unable to retrieve voting results: {e}")
 
     def run(self) -> None:
+        self.root.update_idletasks()
+        startup_timer.mark("first paint")
+        self.root.after(0, self.load_initial_data)
+        try:
+            self.root.mainloop()
+        finally:
+            self.warmup.stop()
+            self.search_executor.shutdown(wait=False)
+            if self.image_client is not None:
+                self.image_client.close()
+
+    def load_initial_data(self) -> None:
+        try:
+            self.engine.load_roster()
+        except psycopg2.Error as e:
+            logging.error(f"Error loading the voter store, falling back to database search: {e}")
         self.refresh_voter_list()
+        startup_timer.mark("roster load")
+        try:
+            self.engine.load_tally()
+        except psycopg2.Error as e:
+            logging.error(f"Error loading party votes: {e}")
         self.update_party_votes_display()
-        self.check_arduino()
-        self.root.mainloop()
-
-def main():
+        if self.engine.outbox is not None:
+            self.update_outbox_display(len(self.engine.outbox))
+        startup_timer.mark("tally load")
+        self.engine.start()
+        self.process_engine_events()
+        if WARMUP_VOTERS:
+            self.root.after_idle(self.warmup.start)
+
+def main(gui_cls: Optional[type] = None):
     db_manager = DatabaseManager(
         dbname="evm_database",
         user="postgres",
@@ -351,13 +553,31 @@ def main():
         host="localhost",
         port="5432"
     )
-    arduino_manager = ArduinoManager('COM4', 9600)
+    record_path = os.environ.get('EVM_RECORD_PATH')
+    recorder = SerialRecorder(record_path) if record_path else None
+    arduino_manager = serial_from_env(recorder)
+    outbox = VoteOutbox(os.environ.get('EVM_OUTBOX_PATH', 'outbox.db'))
+    audit = AuditLog(os.environ.get('EVM_AUDIT_LOG', 'audit.log'))
+    engine = EVMEngine(db_manager, arduino_manager, outbox=outbox, audit=audit)
+    startup_timer.mark("imports")
+
+    metrics_port = os.environ.get('EVM_METRICS_PORT')
+    if metrics_port:
+        start_metrics_server(int(metrics_port))
 
     try:
         db_manager.connect()
-        arduino_manager.connect()
-        
-        gui = EVMGUI(db_manager, arduino_manager)
+        startup_timer.mark("database connect")
+        try:
+            arduino_manager.connect()
+        except serial.SerialException as e:
+            # The booth can search and mark voters meanwhile; the supervisor keeps retrying.
+            logging.warning(f"Ballot unit not available yet ({e}); retrying in the background.")
+        arduino_manager.supervise()
+        startup_timer.mark("arduino connect")
+
+        gui = (gui_cls or EVMGUI)(engine)
+        startup_timer.mark("window build")
         gui.run()
     except psycopg2.Error as e:
         logging.error(f"PostgreSQL error: {e}")
@@ -369,7 +589,15 @@ def main():
         logging.error(f"An unexpected error occurred: {e}")
         messagebox.showerror("Error", f"An unexpected error occurred: {e}")
     finally:
+        engine.stop()
+        if engine.store is not None:
+            engine.store.close()
+        outbox.close()
+        audit.close()
         db_manager.disconnect()
+        arduino_manager.disconnect()
+        if recorder:
+            recorder.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,245 @@
+import email.utils
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Callable, Optional, Tuple
+
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import registry
+from query_cache import LRUCache
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+IMAGE_FETCHES = registry.counter("evm_image_fetches_total", "Voter photo fetches by result", ["result"])
+IMAGE_FRESH = IMAGE_FETCHES.labels("fresh")
+IMAGE_REVALIDATED = IMAGE_FETCHES.labels("revalidated")
+IMAGE_DOWNLOADED = IMAGE_FETCHES.labels("downloaded")
+IMAGE_REJECTED = IMAGE_FETCHES.labels("rejected")
+IMAGE_ERRORS = IMAGE_FETCHES.labels("error")
+IMAGE_FETCH_SECONDS = registry.histogram("evm_image_fetch_seconds", "Voter photo fetch time, cache hits included").labels()
+
+class FetchCancelled(Exception):
+    pass
+
+# PIL cannot draw SVG, and anything else claiming to be an image is checked by decoding it.
+UNSUPPORTED_TYPES = ("image/svg+xml",)
+
+class CachedImage:
+    __slots__ = ("body", "content_type", "etag", "last_modified", "fetched_at", "max_age")
+
+    def __init__(self, body: bytes, content_type: str, etag: Optional[str], last_modified: Optional[str],
+                 fetched_at: float, max_age: float):
+        self.body = body
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.max_age = max_age
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() - self.fetched_at < self.max_age
+
+def _max_age(headers) -> Optional[float]:
+    # None means "do not store"; 0 means store but revalidate every time.
+    directives = [part.strip().lower() for part in headers.get("Cache-Control", "").split(",")]
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    for directive in directives:
+        if directive.startswith("max-age="):
+            try:
+                return float(directive[len("max-age="):])
+            except ValueError:
+                return 0.0
+    expires = headers.get("Expires")
+    if expires:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(expires).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return 0.0
+    return 0.0
+
+class ImageClient:
+    # One keep-alive session for every voter photo: connections are pooled per host, so only the
+    # first photo from a CDN pays for DNS, TCP and TLS. Responses are kept in memory and, with
+    # cache_dir, on disk, and revalidated with If-None-Match/If-Modified-Since once stale.
+    # fetch() is blocking; submit() runs it on a small pool, which also bounds concurrency.
+    def __init__(self, cache_dir: Optional[str] = None, max_workers: int = 4, pool_size: int = 4,
+                 connect_timeout: float = 3.05, read_timeout: float = 10.0,
+                 max_bytes: int = 5 * 1024 * 1024, max_entries: int = 256):
+        self.cache_dir = cache_dir
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_bytes = max_bytes
+        self.session = requests.Session()
+        retry = Retry(total=2, connect=2, read=1, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset({"GET"}))
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept"] = "image/png, image/jpeg, image/webp, image/gif;q=0.8, image/*;q=0.5"
+        self.max_entries = max_entries
+        self.entries = LRUCache("image", max_entries)
+        self.thumbnails = LRUCache("thumbnail", max_entries)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="evm-image")
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def _load(self, url: str) -> Optional[CachedImage]:
+        with self.lock:
+            entry = self.entries.get(url, None)
+        if entry is not None or not self.cache_dir:
+            return entry
+        path = self._path(url)
+        try:
+            with open(f"{path}.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(f"{path}.img", "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        entry = CachedImage(body, meta["content_type"], meta.get("etag"), meta.get("last_modified"),
+                            meta["fetched_at"], meta["max_age"])
+        with self.lock:
+            self.entries.put(url, entry)
+        return entry
+
+    def _store(self, url: str, entry: CachedImage, body_changed: bool) -> None:
+        with self.lock:
+            self.entries.put(url, entry)
+        if not self.cache_dir:
+            return
+        path = self._path(url)
+        try:
+            if body_changed:
+                temporary = f"{path}.img.{threading.get_ident()}.tmp"
+                with open(temporary, "wb") as f:
+                    f.write(entry.body)
+                os.replace(temporary, f"{path}.img")
+            meta = {"url": url, "content_type": entry.content_type, "etag": entry.etag,
+                    "last_modified": entry.last_modified, "fetched_at": entry.fetched_at, "max_age": entry.max_age}
+            temporary = f"{path}.json.{threading.get_ident()}.tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(temporary, f"{path}.json")
+        except OSError as e:
+            logging.warning(f"Could not write image cache entry for {url}: {e}")
+
+    def fetch(self, url: str, timeout: Optional[Tuple[float, float]] = None,
+              should_stop: Optional[Callable[[], bool]] = None) -> Tuple[bytes, str]:
+        # should_stop is polled between chunks; a True answer abandons the download with
+        # FetchCancelled. With a short read timeout that bounds how long a caller can be held.
+        started = time.perf_counter()
+        try:
+            return self._fetch(url, timeout or self.timeout, should_stop)
+        except requests.RequestException:
+            IMAGE_ERRORS.inc()
+            raise
+        finally:
+            IMAGE_FETCH_SECONDS.observe(time.perf_counter() - started)
+
+    def _fetch(self, url: str, timeout: Tuple[float, float],
+               should_stop: Optional[Callable[[], bool]]) -> Tuple[bytes, str]:
+        cached = self._load(url)
+        if cached is not None and cached.fresh:
+            IMAGE_FRESH.inc()
+            return cached.body, cached.content_type
+
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+        with self.session.get(url, headers=headers, timeout=timeout, stream=True) as response:
+            max_age = _max_age(response.headers)
+            if response.status_code == 304 and cached is not None:
+                IMAGE_REVALIDATED.inc()
+                cached.fetched_at = time.time()
+                cached.max_age = max_age or 0.0
+                cached.etag = response.headers.get("ETag", cached.etag)
+                self._store(url, cached, body_changed=False)
+                return cached.body, cached.content_type
+            response.raise_for_status()
+
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if not content_type.startswith("image/") or content_type in UNSUPPORTED_TYPES:
+                IMAGE_REJECTED.inc()
+                raise ValueError(f"{url} is {content_type or 'untyped'}, not a supported image")
+            length = response.headers.get("Content-Length")
+            if length and length.isdigit() and int(length) > self.max_bytes:
+                IMAGE_REJECTED.inc()
+                raise ValueError(f"{url} is {int(length)} bytes, over the {self.max_bytes} byte limit")
+            # Content-Length can be absent or wrong, so the limit is enforced on what arrives.
+            body = bytearray()
+            for chunk in response.iter_content(16 * 1024):
+                if should_stop is not None and should_stop():
+                    raise FetchCancelled(url)
+                body += chunk
+                if len(body) > self.max_bytes:
+                    IMAGE_REJECTED.inc()
+                    raise ValueError(f"{url} exceeds the {self.max_bytes} byte limit")
+
+        IMAGE_DOWNLOADED.inc()
+        body = bytes(body)
+        if max_age is not None:
+            entry = CachedImage(body, content_type, response.headers.get("ETag"),
+                                response.headers.get("Last-Modified"), time.time(), max_age)
+            self._store(url, entry, body_changed=True)
+        return body, content_type
+
+    def submit(self, url: str) -> "Future[Tuple[bytes, str]]":
+        return self.executor.submit(self.fetch, url)
+
+    def get_thumbnail(self, url: str, size: Tuple[int, int] = (200, 200),
+                      timeout: Optional[Tuple[float, float]] = None,
+                      should_stop: Optional[Callable[[], bool]] = None) -> Image.Image:
+        body, _ = self.fetch(url, timeout, should_stop)
+        with self.lock:
+            cached = self.thumbnails.get((url, size), None)
+        # fetch() hands back the same bytes object for as long as the photo is unchanged.
+        if cached is not None and cached[0] is body:
+            return cached[1]
+        image = thumbnail(body, size)
+        with self.lock:
+            self.thumbnails.put((url, size), (body, image))
+        return image
+
+    def submit_thumbnail(self, url: str, size: Tuple[int, int] = (200, 200)) -> "Future[Image.Image]":
+        # Decoding and resizing happen on the pool as well, leaving the caller only the paint.
+        return self.executor.submit(self.get_thumbnail, url, size)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+def thumbnail(data: bytes, size: Tuple[int, int] = (200, 200)) -> Image.Image:
+    image = Image.open(BytesIO(data))
+    # draft() lets JPEG decode straight at a reduced scale instead of full size and then shrink.
+    image.draft("RGB", size)
+    return image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB").resize(size)
+
+_shared: Optional[ImageClient] = None
+_shared_lock = threading.Lock()
+
+def shared_client() -> ImageClient:
+    # One per process, so the GUI and anything it starts reuse the same pooled connections.
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ImageClient(cache_dir=os.environ.get('EVM_IMAGE_CACHE', 'image_cache'))
+        return _shared
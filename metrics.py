@@ -0,0 +1,201 @@
+import bisect
+import functools
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _ShardedCells:
+    # Every writer thread gets its own cell, so the hot path is a thread-local lookup and an
+    # unshared add with no lock; the lock is only taken once per thread and at scrape time.
+    def __init__(self, factory: Callable[[], list]):
+        self.factory = factory
+        self.local = threading.local()
+        self.cells: List[list] = []
+        self.lock = threading.Lock()
+
+    def cell(self) -> list:
+        cell = getattr(self.local, "cell", None)
+        if cell is None:
+            cell = self.factory()
+            with self.lock:
+                self.cells.append(cell)
+            self.local.cell = cell
+        return cell
+
+    def snapshot(self) -> List[list]:
+        with self.lock:
+            return [list(cell) for cell in self.cells]
+
+class CounterChild:
+    def __init__(self):
+        self.shards = _ShardedCells(lambda: [0.0])
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.shards.cell()[0] += amount
+
+    def get(self) -> float:
+        return sum((cell[0] for cell in self.shards.snapshot()), 0.0)
+
+class GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception as e:
+                logging.debug(f"Gauge callback failed: {e}")
+                return float("nan")
+        return self.value
+
+class HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        # Cell layout: one count per bucket, then +Inf, then the running sum.
+        self.shards = _ShardedCells(lambda: [0] * (len(self.buckets) + 1) + [0.0])
+
+    def observe(self, value: float) -> None:
+        cell = self.shards.cell()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+    def get(self) -> Tuple[List[int], float]:
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for cell in self.shards.snapshot():
+            for i in range(len(counts)):
+                counts[i] += cell[i]
+            total += cell[-1]
+        return counts, total
+
+class _Timer:
+    def __init__(self, histogram: HistogramChild):
+        self.histogram = histogram
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.started)
+
+class Metric:
+    def __init__(self, kind: str, name: str, help: str, labelnames: Sequence[str], factory: Callable[[], object]):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self.children: Dict[Tuple[str, ...], object] = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values: str):
+        # Call once and keep the child; the lookup is the only part that is not hot-path cheap.
+        key = tuple(str(value) for value in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self.factory())
+        return child
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Metric:
+        return self._register(Metric("counter", name, help, labelnames, CounterChild))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Metric:
+        return self._register(Metric("gauge", name, help, labelnames, GaugeChild))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Metric:
+        return self._register(Metric("histogram", name, help, labelnames, lambda: HistogramChild(buckets)))
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for key, child in list(metric.children.items()):
+                labels = [f'{name}="{_escape(value)}"' for name, value in zip(metric.labelnames, key)]
+                if metric.kind == "histogram":
+                    counts, total = child.get()
+                    cumulative = 0
+                    for bound, count in zip(list(child.buckets) + ["+Inf"], counts):
+                        cumulative += count
+                        bucket_labels = _format_labels(labels + ['le="%s"' % bound])
+                        lines.append(f"{metric.name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{metric.name}_sum{_format_labels(labels)} {total}")
+                    lines.append(f"{metric.name}_count{_format_labels(labels)} {cumulative}")
+                else:
+                    lines.append(f"{metric.name}{_format_labels(labels)} {child.get()}")
+        return "\n".join(lines) + "\n"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: List[str]) -> str:
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+registry = MetricsRegistry()
+
+def timed(histogram: HistogramChild):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,241 @@
+import psycopg2
+import logging
+from typing import List, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+db_params = {
+    "dbname": "evm_database",
+    "user": "postgres",
+    "password": "12345678",
+    "host": "localhost",
+    "port": "5432"
+}
+
+# Every table, index and trigger is owned by this list. Append new entries; never edit
+# one that has already been applied somewhere.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "baseline voters and idempotency tables", [
+        """
+        CREATE TABLE IF NOT EXISTS voters (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            image_url TEXT,
+            has_voted BOOLEAN
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS applied_writes (
+            idempotency_key TEXT PRIMARY KEY,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """,
+    ]),
+    (2, "parties table and NOT NULL/defaults on voters", [
+        """
+        CREATE TABLE IF NOT EXISTS parties (
+            id SERIAL PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            votes INTEGER DEFAULT 0
+        )
+        """,
+        "UPDATE parties SET votes = 0 WHERE votes IS NULL",
+        "ALTER TABLE parties ALTER COLUMN votes SET DEFAULT 0, ALTER COLUMN votes SET NOT NULL",
+        "UPDATE voters SET has_voted = FALSE WHERE has_voted IS NULL",
+        """
+        ALTER TABLE voters
+            ALTER COLUMN name SET NOT NULL,
+            ALTER COLUMN has_voted SET DEFAULT FALSE,
+            ALTER COLUMN has_voted SET NOT NULL
+        """,
+    ]),
+    (3, "search and turnout indexes", [
+        # pg_trgm ships with contrib, which not every booth server has; ILIKE still works without it.
+        """
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+                CREATE EXTENSION IF NOT EXISTS pg_trgm;
+                CREATE INDEX IF NOT EXISTS voters_name_trgm_idx ON voters USING gin (name gin_trgm_ops);
+                CREATE INDEX IF NOT EXISTS voters_id_trgm_idx ON voters USING gin (id gin_trgm_ops);
+            ELSE
+                RAISE NOTICE 'pg_trgm is not available; skipping trigram search indexes';
+            END IF;
+        END
+        $$
+        """,
+        "CREATE INDEX IF NOT EXISTS voters_not_voted_idx ON voters (id) WHERE NOT has_voted",
+    ]),
+    (4, "row_version on voters for roster snapshot deltas", [
+        "CREATE SEQUENCE IF NOT EXISTS voters_row_version_seq",
+        "ALTER TABLE voters ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT nextval('voters_row_version_seq')",
+        """
+        CREATE OR REPLACE FUNCTION voters_bump_row_version() RETURNS trigger AS $$
+        BEGIN
+            NEW.row_version := nextval('voters_row_version_seq');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS voters_row_version_trg ON voters",
+        """
+        CREATE TRIGGER voters_row_version_trg BEFORE UPDATE ON voters
+            FOR EACH ROW EXECUTE FUNCTION voters_bump_row_version()
+        """,
+        "CREATE INDEX IF NOT EXISTS voters_row_version_idx ON voters (row_version)",
+    ]),
+    (5, "NOTIFY voters_changed for cache invalidation", [
+        # One notification per changed voter id, or '*' for bulk statements (resets, deletes of the
+        # whole roll, TRUNCATE) so a million-row UPDATE does not queue a million notifications.
+        """
+        CREATE OR REPLACE FUNCTION voters_notify_change() RETURNS trigger AS $$
+        DECLARE
+            changed BIGINT;
+            voter_id TEXT;
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                PERFORM pg_notify('voters_changed', '*');
+                RETURN NULL;
+            END IF;
+            SELECT count(*) INTO changed FROM changed_rows;
+            IF changed > 100 THEN
+                PERFORM pg_notify('voters_changed', '*');
+            ELSE
+                FOR voter_id IN SELECT id FROM changed_rows LOOP
+                    PERFORM pg_notify('voters_changed', voter_id);
+                END LOOP;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS voters_notify_insert_trg ON voters",
+        "DROP TRIGGER IF EXISTS voters_notify_update_trg ON voters",
+        "DROP TRIGGER IF EXISTS voters_notify_delete_trg ON voters",
+        "DROP TRIGGER IF EXISTS voters_notify_truncate_trg ON voters",
+        """
+        CREATE TRIGGER voters_notify_insert_trg AFTER INSERT ON voters
+            REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION voters_notify_change()
+        """,
+        """
+        CREATE TRIGGER voters_notify_update_trg AFTER UPDATE ON voters
+            REFERENCING NEW TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION voters_notify_change()
+        """,
+        """
+        CREATE TRIGGER voters_notify_delete_trg AFTER DELETE ON voters
+            REFERENCING OLD TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION voters_notify_change()
+        """,
+        """
+        CREATE TRIGGER voters_notify_truncate_trg AFTER TRUNCATE ON voters
+            FOR EACH STATEMENT EXECUTE FUNCTION voters_notify_change()
+        """,
+    ]),
+    (6, "voted_by/voted_at on voters and row payloads on voters_changed", [
+        "ALTER TABLE voters ADD COLUMN IF NOT EXISTS voted_by TEXT, ADD COLUMN IF NOT EXISTS voted_at TIMESTAMPTZ",
+        # Same triggers as migration 5; the payload now carries the changed row so other terminals
+        # can apply it without querying for it.
+        """
+        CREATE OR REPLACE FUNCTION voters_notify_change() RETURNS trigger AS $$
+        DECLARE
+            changed BIGINT;
+            changed_row RECORD;
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                PERFORM pg_notify('voters_changed', '*');
+                RETURN NULL;
+            END IF;
+            SELECT count(*) INTO changed FROM changed_rows;
+            IF changed > 100 THEN
+                PERFORM pg_notify('voters_changed', '*');
+            ELSE
+                FOR changed_row IN SELECT * FROM changed_rows LOOP
+                    PERFORM pg_notify('voters_changed', json_build_object(
+                        'op', TG_OP,
+                        'id', changed_row.id,
+                        'name', changed_row.name,
+                        'has_voted', changed_row.has_voted,
+                        'voted_by', changed_row.voted_by,
+                        'row_version', changed_row.row_version
+                    )::text);
+                END LOOP;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+MIGRATION_LOCK_ID = 7_302_024
+
+def current_version(conn) -> Optional[int]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('public.schema_version')")
+        if cur.fetchone()[0] is None:
+            conn.commit()
+            return None
+        cur.execute("SELECT max(version) FROM schema_version")
+        version = cur.fetchone()[0]
+    conn.commit()
+    return version
+
+def run_migrations(conn) -> int:
+    applied = 0
+    with conn.cursor() as cur:
+        # Serialises concurrent deploys; a second runner waits and then finds nothing to do.
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            cur.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY)")
+            cur.execute("""
+                ALTER TABLE schema_version
+                    ADD COLUMN IF NOT EXISTS description TEXT,
+                    ADD COLUMN IF NOT EXISTS applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            """)
+            conn.commit()
+
+            version = current_version(conn) or 0
+            for migration_version, description, statements in MIGRATIONS:
+                if migration_version <= version:
+                    continue
+                logging.info(f"Applying migration {migration_version}: {description}")
+                for statement in statements:
+                    cur.execute(statement)
+                cur.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                    (migration_version, description)
+                )
+                conn.commit()
+                applied += 1
+        except psycopg2.Error:
+            conn.rollback()
+            raise
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+    logging.info(f"Applied {applied} migration(s); schema is at version {LATEST_VERSION}.")
+    return applied
+
+def main():
+    conn = None
+    try:
+        conn = psycopg2.connect(**db_params)
+        logging.info("Connected to the database successfully.")
+
+        run_migrations(conn)
+
+    except psycopg2.Error as e:
+        logging.error(f"Database error: {e}")
+    except Exception as e:
+        logging.error(f"An unexpected error occurred: {e}")
+    finally:
+        if conn:
+            conn.close()
+            logging.info("Database connection closed.")
+
+if __name__ == "__main__":
+    main()
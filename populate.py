@@ -1,6 +1,7 @@
 import psycopg2
 from psycopg2 import sql
 import logging
+from migrations import run_migrations
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -22,19 +23,6 @@ sample_voters = [
     ("7", "Dhruva Gupta", "https://media.licdn.com/dms/image/v2/D5603AQEPl39dPufM7g/profile-displayphoto-shrink_200_200/profile-displayphoto-shrink_200_200/0/1703523040663?e=2147483647&v=beta&t=NTXOLDM-klJ-AgXYxRZvwYtVbzvZAnyOy1QtXqqLImA", False),
 ]
 
-def create_table(conn):
-    with conn.cursor() as cur:
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS voters (
-                id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                image_url TEXT,
-                has_voted BOOLEAN DEFAULT FALSE
-            )
-        """)
-    conn.commit()
-    logging.info("Voters table created or already exists.")
-
 def insert_voters(conn, voters):
     with conn.cursor() as cur:
         for voter in voters:
@@ -50,7 +38,7 @@ def main():
         conn = psycopg2.connect(**db_params)
         logging.info("Connected to the database successfully.")
 
-        create_table(conn)
+        run_migrations(conn)
 
         insert_voters(conn, sample_voters)
 
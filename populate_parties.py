@@ -1,6 +1,7 @@
 import psycopg2
 from psycopg2 import sql
 import logging
+from migrations import run_migrations
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -18,18 +19,6 @@ sample_parties = [
     ("Party 3", 0)
 ]
 
-def create_parties_table(conn):
-    with conn.cursor() as cur:
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS parties (
-                id SERIAL PRIMARY KEY,
-                name TEXT UNIQUE NOT NULL,
-                votes INTEGER DEFAULT 0
-            )
-        """)
-    conn.commit()
-    logging.info("Parties table created or already exists.")
-
 def insert_parties(conn, parties):
     with conn.cursor() as cur:
         for party in parties:
@@ -45,7 +34,7 @@ def main():
         conn = psycopg2.connect(**db_params)
         logging.info("Connected to the database successfully.")
 
-        create_parties_table(conn)
+        run_migrations(conn)
 
         insert_parties(conn, sample_parties)
 
@@ -0,0 +1,172 @@
+import collections
+import cProfile
+import functools
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from typing import Any, Callable, Counter, Dict, Optional, Sequence
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def profile_dir() -> str:
+    directory = os.environ.get("EVM_PROFILE_DIR", "profiles")
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+class SlowOpLog:
+    def __init__(self, threshold_ms: Optional[float] = None):
+        self.threshold = (threshold_ms if threshold_ms is not None
+                          else float(os.environ.get("EVM_SLOW_OP_MS", "100"))) / 1000
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def check(self, kind: str, name: str, seconds: float, args: Any = None) -> None:
+        if seconds < self.threshold:
+            return
+        self.count += 1
+        logging.warning(f"Slow {kind} operation {name!r} took {seconds * 1000:.1f} ms (args: {args!r})")
+        entry = {
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "kind": kind,
+            "name": name,
+            "ms": round(seconds * 1000, 3),
+            "args": repr(args)[:500],
+        }
+        with self.lock:
+            with open(os.path.join(profile_dir(), "slow-ops.jsonl"), "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+slow_ops = SlowOpLog()
+
+def watch_slow(kind: str, name: str, describe: Optional[Callable[..., Any]] = None):
+    # Meant for methods: the logged arguments skip `self` unless `describe` picks something better.
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                if elapsed >= slow_ops.threshold:
+                    details = describe(*args, **kwargs) if describe else (args[1:] or kwargs or None)
+                    slow_ops.check(kind, name, elapsed, details)
+        return wrapper
+    return decorator
+
+# The profiler currently running, if any, for checkpoint() on worker threads.
+_running: Optional["Profiler"] = None
+_thread_state = threading.local()
+
+def checkpoint() -> None:
+    # Called once per loop by long-running worker threads (the serial reader), so a cProfile run
+    # covers them too: a cProfile only sees the thread that enabled it. Cheap when not profiling.
+    profiler = _running
+    profile = getattr(_thread_state, "profile", None)
+    if profile is not None and (profiler is None or profile is not profiler.thread_profiles.get(threading.current_thread().name)):
+        profile.disable()
+        _thread_state.profile = profile = None
+    if profile is None and profiler is not None:
+        profile = profiler._thread_profile(threading.current_thread().name)
+        if profile is not None:
+            _thread_state.profile = profile
+            profile.enable()
+
+class Profiler:
+    # "cprofile" traces every call on the thread that starts it (the Tk thread); "sample" polls
+    # that thread's stack from a helper thread and writes collapsed stacks for flame graphs.
+    # Threads named in `threads` are covered as well: the sampler polls their stacks too, and
+    # under cProfile each one profiles itself from its next checkpoint() until stop().
+    def __init__(self, mode: Optional[str] = None, interval: float = 0.005,
+                 threads: Sequence[str] = ("evm-serial-reader",)):
+        self.mode = mode or os.environ.get("EVM_PROFILE_MODE", "cprofile")
+        self.interval = interval
+        self.threads = set(threads)
+        self.profile: Optional[cProfile.Profile] = None
+        self.thread_profiles: Dict[str, cProfile.Profile] = {}
+        self.lock = threading.Lock()
+        self.samples: Counter[str] = collections.Counter()
+        self.sampler: Optional[threading.Thread] = None
+        self.stop_sampling = threading.Event()
+        self.started: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self.started is not None
+
+    def start(self) -> None:
+        global _running
+        if self.running:
+            return
+        self.started = time.time()
+        if self.mode == "sample":
+            self.samples.clear()
+            self.stop_sampling.clear()
+            current = threading.current_thread()
+            self.sampler = threading.Thread(target=self._sample, args=(current.ident, current.name),
+                                            name="profiler-sampler", daemon=True)
+            self.sampler.start()
+        else:
+            self.thread_profiles.clear()
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+            _running = self
+        logging.info(f"Profiling started ({self.mode})")
+
+    def _thread_profile(self, name: str) -> Optional[cProfile.Profile]:
+        with self.lock:
+            if self.profile is None or name not in self.threads or name in self.thread_profiles:
+                return None
+            profile = self.thread_profiles[name] = cProfile.Profile()
+            return profile
+
+    def stop(self) -> Optional[str]:
+        global _running
+        if not self.running:
+            return None
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        if self.mode == "sample":
+            self.stop_sampling.set()
+            self.sampler.join()
+            path = os.path.join(profile_dir(), f"profile-{stamp}.folded")
+            with open(path, "w") as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+        else:
+            self.profile.disable()
+            with self.lock:
+                _running = None
+                profiles = [self.profile] + list(self.thread_profiles.values())
+                self.profile = None
+            # A worker still inside a call stops at its next checkpoint(); its stats so far are kept.
+            stats = pstats.Stats(*profiles)
+            path = os.path.join(profile_dir(), f"profile-{stamp}.prof")
+            stats.dump_stats(path)
+            if self.thread_profiles:
+                logging.info(f"Profile includes thread(s) {', '.join(sorted(self.thread_profiles))}")
+        logging.info(f"Profiling stopped after {time.time() - self.started:.1f} s; written to {path}")
+        self.started = None
+        return path
+
+    def _sample(self, thread_id: int, thread_name: str) -> None:
+        while not self.stop_sampling.wait(self.interval):
+            # Worker threads may be restarted under a new ident, so they are looked up each time.
+            targets = {thread_id: thread_name}
+            for thread in threading.enumerate():
+                if thread.name in self.threads and thread.ident is not None:
+                    targets[thread.ident] = thread.name
+            frames = sys._current_frames()
+            for ident, name in targets.items():
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if stack:
+                    stack.append(name)
+                    self.samples[";".join(reversed(stack))] += 1
@@ -0,0 +1,84 @@
+import collections
+import logging
+import threading
+from typing import Any, Hashable, Optional, Tuple
+
+from metrics import registry
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CACHE_LOOKUPS = registry.counter("evm_cache_lookups_total", "Voter cache lookups by result", ["cache", "result"])
+
+_MISSING = object()
+
+class LRUCache:
+    def __init__(self, name: str, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "collections.OrderedDict[Hashable, Any]" = collections.OrderedDict()
+        self.hits = CACHE_LOOKUPS.labels(name, "hit")
+        self.misses = CACHE_LOOKUPS.labels(name, "miss")
+
+    def get(self, key: Hashable, default: Any = _MISSING) -> Any:
+        value = self.entries.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses.inc()
+            return default
+        self.hits.inc()
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+class VoterQueryCache:
+    # Search results keyed by normalised query and voter rows keyed by id. Entries are only
+    # dropped by invalidate(), which the engine drives from voters_changed notifications.
+    def __init__(self, max_searches: int = 256, max_voters: int = 4096):
+        self.searches = LRUCache("search", max_searches)
+        self.voters = LRUCache("voter", max_voters)
+        self.lock = threading.Lock()
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        # ILIKE is case-insensitive, so "sharma" and "Sharma" are the same search.
+        return query.casefold()
+
+    def get_search(self, query: str) -> Optional[list]:
+        with self.lock:
+            return self.searches.get(self.normalize(query), None)
+
+    def put_search(self, query: str, rows: list) -> None:
+        with self.lock:
+            self.searches.put(self.normalize(query), rows)
+
+    def get_voter(self, voter_id: str) -> Optional[Tuple]:
+        with self.lock:
+            return self.voters.get(voter_id, None)
+
+    def put_voter(self, voter_id: str, row: Tuple) -> None:
+        with self.lock:
+            self.voters.put(voter_id, row)
+
+    def invalidate(self, voter_id: Optional[str] = None) -> None:
+        # A changed row can enter or leave any search (rename, insert) or change what a result
+        # shows (has_voted), so searches always go; voter rows only for the id that changed.
+        with self.lock:
+            self.invalidations += 1
+            self.searches.clear()
+            if voter_id is None:
+                self.voters.clear()
+            else:
+                self.voters.pop(voter_id)
@@ -17,7 +17,7 @@ def reset_votes():
         conn = psycopg2.connect(**db_params)
         cursor = conn.cursor()
 
-        cursor.execute("UPDATE voters SET has_voted = FALSE")
+        cursor.execute("UPDATE voters SET has_voted = FALSE, voted_by = NULL, voted_at = NULL")
         
         conn.commit()
 
@@ -24,7 +24,7 @@ def reset_votes():
         affected_rows = cursor.rowcount
         logging.info(f"Reset votes for {affected_rows} parties.")
 
-        cursor.execute("UPDATE voters SET has_voted = FALSE")
+        cursor.execute("UPDATE voters SET has_voted = FALSE, voted_by = NULL, voted_at = NULL")
         
         conn.commit()
 
@@ -0,0 +1,114 @@
+import argparse
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Optional
+
+import psycopg2
+
+from voted_bitmap import VotedBitmap
+from voter_store import ROSTER_QUERY, VoterStore, _StringColumn
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+db_params = {
+    "dbname": "evm_database",
+    "user": "postgres",
+    "password": "12345678",
+    "host": "localhost",
+    "port": "5432"
+}
+
+# File layout, little-endian: HEADER (magic, voter count, row_version watermark, id and name blob
+# lengths, build time), then id end offsets and name end offsets (uint32 each, one per voter,
+# id-sorted so they double as the id index), the id blob, the name blob, and the has_voted bits.
+MAGIC = b"EVMROST1"
+HEADER = struct.Struct("<8sQQQQd")
+
+def write_snapshot(store: VoterStore, path: str) -> None:
+    if store.unsorted:
+        raise ValueError("only an id-sorted voter store can be written as a snapshot")
+    count = len(store)
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(HEADER.pack(MAGIC, count, store.watermark, len(store.ids.blob), len(store.names.blob), time.time()))
+        f.write(store.ids.ends.tobytes())
+        f.write(store.names.ends.tobytes())
+        f.write(store.ids.blob)
+        f.write(store.names.blob)
+        f.write(store.voted.bits())
+        f.flush()
+        os.fsync(f.fileno())
+    # Renamed into place so a booth never maps a half-written snapshot.
+    os.replace(temporary, path)
+
+def open_snapshot(path: str, bitmap_path: Optional[str] = None) -> VoterStore:
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, count, watermark, ids_length, names_length, built_at = HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        mapped.close()
+        raise ValueError(f"{path} is not an EVM roster snapshot")
+
+    view = memoryview(mapped)
+    offset = HEADER.size
+    ids_ends = view[offset:offset + 4 * count].cast("I")
+    offset += 4 * count
+    names_ends = view[offset:offset + 4 * count].cast("I")
+    offset += 4 * count
+    ids_blob = view[offset:offset + ids_length]
+    offset += ids_length
+    names_blob = view[offset:offset + names_length]
+    offset += names_length
+
+    # Only the bitmap is copied: it is the one part that changes during polling.
+    voted = VotedBitmap(bitmap_path, reset=True)
+    voted.load(view[offset:offset + (count + 7) // 8], count)
+    view.release()
+
+    store = VoterStore.from_columns(_StringColumn(ids_blob, ids_ends), _StringColumn(names_blob, names_ends),
+                                    voted, watermark)
+    store.snapshot = mapped
+    logging.info(f"Mapped roster snapshot {path} ({count} voters, built "
+                 f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(built_at))}) in "
+                 f"{(time.perf_counter() - started) * 1000:.1f} ms")
+    return store
+
+def build_snapshot(conn, path: str, batch_size: int = 50_000) -> int:
+    with conn.cursor(name="roster_snapshot") as cursor:
+        cursor.itersize = batch_size
+        cursor.execute(ROSTER_QUERY)
+        store = VoterStore.from_rows(cursor)
+    conn.commit()
+    write_snapshot(store, path)
+    store.close()
+    return len(store)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the binary roster snapshot booths map at startup.")
+    parser.add_argument("--output", default=os.environ.get("EVM_ROSTER_SNAPSHOT", "roster.snapshot"))
+    args = parser.parse_args()
+
+    conn = None
+    try:
+        conn = psycopg2.connect(**db_params)
+        logging.info("Connected to the database successfully.")
+
+        started = time.perf_counter()
+        count = build_snapshot(conn, args.output)
+        logging.info(f"Wrote {count} voters to {args.output} in {time.perf_counter() - started:.1f} s")
+
+    except psycopg2.Error as e:
+        logging.error(f"Database error: {e}")
+    except Exception as e:
+        logging.error(f"An unexpected error occurred: {e}")
+    finally:
+        if conn:
+            conn.close()
+            logging.info("Database connection closed.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import binascii
+import logging
+import struct
+import time
+from typing import List, Optional
+
+from metrics import registry
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Frame layout (little-endian): SOF, version, event type, sequence (uint16), payload length
+# (uint8), payload, then CRC-16/CCITT-FALSE over everything from version to the payload's end.
+SOF = b"\xa5\x5a"
+VERSION = 1
+HEADER = struct.Struct("<2sBBHB")
+CRC = struct.Struct("<H")
+MAX_PAYLOAD = 255
+
+# Device -> host
+VOTE = 0x01  # payload: party id (uint8)
+MARK = 0x02  # officer's mark-as-voted button, no payload
+HELLO = 0x03  # sent at boot; its sequence number restarts the stream
+# Host -> device
+ACK = 0x80  # payload: highest in-order sequence the host has processed (uint16), cumulative
+
+FRAMES = registry.counter("evm_serial_frames_total", "Serial frames by outcome", ["outcome"])
+FRAMES_ACCEPTED = FRAMES.labels("accepted")
+FRAMES_DUPLICATE = FRAMES.labels("duplicate")
+FRAMES_OUT_OF_ORDER = FRAMES.labels("out_of_order")
+FRAMES_CRC_ERROR = FRAMES.labels("crc_error")
+FRAMES_BAD_VERSION = FRAMES.labels("bad_version")
+
+def crc16(data: bytes) -> int:
+    return binascii.crc_hqx(data, 0xFFFF)
+
+class Frame:
+    __slots__ = ("version", "type", "seq", "payload")
+
+    def __init__(self, type: int, seq: int, payload: bytes = b"", version: int = VERSION):
+        self.version = version
+        self.type = type
+        self.seq = seq
+        self.payload = payload
+
+    def encode(self) -> bytes:
+        if len(self.payload) > MAX_PAYLOAD:
+            raise ValueError(f"frame payload of {len(self.payload)} bytes exceeds {MAX_PAYLOAD}")
+        body = HEADER.pack(SOF, self.version, self.type, self.seq & 0xFFFF, len(self.payload)) + self.payload
+        return body + CRC.pack(crc16(body[len(SOF):]))
+
+    def __repr__(self) -> str:
+        return f"Frame(type=0x{self.type:02x}, seq={self.seq}, payload={self.payload!r})"
+
+def ack_frame(seq: int) -> bytes:
+    return Frame(ACK, 0, struct.pack("<H", seq & 0xFFFF)).encode()
+
+class FrameDecoder:
+    # Incremental: feed() takes whatever bytes arrived and returns every complete frame. On a bad
+    # CRC only the SOF is skipped, so a frame hiding inside corrupted bytes is still found.
+    def __init__(self):
+        self.buffer = bytearray()
+        self.crc_errors = 0
+
+    def feed(self, data: bytes) -> List[Frame]:
+        self.buffer += data
+        frames = []
+        while True:
+            start = self.buffer.find(SOF)
+            if start < 0:
+                # Keep a trailing half SOF in case the rest is in the next read.
+                del self.buffer[:max(0, len(self.buffer) - 1)]
+                return frames
+            if start:
+                del self.buffer[:start]
+            if len(self.buffer) < HEADER.size:
+                return frames
+            _, version, type, seq, length = HEADER.unpack_from(self.buffer)
+            end = HEADER.size + length + CRC.size
+            if len(self.buffer) < end:
+                return frames
+            (crc,) = CRC.unpack_from(self.buffer, end - CRC.size)
+            if crc != crc16(bytes(self.buffer[len(SOF):end - CRC.size])):
+                FRAMES_CRC_ERROR.inc()
+                self.crc_errors += 1
+                del self.buffer[:len(SOF)]
+                continue
+            payload = bytes(self.buffer[HEADER.size:end - CRC.size])
+            del self.buffer[:end]
+            if version != VERSION:
+                FRAMES_BAD_VERSION.inc()
+                logging.warning(f"Dropping serial frame with unsupported protocol version {version}")
+                continue
+            frames.append(Frame(type, seq, payload, version))
+
+class SequenceTracker:
+    # Go-back-N receiver: only the next expected sequence is accepted. Anything older is a
+    # retransmission and anything newer follows a lost frame; both are dropped, and the first
+    # frame past a gap is answered with the cumulative ACK so the device resends from it. The
+    # ACK only covers frames the host has finished with (complete()), so a crash before the
+    # vote is committed leaves it unacknowledged on the device. ACKs are batched: one goes out
+    # after `ack_every` completed frames or `ack_interval` seconds, whichever comes first.
+    def __init__(self, ack_every: int = 8, ack_interval: float = 0.05):
+        self.expected: Optional[int] = None
+        self.completed: Optional[int] = None
+        self.ack_every = ack_every
+        self.ack_interval = ack_interval
+        self.unacked = 0
+        self.ack_due = False
+        self.gap_reported = False
+        self.last_ack_at = time.monotonic()
+        # Bumped by HELLO: frames from before a device reboot must not be acknowledged in the
+        # new numbering, or the device would discard frames it has not had confirmed.
+        self.generation = 0
+
+    def accept(self, frame: Frame) -> bool:
+        if frame.type == HELLO:
+            logging.info(f"Ballot unit (re)started its frame sequence at {frame.seq}")
+            self.generation += 1
+            self.expected = (frame.seq + 1) & 0xFFFF
+            self.complete(frame.seq)
+            self.ack_due = True
+            return False
+        if self.expected is None:
+            # Host restarted mid-stream: the device is resending from its last ACK.
+            self.expected = frame.seq
+        if frame.seq == self.expected:
+            self.expected = (self.expected + 1) & 0xFFFF
+            self.gap_reported = False
+            FRAMES_ACCEPTED.inc()
+            return True
+        # Within half the sequence space behind `expected` counts as already seen.
+        if (self.expected - frame.seq) & 0xFFFF <= 0x8000:
+            FRAMES_DUPLICATE.inc()
+        else:
+            FRAMES_OUT_OF_ORDER.inc()
+        # The first stray frame is answered at once, so the device resends from a gap (or learns
+        # of an ACK it lost) without waiting for its timeout. After that at most one ACK per
+        # ack_interval: each one makes the device resend its whole window.
+        if not self.gap_reported or time.monotonic() - self.last_ack_at >= self.ack_interval:
+            self.gap_reported = True
+            self.ack_due = True
+        return False
+
+    def complete(self, seq: int, generation: Optional[int] = None) -> None:
+        if generation is not None and generation != self.generation:
+            return
+        self.completed = seq
+        self.unacked += 1
+
+    def link_restored(self) -> None:
+        # The last ACK may have died with the link; repeat it so the device stops resending.
+        self.gap_reported = False
+        self.ack_due = self.completed is not None
+
+    def pending_ack(self) -> Optional[bytes]:
+        if self.completed is None:
+            return None
+        now = time.monotonic()
+        if self.ack_due or self.unacked >= self.ack_every or (self.unacked and now - self.last_ack_at >= self.ack_interval):
+            self.unacked = 0
+            self.ack_due = False
+            self.last_ack_at = now
+            return ack_frame(self.completed)
+        return None
+
+def frame_to_event(frame: Frame) -> Optional[str]:
+    # Maps frames onto the legacy line events so everything after ArduinoManager is unchanged.
+    if frame.type == VOTE and len(frame.payload) == 1:
+        return str(frame.payload[0])
+    if frame.type == MARK:
+        return "4"
+    return None
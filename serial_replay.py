@@ -0,0 +1,221 @@
+import argparse
+import collections
+import logging
+import math
+import struct
+import time
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import serial
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# File layout: MAGIC, then a header holding the wall-clock start time, then one record per
+# serial line: nanoseconds since start (uint64), payload length (uint16), raw payload bytes.
+MAGIC = b"EVMREC1\n"
+HEADER = struct.Struct("<d")
+RECORD = struct.Struct("<QH")
+
+class SerialRecorder:
+    def __init__(self, path: str):
+        self.path = path
+        self.file: BinaryIO = open(path, "wb")
+        self.started = time.monotonic_ns()
+        self.file.write(MAGIC + HEADER.pack(time.time()))
+        self.count = 0
+
+    def record(self, raw: bytes) -> None:
+        raw = raw[:0xFFFF]
+        self.file.write(RECORD.pack(time.monotonic_ns() - self.started, len(raw)) + raw)
+        # Flushed per line so the recording survives a crash, which is when it is needed most.
+        self.file.flush()
+        self.count += 1
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.file.close()
+            logging.info(f"Recorded {self.count} serial line(s) to {self.path}")
+
+def read_recording(path: str) -> Tuple[float, List[Tuple[int, bytes]]]:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an EVM serial recording")
+        (started_at,) = HEADER.unpack(f.read(HEADER.size))
+        records = []
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                break
+            offset_ns, length = RECORD.unpack(head)
+            payload = f.read(length)
+            if len(payload) < length:
+                logging.warning(f"Recording {path} ends in a truncated record; ignoring it")
+                break
+            records.append((offset_ns, payload))
+    return started_at, records
+
+class ReplaySerial:
+    # Stands in for serial.Serial in ArduinoManager: each line becomes readable at its recorded
+    # offset divided by `speed`; speed=math.inf releases everything immediately.
+    def __init__(self, records: List[Tuple[int, bytes]], speed: float = 1.0):
+        self.records = records
+        self.speed = speed
+        self.position = 0
+        self.started: Optional[float] = None
+        self.last_release: Optional[float] = None
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+
+    def _due_at(self, index: int) -> float:
+        if math.isinf(self.speed):
+            return self.started
+        return self.started + self.records[index][0] / 1e9 / self.speed
+
+    @property
+    def finished(self) -> bool:
+        return self.position >= len(self.records)
+
+    @property
+    def in_waiting(self) -> int:
+        if self.started is None:
+            self.start()
+        if self.finished or time.perf_counter() < self._due_at(self.position):
+            return 0
+        return len(self.records[self.position][1])
+
+    def readline(self) -> bytes:
+        # At max speed every line is due at once, so latency is measured from the read instead.
+        due = time.perf_counter() if math.isinf(self.speed) else self._due_at(self.position)
+        payload = self.records[self.position][1]
+        self.position += 1
+        self.last_release = due
+        return payload
+
+    def read(self, size: int = 1) -> bytes:
+        # in_waiting reports one record at a time, so a read of that size is exactly that record.
+        return self.readline()
+
+    def wait_next(self) -> None:
+        if not self.finished and self.started is not None:
+            delay = self._due_at(self.position) - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+def expected_tally(records: List[Tuple[int, bytes]]) -> Dict[int, int]:
+    tally = collections.Counter()
+    for _, payload in records:
+        event = payload.decode("utf-8", errors="replace").strip()
+        if event in ("1", "2", "3"):
+            tally[int(event)] += 1
+    return {party_id: tally[party_id] for party_id in range(1, 4)}
+
+def record(port: str, baudrate: int, path: str) -> None:
+    recorder = SerialRecorder(path)
+    connection = serial.Serial(port=port, baudrate=baudrate, timeout=0.5)
+    logging.info(f"Recording {port} to {path}; press Ctrl+C to stop.")
+    try:
+        while True:
+            raw = connection.readline()
+            if raw:
+                recorder.record(raw)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connection.close()
+        recorder.close()
+
+def replay(path: str, speed: float, dbname: str, user: str, password: str, host: str, port: str) -> dict:
+    # Imported here because evm_engine itself imports SerialRecorder from this module.
+    from bench_evm import summarize
+    from evm_engine import ArduinoManager, DatabaseManager, EVMEngine
+
+    started_at, records = read_recording(path)
+    db_manager = DatabaseManager(dbname, user, password, host, port)
+    db_manager.connect()
+    source = ReplaySerial(records, speed)
+    arduino_manager = ArduinoManager("replay", 9600)
+    arduino_manager.arduino = source
+    engine = EVMEngine(db_manager, arduino_manager)
+
+    def tally() -> Dict[int, int]:
+        return {party_id: votes for party_id, votes in db_manager.fetch_all("SELECT id, votes FROM parties WHERE id <= 3")}
+
+    before = tally()
+    latencies = []
+    wall_started = time.perf_counter()
+    logging.getLogger().setLevel(logging.WARNING)
+    source.start()
+    try:
+        while not source.finished:
+            source.wait_next()
+            position = source.position
+            engine.poll_serial(max_lines=1)
+            if source.position != position:
+                latencies.append(time.perf_counter() - source.last_release)
+    finally:
+        logging.getLogger().setLevel(logging.INFO)
+    wall = time.perf_counter() - wall_started
+    after = tally()
+    db_manager.disconnect()
+
+    expected = expected_tally(records)
+    actual = {party_id: after.get(party_id, 0) - before.get(party_id, 0) for party_id in expected}
+    divergence = {party_id: actual[party_id] - expected[party_id] for party_id in expected if actual[party_id] != expected[party_id]}
+    return {
+        "recording": path,
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(started_at)),
+        "recorded_span_s": records[-1][0] / 1e9 if records else 0.0,
+        "speed": "max" if math.isinf(speed) else speed,
+        "replay_wall_s": wall,
+        "events": len(records),
+        "latency": summarize(latencies, wall) if latencies else None,
+        "stages": engine.tracer.snapshot(),
+        "expected_tally": expected,
+        "actual_tally": actual,
+        "divergence": divergence,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Record serial vote streams and replay them through the EVM pipeline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="capture timestamped raw lines from a serial port")
+    record_parser.add_argument("output")
+    record_parser.add_argument("--port", default="COM4")
+    record_parser.add_argument("--baudrate", type=int, default=9600)
+
+    replay_parser = commands.add_parser("replay", help="feed a recording into the EVM engine against a scratch database")
+    replay_parser.add_argument("recording")
+    replay_parser.add_argument("--speed", default="max", help="1 for real time, N for N-times faster, or 'max'")
+    replay_parser.add_argument("--dbname", default="evm_bench")
+    replay_parser.add_argument("--user", default="postgres")
+    replay_parser.add_argument("--password", default="12345678")
+    replay_parser.add_argument("--host", default="localhost")
+    replay_parser.add_argument("--port", default="5432")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.port, args.baudrate, args.output)
+        return
+
+    if args.dbname == "evm_database":
+        parser.error("refusing to replay into the election database; point --dbname at a scratch database")
+    speed = math.inf if args.speed == "max" else float(args.speed)
+    report = replay(args.recording, speed, args.dbname, args.user, args.password, args.host, args.port)
+
+    latency = report["latency"]
+    print(f"Replayed {report['events']} events spanning {report['recorded_span_s']:.1f} s "
+          f"in {report['replay_wall_s']:.2f} s (speed {report['speed']})")
+    if latency:
+        print(f"End-to-end latency: p50 {latency['p50_ms']:.3f} ms  p99 {latency['p99_ms']:.3f} ms  "
+              f"max {latency['max_ms']:.3f} ms  ({latency['throughput_per_s']:.1f} events/s)")
+    for kind, stages in report["stages"].items():
+        print(f"  {kind}: " + ", ".join(f"{stage} p50 {stats['p50_ms']:.3f} ms" for stage, stats in stages.items() if stats["count"]))
+    print(f"Expected tally {report['expected_tally']}, applied {report['actual_tally']}")
+    if report["divergence"]:
+        print(f"TALLY DIVERGENCE: {report['divergence']}")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
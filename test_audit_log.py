@@ -0,0 +1,114 @@
+import json
+import os
+
+import pytest
+
+from audit_log import AuditLog, _canonical, _digest, verify
+
+def write_log(path, count: int, checkpoint_every: int = 10) -> AuditLog:
+    log = AuditLog(str(path), flush_interval=0.01, checkpoint_every=checkpoint_every)
+    for i in range(count):
+        log.append("vote", {"party_id": 1 + i % 3, "key": f"vote:{i}"})
+    assert log.sync(5)
+    return log
+
+def read_lines(path):
+    with open(path, "rb") as f:
+        return f.read().splitlines(keepends=True)
+
+def write_lines(path, lines):
+    with open(path, "wb") as f:
+        f.write(b"".join(lines))
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / "audit.log"
+
+def test_chain_verifies_across_checkpoints(path):
+    write_log(path, 45).close()
+    report = verify(str(path), workers=1)
+    assert report["errors"] == []
+    assert report["records"] == 45
+    assert report["chunks"] == 5
+
+def test_reopened_log_continues_the_chain(path):
+    write_log(path, 5).close()
+    log = AuditLog(str(path))
+    assert log.append("mark", {"voter_id": "V1"}) == 6
+    log.close()
+    assert verify(str(path), workers=1)["errors"] == []
+
+def test_altered_record_is_detected(path):
+    write_log(path, 25).close()
+    lines = read_lines(path)
+    record = json.loads(lines[14])
+    record["data"]["party_id"] = 4
+    lines[14] = json.dumps(record, sort_keys=True, separators=(",", ":")).encode() + b"\n"
+    write_lines(path, lines)
+    assert verify(str(path), workers=1)["errors"] == ["record 15 was altered"]
+
+def test_rehashed_record_still_breaks_the_chain(path):
+    write_log(path, 25).close()
+    lines = read_lines(path)
+    record = json.loads(lines[14])
+    record["data"]["party_id"] = 4
+    # Re-hashing the edited record hides it from its own check, but not from the next one.
+    record["hash"] = _digest({k: v for k, v in record.items() if k != "hash"})
+    lines[14] = _canonical(record) + b"\n"
+    write_lines(path, lines)
+    assert verify(str(path), workers=1)["errors"] == ["record 16 does not follow record 15"]
+
+def test_removed_record_is_detected(path):
+    write_log(path, 25).close()
+    lines = read_lines(path)
+    del lines[14]
+    write_lines(path, lines)
+    errors = verify(str(path), workers=1)["errors"]
+    assert errors and errors[0] == "expected seq 15, found 16"
+
+def test_truncation_past_a_checkpoint_is_detected(path):
+    write_log(path, 25).close()
+    write_lines(path, read_lines(path)[:15])
+    errors = verify(str(path), workers=1)["errors"]
+    assert any("before checkpoint 20" in error for error in errors)
+
+def test_torn_tail_is_cut_off_on_reopen(path):
+    write_log(path, 5).close()
+    with open(path, "ab") as f:
+        f.write(b'{"seq":6,"ts":1')
+    log = AuditLog(str(path))
+    assert log.seq == 5
+    log.append("mark", {"voter_id": "V1"})
+    log.close()
+    report = verify(str(path), workers=1)
+    assert report["errors"] == []
+    assert report["records"] == 6
+
+class FailingFile:
+    # Writes half of the first `failures` writes, then raises, like a disk filling up mid-batch.
+    def __init__(self, file, failures: int):
+        self.file = file
+        self.failures = failures
+
+    def write(self, data) -> int:
+        if self.failures:
+            self.failures -= 1
+            self.file.write(data[:len(data) // 2])
+            raise OSError(28, "No space left on device")
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+def test_failed_write_is_retried_without_breaking_the_chain(path):
+    log = write_log(path, 3)
+    log.retry_interval = 0.01
+    log.file = FailingFile(log.file, failures=2)
+    for i in range(5):
+        log.append("vote", {"party_id": 1, "key": f"late:{i}"})
+    assert log.sync(5)
+    log.close()
+    report = verify(str(path), workers=1)
+    assert report["errors"] == []
+    assert report["records"] == 8
+    assert os.path.getsize(path) == sum(len(line) for line in read_lines(path))
@@ -0,0 +1,187 @@
+import threading
+
+import psycopg2
+import pytest
+import serial
+
+from evm_engine import ArduinoManager, DatabaseManager, EVMEngine
+from serial_protocol import VOTE, Frame
+from voter_store import VoterStore
+
+class FakeCursor:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.executed = []
+        self.rowcount = 1
+        self.itersize = 0
+
+    def execute(self, query, params=()):
+        self.executed.append(query)
+        if "fail" in query:
+            raise psycopg2.errors.SyntaxError("syntax error")
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class FakeConnection:
+    def __init__(self, rows=()):
+        self.rows = rows
+        self.closed = 0
+        self.commits = 0
+        self.rollbacks = 0
+        self.notifies = []
+
+    def cursor(self, name=None):
+        return FakeCursor(self.rows)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def poll(self):
+        pass
+
+@pytest.fixture
+def db():
+    db = DatabaseManager("evm_test", "postgres", "", "localhost", "5432", primary=False)
+    db.conn = FakeConnection(rows=[(1,), (2,), (3,)])
+    db.cursor = db.conn.cursor()
+    return db
+
+def test_statement_outside_a_transaction_commits(db):
+    db.execute("UPDATE parties SET votes = 0")
+    assert db.conn.commits == 1
+
+def test_transaction_commits_once_at_the_outermost_level(db):
+    with db.transaction():
+        db.execute("UPDATE parties SET votes = 0")
+        with db.transaction():
+            db.execute("UPDATE voters SET has_voted = FALSE")
+        assert db.conn.commits == 0
+    assert db.conn.commits == 1
+    assert db._transaction_depth == 0
+
+def test_failed_transaction_rolls_back(db):
+    with pytest.raises(psycopg2.Error):
+        with db.transaction():
+            db.execute("UPDATE parties SET votes = 0")
+            db.execute("fail")
+    assert db.conn.commits == 0
+    assert db.conn.rollbacks == 1
+    assert db._transaction_depth == 0
+
+def test_abandoned_iter_rows_unwinds_the_transaction(db):
+    rows = db.iter_rows("SELECT id FROM voters")
+    assert next(rows) == (1,)
+    # Closing the generator raises GeneratorExit, not an Exception, inside transaction().
+    rows.close()
+    assert db._transaction_depth == 0
+    assert db.conn.rollbacks == 1
+    db.execute("UPDATE parties SET votes = 0")
+    assert db.conn.commits == 1
+
+def test_interrupted_transaction_unwinds(db):
+    with pytest.raises(KeyboardInterrupt):
+        with db.transaction():
+            raise KeyboardInterrupt
+    assert db._transaction_depth == 0
+    assert db.conn.rollbacks == 1
+
+def test_idempotency_key_already_applied_skips_the_write(db):
+    db.cursor.rowcount = 0
+    assert db.execute("UPDATE parties SET votes = votes + 1", idempotency_key="vote:a") == 0
+    assert db.cursor.executed == ["INSERT INTO applied_writes (idempotency_key) VALUES (%s) ON CONFLICT DO NOTHING"]
+
+class FullDiskRecorder:
+    def record(self, raw):
+        raise OSError(28, "No space left on device")
+
+@pytest.mark.parametrize("protocol", ["line", "framed"])
+def test_recorder_failure_keeps_the_event_and_the_link(protocol):
+    unit = ArduinoManager("loop://", 9600, FullDiskRecorder(), protocol)
+    unit.arduino = serial.serial_for_url("loop://", timeout=0.1)
+    if protocol == "framed":
+        unit.arduino.write(b"".join(Frame(VOTE, seq, bytes([seq])).encode() for seq in (1, 2, 3)))
+    else:
+        unit.arduino.write(b"1\n2\n3\n")
+    assert [unit.read_data() for _ in range(3)] == ["1", "2", "3"]
+    assert unit.arduino is not None
+    unit.disconnect()
+
+def test_lost_port_still_hands_out_buffered_lines():
+    class Unplugged:
+        @property
+        def in_waiting(self):
+            raise serial.SerialException("device disconnected")
+
+        def close(self):
+            pass
+
+    unit = ArduinoManager("loop://", 9600)
+    unit.arduino = Unplugged()
+    unit.buffer += b"2\n3"
+    assert unit.read_data() == "2"
+    assert unit.read_data() == ""
+    assert unit.arduino is None
+    assert unit.link_lost_at is not None
+
+def test_store_search_runs_off_the_engine_lock(db):
+    engine = EVMEngine(db, ArduinoManager("loop://", 9600))
+    engine.store = VoterStore.from_rows([("V001", "Aarav Sharma", False, 1), ("V002", "Diya Reddy", False, 2)])
+    search = engine.store.search
+    free = []
+
+    def probe():
+        free.append(engine.lock.acquire(timeout=1))
+        if free[-1]:
+            engine.lock.release()
+
+    def search_and_probe(query, **kwargs):
+        thread = threading.Thread(target=probe)
+        thread.start()
+        thread.join()
+        return search(query, **kwargs)
+
+    engine.store.search = search_and_probe
+    assert [row[0] for row in engine.search_voters("sharma")] == ["V001"]
+    assert free == [True]
+    # Cached for the next caller, since nothing changed meanwhile.
+    assert engine.cache.get_search("sharma") is not None
+
+class LostReplyDatabase:
+    # The conditional UPDATE committed, but its reply was lost and the retry after reconnecting
+    # found the voter already marked; `voted_by` is whoever the row names.
+    def __init__(self, voted_by, retried=True):
+        self.voted_by = voted_by
+        self.retried = retried
+        self.reconnect_count = 0
+
+    def fetch_one(self, query, params=(), retry=True, idempotency_key=None):
+        if query.lstrip().startswith("UPDATE"):
+            self.reconnect_count += self.retried
+            return None
+        return (self.voted_by, "2026-10-19 09:00:00+00")
+
+@pytest.mark.parametrize("voted_by, retried, won", [("t1", True, True), ("t2", True, False), ("t1", False, False)])
+def test_mark_after_a_lost_reply(voted_by, retried, won):
+    engine = EVMEngine(LostReplyDatabase(voted_by, retried), ArduinoManager("loop://", 9600), terminal_id="t1")
+    events = []
+    engine.subscribe(events.append)
+    result = engine.mark_voted("V001")
+    assert result.won is won
+    assert result.voted_by == voted_by
+    assert [event.kind for event in events] == (["voter_marked"] if won else [])
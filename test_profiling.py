@@ -0,0 +1,45 @@
+import pstats
+import threading
+import time
+
+import pytest
+
+from profiling import Profiler, checkpoint
+
+def hot_path_work():
+    return sum(range(2000))
+
+@pytest.fixture
+def reader(monkeypatch, tmp_path):
+    monkeypatch.setenv("EVM_PROFILE_DIR", str(tmp_path))
+    stop = threading.Event()
+
+    def serve_forever():
+        while not stop.is_set():
+            checkpoint()
+            hot_path_work()
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=serve_forever, name="evm-serial-reader", daemon=True)
+    thread.start()
+    yield thread
+    stop.set()
+    thread.join()
+
+def test_cprofile_covers_the_serial_reader(reader):
+    profiler = Profiler("cprofile")
+    profiler.start()
+    time.sleep(0.2)
+    path = profiler.stop()
+    functions = {name for _, _, name in pstats.Stats(path).stats}
+    assert "hot_path_work" in functions
+
+def test_sampler_covers_the_serial_reader(reader):
+    profiler = Profiler("sample", interval=0.002)
+    profiler.start()
+    time.sleep(0.3)
+    path = profiler.stop()
+    with open(path) as f:
+        stacks = [line.rsplit(" ", 1)[0] for line in f]
+    assert any(stack.startswith("evm-serial-reader;") for stack in stacks)
+    assert any(stack.startswith("MainThread;") for stack in stacks)
@@ -0,0 +1,41 @@
+from query_cache import LRUCache, VoterQueryCache
+
+def test_lru_evicts_the_least_recently_used():
+    cache = LRUCache("test", 2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b", None) is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+def test_lru_caches_falsy_values():
+    cache = LRUCache("test", 2)
+    cache.put("empty", [])
+    assert cache.get("empty", None) == []
+
+def test_searches_are_case_insensitive():
+    cache = VoterQueryCache()
+    cache.put_search("Sharma", [("V1", "Aarav Sharma", None, False)])
+    assert cache.get_search("sHARMA") == [("V1", "Aarav Sharma", None, False)]
+    assert cache.get_search("Reddy") is None
+
+def test_invalidating_one_voter_drops_every_search():
+    cache = VoterQueryCache()
+    cache.put_search("sharma", [])
+    cache.put_voter("V1", ("V1", "Aarav Sharma", None, False))
+    cache.put_voter("V2", ("V2", "Diya Reddy", None, False))
+    cache.invalidate("V1")
+    assert cache.get_search("sharma") is None
+    assert cache.get_voter("V1") is None
+    assert cache.get_voter("V2") == ("V2", "Diya Reddy", None, False)
+    assert cache.invalidations == 1
+
+def test_full_invalidation_drops_every_voter():
+    cache = VoterQueryCache()
+    cache.put_voter("V1", ("V1", "Aarav Sharma", None, False))
+    cache.invalidate()
+    assert cache.get_voter("V1") is None
+    assert cache.invalidations == 1
@@ -0,0 +1,122 @@
+import struct
+
+from serial_protocol import (ACK, HELLO, MARK, SOF, VOTE, Frame, FrameDecoder, SequenceTracker, ack_frame,
+                             frame_to_event)
+
+def vote(seq: int, party_id: int = 1) -> Frame:
+    return Frame(VOTE, seq, bytes([party_id]))
+
+def acked_seq(ack: bytes) -> int:
+    (frame,) = FrameDecoder().feed(ack)
+    assert frame.type == ACK
+    return struct.unpack("<H", frame.payload)[0]
+
+def test_round_trip():
+    frames = [vote(1, 2), Frame(MARK, 2), Frame(HELLO, 0xFFFF)]
+    decoded = FrameDecoder().feed(b"".join(frame.encode() for frame in frames))
+    assert [(f.type, f.seq, f.payload) for f in decoded] == [(f.type, f.seq, f.payload) for f in frames]
+    assert [frame_to_event(f) for f in decoded] == ["2", "4", None]
+
+def test_frames_split_across_reads():
+    data = vote(1).encode() + vote(2).encode()
+    decoder = FrameDecoder()
+    decoded = []
+    for i in range(len(data)):
+        decoded += decoder.feed(data[i:i + 1])
+    assert [f.seq for f in decoded] == [1, 2]
+
+def test_corrupted_frame_is_dropped_and_the_next_one_found():
+    bad = bytearray(vote(1).encode())
+    bad[-3] ^= 0xFF
+    decoder = FrameDecoder()
+    decoded = decoder.feed(b"noise" + bytes(bad) + vote(2).encode())
+    assert [f.seq for f in decoded] == [2]
+    assert decoder.crc_errors == 1
+
+def test_frame_inside_a_truncated_one_is_found():
+    # A frame cut short by a glitch must not swallow the frame that follows it.
+    cut = vote(1).encode()[:-2]
+    decoded = FrameDecoder().feed(cut + vote(2).encode() + vote(3).encode())
+    assert [f.seq for f in decoded][-2:] == [2, 3]
+
+def test_unsupported_version_is_dropped():
+    decoded = FrameDecoder().feed(Frame(VOTE, 1, b"\x01", version=9).encode() + vote(2).encode())
+    assert [f.seq for f in decoded] == [2]
+
+def test_trailing_half_sof_is_kept():
+    decoder = FrameDecoder()
+    data = vote(7).encode()
+    assert decoder.feed(b"junk" + SOF[:1]) == []
+    assert [f.seq for f in decoder.feed(SOF[1:] + data[len(SOF):])] == [7]
+
+def test_duplicates_and_gaps_are_rejected():
+    tracker = SequenceTracker()
+    assert tracker.accept(vote(10))
+    assert tracker.accept(vote(11))
+    assert not tracker.accept(vote(11))
+    assert not tracker.accept(vote(13))
+    assert tracker.accept(vote(12))
+    assert tracker.accept(vote(13))
+
+def test_sequence_wraps():
+    tracker = SequenceTracker()
+    assert tracker.accept(vote(0xFFFF))
+    assert tracker.accept(vote(0))
+    assert not tracker.accept(vote(0xFFFF))
+
+def test_acks_are_cumulative_and_batched():
+    tracker = SequenceTracker(ack_every=3, ack_interval=60)
+    for seq in range(1, 3):
+        assert tracker.accept(vote(seq))
+        tracker.complete(seq)
+        assert tracker.pending_ack() is None
+    tracker.accept(vote(3))
+    tracker.complete(3)
+    assert acked_seq(tracker.pending_ack()) == 3
+    assert tracker.pending_ack() is None
+
+def test_ack_only_covers_completed_frames():
+    tracker = SequenceTracker(ack_every=1, ack_interval=60)
+    assert tracker.accept(vote(1))
+    assert tracker.pending_ack() is None
+    tracker.complete(1)
+    assert acked_seq(tracker.pending_ack()) == 1
+
+def test_gap_is_answered_at_once_with_the_last_completed_frame():
+    tracker = SequenceTracker(ack_every=100, ack_interval=60)
+    tracker.accept(vote(1))
+    tracker.complete(1)
+    assert tracker.pending_ack() is None
+    assert not tracker.accept(vote(3))
+    assert acked_seq(tracker.pending_ack()) == 1
+    # Further stray frames wait for ack_interval instead of each forcing a resend.
+    assert not tracker.accept(vote(4))
+    assert tracker.pending_ack() is None
+
+def test_hello_restarts_the_sequence():
+    tracker = SequenceTracker()
+    tracker.accept(vote(40))
+    tracker.accept(Frame(HELLO, 5))
+    assert acked_seq(tracker.pending_ack()) == 5
+    assert not tracker.accept(vote(41))
+    assert tracker.accept(vote(6))
+
+def test_completion_from_before_a_reboot_is_not_acknowledged():
+    tracker = SequenceTracker(ack_every=1, ack_interval=60)
+    tracker.accept(vote(40))
+    generation = tracker.generation
+    tracker.accept(Frame(HELLO, 0))
+    tracker.pending_ack()
+    tracker.complete(40, generation)
+    assert tracker.pending_ack() is None
+
+def test_link_restored_repeats_the_last_ack():
+    tracker = SequenceTracker(ack_every=1, ack_interval=60)
+    tracker.accept(vote(1))
+    tracker.complete(1)
+    assert acked_seq(tracker.pending_ack()) == 1
+    tracker.link_restored()
+    assert acked_seq(tracker.pending_ack()) == 1
+
+def test_ack_frame_round_trips():
+    assert acked_seq(ack_frame(0x1234)) == 0x1234
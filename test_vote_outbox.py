@@ -0,0 +1,140 @@
+import collections
+from contextlib import contextmanager
+
+import psycopg2
+import pytest
+
+from evm_engine import ArduinoManager, EVMEngine
+from vote_outbox import VoteOutbox
+
+@pytest.fixture
+def outbox(tmp_path):
+    outbox = VoteOutbox(str(tmp_path / "outbox.db"))
+    yield outbox
+    outbox.close()
+
+def test_append_ignores_a_key_already_queued(outbox):
+    assert outbox.append("vote", "vote:a", {"party_id": 1}) is not None
+    assert outbox.append("vote", "vote:a", {"party_id": 1}) is None
+    assert len(outbox) == 1
+
+def test_peek_and_remove_through_keep_order(outbox):
+    for i in range(5):
+        outbox.append("vote", f"vote:{i}", {"party_id": 1 + i % 2})
+    entries = outbox.peek(3)
+    assert [entry.idempotency_key for entry in entries] == ["vote:0", "vote:1", "vote:2"]
+    outbox.remove_through(entries[-1].seq)
+    assert len(outbox) == 2
+    assert [entry.idempotency_key for entry in outbox.peek(10)] == ["vote:3", "vote:4"]
+
+def test_pending_votes_counts_only_votes(outbox):
+    outbox.append("vote", "vote:a", {"party_id": 1})
+    outbox.append("vote", "vote:b", {"party_id": 1})
+    outbox.append("vote", "vote:c", {"party_id": 3})
+    outbox.append("mark", "mark:V1", {"voter_id": "V1", "voted_by": "t1", "voted_at": None})
+    assert outbox.pending_votes() == {1: 2, 3: 1}
+
+def test_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    outbox = VoteOutbox(path)
+    outbox.append("vote", "vote:a", {"party_id": 2})
+    outbox.close()
+    outbox = VoteOutbox(path)
+    assert len(outbox) == 1
+    assert outbox.peek(1)[0].payload == {"party_id": 2}
+    outbox.close()
+
+class CentralDatabase:
+    # Stands in for the DatabaseManager replay runs on: applied_writes, parties and voters are
+    # kept in memory, and a transaction's changes only land if it commits. With `lose_commits`
+    # the next commits apply but then raise, as when the link drops before the reply arrives.
+    def __init__(self, voters=()):
+        self.applied = set()
+        self.votes = collections.Counter()
+        self.voted_by = dict(voters)
+        self.lose_commits = 0
+        self._staged = None
+
+    @contextmanager
+    def transaction(self):
+        self._staged = (set(self.applied), collections.Counter(self.votes), dict(self.voted_by))
+        try:
+            yield self
+        except BaseException:
+            self._staged = None
+            raise
+        self.applied, self.votes, self.voted_by = self._staged
+        self._staged = None
+        if self.lose_commits:
+            self.lose_commits -= 1
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    def fetch_all(self, query, params=()):
+        assert "INSERT INTO applied_writes" in query
+        applied = self._staged[0]
+        fresh = [key for key in params[0] if key not in applied]
+        applied.update(fresh)
+        return [(key,) for key in fresh]
+
+    def execute(self, query, params=()):
+        assert "UPDATE parties" in query
+        for party_id, count in zip(*params):
+            self._staged[1][party_id] += count
+        return len(params[0])
+
+    def fetch_one(self, query, params=()):
+        voted_by = self._staged[2]
+        if "UPDATE voters" in query:
+            by, _, voter_id = params
+            if voted_by.get(voter_id) is not None:
+                return None
+            voted_by[voter_id] = by
+            return (by,)
+        return (voted_by.get(params[0]),)
+
+@pytest.fixture
+def engine(outbox):
+    return EVMEngine(None, ArduinoManager("loop://", 9600), terminal_id="t1", outbox=outbox)
+
+def queue_votes(outbox, parties):
+    for i, party_id in enumerate(parties):
+        outbox.append("vote", f"vote:{i}", {"party_id": party_id})
+
+def test_replay_applies_each_vote_once(engine, outbox):
+    db = CentralDatabase()
+    queue_votes(outbox, [1, 2, 2, 3, 3, 3])
+    while engine.replay_outbox(db, batch_size=4):
+        pass
+    assert db.votes == {1: 1, 2: 2, 3: 3}
+    assert len(outbox) == 0
+
+def test_replay_after_a_lost_commit_does_not_count_twice(engine, outbox):
+    db = CentralDatabase()
+    queue_votes(outbox, [1, 2, 2])
+    db.lose_commits = 1
+    with pytest.raises(psycopg2.OperationalError):
+        engine.replay_outbox(db)
+    # The batch stays queued since its commit was never confirmed, and is replayed as a no-op.
+    assert len(outbox) == 3
+    assert engine.replay_outbox(db) == 3
+    assert db.votes == {1: 1, 2: 2}
+    assert len(outbox) == 0
+
+def test_replay_reports_marks_made_elsewhere(engine, outbox):
+    db = CentralDatabase({"V1": "t2", "V2": None})
+    events = []
+    engine.subscribe(events.append)
+    for voter_id in ("V1", "V2"):
+        outbox.append("mark", f"mark:{voter_id}", {"voter_id": voter_id, "voted_by": "t1", "voted_at": None})
+    engine.replay_outbox(db)
+    assert db.voted_by == {"V1": "t2", "V2": "t1"}
+    assert [(event.voter_id, event.voted_by) for event in events] == [("V1", "t2")]
+
+def test_replayed_mark_that_had_committed_is_not_a_conflict(engine, outbox):
+    db = CentralDatabase({"V1": "t1"})
+    events = []
+    engine.subscribe(events.append)
+    outbox.append("mark", "mark:V1", {"voter_id": "V1", "voted_by": "t1", "voted_at": None})
+    engine.replay_outbox(db)
+    assert events == []
+    assert len(outbox) == 0
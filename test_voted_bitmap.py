@@ -0,0 +1,64 @@
+import pytest
+
+from voted_bitmap import VotedBitmap
+
+class UnmappedResizeOnly:
+    # Fails like Windows does when a file is resized while a view of it is still mapped.
+    def __init__(self, bitmap: VotedBitmap):
+        self.bitmap = bitmap
+        self.file = bitmap.file
+
+    def truncate(self, length: int) -> int:
+        if not self.bitmap.map.closed:
+            raise OSError(1224, "The requested operation cannot be performed on a file with a user-mapped section open")
+        return self.file.truncate(length)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+def fill(bitmap: VotedBitmap, count: int) -> None:
+    for ordinal in range(count):
+        bitmap.append(ordinal % 3 == 0)
+
+@pytest.mark.parametrize("file_backed", [True, False])
+def test_growing_keeps_the_bits(tmp_path, file_backed):
+    bitmap = VotedBitmap(str(tmp_path / "voted.bitmap") if file_backed else None)
+    if file_backed:
+        bitmap.file = UnmappedResizeOnly(bitmap)
+    fill(bitmap, 5 * 4096 * 8)
+    assert len(bitmap) == 5 * 4096 * 8
+    assert bitmap.count == (5 * 4096 * 8 + 2) // 3
+    assert all(bitmap.get(ordinal) == (ordinal % 3 == 0) for ordinal in range(0, len(bitmap), 997))
+    bitmap.close()
+
+def test_bits_survive_a_reopen(tmp_path):
+    path = str(tmp_path / "voted.bitmap")
+    bitmap = VotedBitmap(path)
+    fill(bitmap, 40_000)
+    assert bitmap.test_and_set(1) is False
+    bitmap.close()
+    bitmap = VotedBitmap(path)
+    assert len(bitmap) == 40_000
+    assert bitmap.get(1) and bitmap.get(39_999) and not bitmap.get(39_998)
+    assert bitmap.test_and_set(1) is True
+    bitmap.close()
+
+def test_load_grows_past_the_first_capacity(tmp_path):
+    bitmap = VotedBitmap(str(tmp_path / "voted.bitmap"))
+    bitmap.file = UnmappedResizeOnly(bitmap)
+    bits = bytes([0b1]) * 10_000
+    bitmap.load(bits, 80_000)
+    assert len(bitmap) == 80_000
+    assert bitmap.count == 10_000
+    assert bitmap.get(8) and not bitmap.get(9)
+    bitmap.close()
+
+def test_clear_and_bounds():
+    bitmap = VotedBitmap()
+    fill(bitmap, 10)
+    bitmap.clear(0)
+    assert not bitmap.get(0)
+    assert bitmap.count == 3
+    with pytest.raises(IndexError):
+        bitmap.get(10)
+    bitmap.close()
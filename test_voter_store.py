@@ -0,0 +1,124 @@
+import pytest
+
+from roster_snapshot import open_snapshot, write_snapshot
+from voter_store import CANCEL_CHECK_ROWS, SearchCancelled, VoterRows, VoterStore
+
+ROWS = [
+    ("V001", "Aarav Sharma", False, 1),
+    ("V002", "Diya Reddy", True, 2),
+    ("V003", "Rohan Sharma", False, 3),
+    ("V004", "Meera Iyer", False, 4),
+]
+
+@pytest.fixture
+def store():
+    store = VoterStore.from_rows(ROWS)
+    yield store
+    store.close()
+
+def ids(rows):
+    return [row[0] for row in rows]
+
+def test_lookup_by_id(store):
+    assert store.ordinal("V003") == 2
+    assert store.ordinal("V999") is None
+    assert store.row(1) == ("V002", "Diya Reddy", None, True)
+    assert store.watermark == 4
+
+def test_search_matches_name_or_id_case_insensitively(store):
+    assert store.search("sharma") == [0, 2]
+    assert store.search("v004") == [3]
+    assert store.search("nobody") == []
+    assert list(store.search("")) == [0, 1, 2, 3]
+    assert store.search("a", limit=2) == [0, 1]
+
+def test_search_does_not_match_across_voters(store):
+    # "Sharma" ends one record and "Diya" starts the next; the separator keeps them apart.
+    assert store.search("SharmaDiya") == []
+    assert store.search("aV00") == []
+
+def test_search_stops_when_asked():
+    store = VoterStore.from_rows((f"V{i:06d}", f"Voter {i}", False, i) for i in range(3 * CANCEL_CHECK_ROWS))
+    checks = []
+
+    def should_stop():
+        checks.append(True)
+        return len(checks) > 1
+
+    with pytest.raises(SearchCancelled):
+        store.search("voter", should_stop=should_stop)
+    assert len(store.search("voter", should_stop=lambda: False)) == 3 * CANCEL_CHECK_ROWS
+
+def test_rows_match_row(store):
+    assert store.rows() == [store.row(ordinal) for ordinal in range(len(store))]
+
+def test_delta_updates_votes_and_adds_voters(store):
+    assert store.apply_delta([("V001", "Aarav Sharma", True, 5), ("V000", "Kavya Nair", False, 6)])
+    assert store.has_voted(store.ordinal("V001"))
+    assert store.ordinal("V000") == 4
+    assert store.search("kavya") == [4]
+    assert store.watermark == 6
+
+def test_delta_with_a_rename_asks_for_a_reload(store):
+    assert not store.apply_delta([("V002", "Diya Rao", True, 5)])
+
+def test_set_voted_reports_the_previous_value(store):
+    assert store.set_voted(0) is False
+    assert store.set_voted(0) is True
+    assert store.voted_count() == 2
+    assert store.set_voted(0, False) is True
+    assert store.voted_count() == 1
+
+def test_voter_rows_builds_rows_on_demand(store):
+    everyone = VoterRows(store)
+    assert len(everyone) == 4
+    assert ids(everyone[1:3]) == ["V002", "V003"]
+    assert everyone[-1][0] == "V004"
+    with pytest.raises(IndexError):
+        everyone[4]
+    # has_voted is read live, not captured when the view was made.
+    store.set_voted(3)
+    assert everyone[3][3] is True
+
+def test_voter_rows_covers_voters_added_later(store):
+    everyone = VoterRows(store)
+    store.append("V005", "Arjun Das", False)
+    assert ids(everyone)[-1] == "V005"
+
+def test_voter_rows_filter_refines_a_search(store):
+    sharmas = VoterRows(store, store.search("sharma"))
+    assert ids(sharmas.filter("rohan")) == ["V003"]
+    assert ids(VoterRows(store).filter("V00")) == ["V001", "V002", "V003", "V004"]
+
+def test_voter_rows_filter_stops_when_asked(store):
+    with pytest.raises(SearchCancelled):
+        VoterRows(store).filter("sharma", should_stop=lambda: True)
+    assert ids(VoterRows(store).filter("sharma", should_stop=lambda: False)) == ["V001", "V003"]
+
+def test_snapshot_round_trip(store, tmp_path):
+    path = str(tmp_path / "roster.snapshot")
+    write_snapshot(store, path)
+    mapped = open_snapshot(path, str(tmp_path / "voted.bitmap"))
+    try:
+        assert mapped.snapshot is not None
+        assert mapped.rows() == store.rows()
+        assert mapped.watermark == store.watermark
+        assert mapped.ordinal("V004") == 3
+        assert mapped.search("sharma") == [0, 2]
+        mapped.prefault()
+        # The mapped columns are read-only; the first append copies them.
+        assert mapped.apply_delta([("V005", "Arjun Das", True, 5)])
+        assert mapped.search("arjun") == [4]
+    finally:
+        mapped.close()
+
+def test_snapshot_needs_an_id_sorted_store(store, tmp_path):
+    store.append("V000", "Kavya Nair", False)
+    with pytest.raises(ValueError):
+        write_snapshot(store, str(tmp_path / "roster.snapshot"))
+
+def test_open_snapshot_rejects_other_files(tmp_path):
+    path = tmp_path / "roster.snapshot"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        open_snapshot(str(path))
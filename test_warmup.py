@@ -0,0 +1,42 @@
+import image_client
+from evm_engine import Voter
+from warmup import WarmupScheduler
+
+class FakeEngine:
+    def __init__(self, count: int):
+        self.voters = [Voter(f"V{i:04d}", f"Voter {i}", f"http://photos.invalid/{i}.jpg", False) for i in range(count)]
+
+    def prefault_roster(self):
+        pass
+
+    def prefetch_voters(self, after, limit, db):
+        start = 0 if after is None else int(after[1:]) + 1
+        return self.voters[start:start + limit]
+
+class FakeDatabase:
+    conn = None
+
+    def connect(self):
+        self.conn = type("Connection", (), {"closed": 0})()
+
+class FakeClient:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.fetched = []
+
+    def get_thumbnail(self, url, size, timeout, should_stop):
+        self.fetched.append(url)
+
+def test_photos_stop_at_the_image_cache_capacity(monkeypatch):
+    client = FakeClient(max_entries=4)
+    monkeypatch.setattr(image_client, "shared_client", lambda: client)
+    engine = FakeEngine(10)
+    WarmupScheduler(engine, limit=10, batch_size=3, idle_after=0)._run(FakeDatabase())
+    # The first voters in list order are the ones kept, not evicted by later ones.
+    assert client.fetched == [voter.image_url for voter in engine.voters[:4]]
+
+def test_all_photos_within_capacity(monkeypatch):
+    client = FakeClient(max_entries=256)
+    monkeypatch.setattr(image_client, "shared_client", lambda: client)
+    WarmupScheduler(FakeEngine(10), limit=10, batch_size=3, idle_after=0)._run(FakeDatabase())
+    assert len(client.fetched) == 10
@@ -0,0 +1,74 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import as_completed
+
+import psycopg2
+
+from image_client import shared_client
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+db_params = {
+    "dbname": "evm_database",
+    "user": "postgres",
+    "password": "12345678",
+    "host": "localhost",
+    "port": "5432"
+}
+
+def build_thumbnails(conn, output: str, size: int = 200, batch_size: int = 1000) -> dict:
+    # Goes through the same client as the booth GUI, so a run also fills the shared image cache
+    # and booths started afterwards only revalidate.
+    client = shared_client()
+    os.makedirs(output, exist_ok=True)
+    stats = {"written": 0, "failed": 0}
+    with conn.cursor(name="voter_images") as cursor:
+        cursor.itersize = batch_size
+        cursor.execute("SELECT id, image_url FROM voters WHERE image_url IS NOT NULL AND image_url <> '' ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            # The client's pool bounds how many downloads run at once.
+            futures = {client.submit_thumbnail(image_url, (size, size)): voter_id for voter_id, image_url in rows}
+            for future in as_completed(futures):
+                voter_id = futures[future]
+                try:
+                    future.result().save(os.path.join(output, f"{voter_id}.png"))
+                    stats["written"] += 1
+                except Exception as e:
+                    logging.warning(f"No thumbnail for voter {voter_id}: {e}")
+                    stats["failed"] += 1
+    conn.commit()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Download every voter photo and write square PNG thumbnails.")
+    parser.add_argument("--output", default="thumbnails")
+    parser.add_argument("--size", type=int, default=200)
+    args = parser.parse_args()
+
+    conn = None
+    try:
+        conn = psycopg2.connect(**db_params)
+        logging.info("Connected to the database successfully.")
+
+        started = time.perf_counter()
+        stats = build_thumbnails(conn, args.output, args.size)
+        logging.info(f"Wrote {stats['written']} thumbnail(s) to {args.output} ({stats['failed']} failed) "
+                     f"in {time.perf_counter() - started:.1f} s")
+
+    except psycopg2.Error as e:
+        logging.error(f"Database error: {e}")
+    except Exception as e:
+        logging.error(f"An unexpected error occurred: {e}")
+    finally:
+        if conn:
+            conn.close()
+            logging.info("Database connection closed.")
+        shared_client().close()
+
+if __name__ == "__main__":
+    main()
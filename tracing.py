@@ -0,0 +1,98 @@
+import collections
+import json
+import logging
+import os
+import threading
+import time
+from typing import Deque, Dict, List, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class RollingHistogram:
+    def __init__(self, window: int = 10_000):
+        self.samples: Deque[float] = collections.deque(maxlen=window)
+        self.total = 0
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.total += 1
+
+    def summary(self) -> Dict[str, float]:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"count": 0, "total": self.total}
+
+        def percentile(p: float) -> float:
+            return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+        return {
+            "count": len(ordered),
+            "total": self.total,
+            "p50_ms": percentile(50),
+            "p90_ms": percentile(90),
+            "p99_ms": percentile(99),
+            "max_ms": ordered[-1] * 1000,
+        }
+
+class Trace:
+    __slots__ = ("kind", "started", "marks")
+
+    def __init__(self, kind: str, started: Optional[float] = None):
+        self.kind = kind
+        self.started = started if started is not None else time.perf_counter()
+        self.marks: List[Tuple[str, float]] = []
+
+    def mark(self, stage: str) -> None:
+        self.marks.append((stage, time.perf_counter()))
+
+class LatencyTracer:
+    # Each stage is histogrammed as the time since the previous stage, plus a "total" series
+    # from the first timestamp (serial receive or button press) to the last.
+    def __init__(self, window: int = 10_000):
+        self.window = window
+        self.histograms: Dict[Tuple[str, str], RollingHistogram] = {}
+        self.lock = threading.Lock()
+
+    def start(self, kind: str, started: Optional[float] = None) -> Trace:
+        return Trace(kind, started)
+
+    def finish(self, trace: Trace) -> None:
+        previous = trace.started
+        with self.lock:
+            for stage, at in trace.marks:
+                self._histogram(trace.kind, stage).add(at - previous)
+                previous = at
+            self._histogram(trace.kind, "total").add(previous - trace.started)
+
+    def observe(self, kind: str, stage: str, seconds: float) -> None:
+        # For stages that happen after the trace was finished elsewhere, e.g. on another thread.
+        with self.lock:
+            self._histogram(kind, stage).add(seconds)
+
+    def _histogram(self, kind: str, stage: str) -> RollingHistogram:
+        key = (kind, stage)
+        if key not in self.histograms:
+            self.histograms[key] = RollingHistogram(self.window)
+        return self.histograms[key]
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        with self.lock:
+            report: Dict[str, Dict[str, Dict[str, float]]] = {}
+            for (kind, stage), histogram in self.histograms.items():
+                report.setdefault(kind, {})[stage] = histogram.summary()
+            return report
+
+    def dump(self, directory: Optional[str] = None) -> str:
+        directory = directory or os.environ.get("EVM_TRACE_DIR", ".")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"latency-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        report = self.snapshot()
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        for kind, stages in report.items():
+            for stage, stats in stages.items():
+                if stats["count"]:
+                    logging.info(f"Latency {kind}/{stage}: p50 {stats['p50_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms, "
+                                 f"max {stats['max_ms']:.2f} ms over {stats['count']} event(s)")
+        logging.info(f"Latency histograms written to {path}")
+        return path
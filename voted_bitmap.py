@@ -0,0 +1,138 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+from typing import Optional
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# File layout: MAGIC, the number of voters as uint64, then one bit per voter ordinal (LSB first).
+MAGIC = b"EVMBITS1"
+HEADER = struct.Struct("<8sQ")
+
+class VotedBitmap:
+    # Who has voted, by voter ordinal, in an mmap'd file: every check is one byte read and the
+    # bits outlive the process. The database stays authoritative; callers set a bit only after
+    # the matching UPDATE committed. Pages are left to the OS to write back rather than msync'd
+    # per vote, since a bitmap lost with the machine is rebuilt from the voters table at load.
+    def __init__(self, path: Optional[str] = None, reset: bool = False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+        self.size = 0
+        self.count = 0
+        if path and os.path.exists(path) and not reset:
+            self.file = open(path, "r+b")
+            self.map = mmap.mmap(self.file.fileno(), 0)
+            magic, self.size = HEADER.unpack_from(self.map, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not an EVM voted bitmap")
+            self.count = self._popcount()
+            logging.info(f"Opened voted bitmap {path}: {self.count} of {self.size} voted")
+        else:
+            self._allocate(4096)
+
+    def _allocate(self, capacity_bytes: int) -> None:
+        length = HEADER.size + capacity_bytes
+        old = getattr(self, "map", None)
+        if self.path:
+            # Windows will not resize a file that is still mapped, so the old view is closed first;
+            # growing the file keeps the bits already in it.
+            if old is not None:
+                old.close()
+            if self.file is None:
+                self.file = open(self.path, "w+b")
+            self.file.truncate(length)
+            new = mmap.mmap(self.file.fileno(), length)
+        else:
+            new = mmap.mmap(-1, length)
+            if old is not None:
+                used = HEADER.size + (self.size + 7) // 8
+                new[:used] = old[:used]
+                old.close()
+        self.map = new
+        HEADER.pack_into(self.map, 0, MAGIC, self.size)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _popcount(self) -> int:
+        used = self.map[HEADER.size:HEADER.size + (self.size + 7) // 8]
+        return bin(int.from_bytes(used, "little")).count("1")
+
+    def append(self, value: bool) -> int:
+        ordinal = self.size
+        # Capacity doubles, so a bulk load of N voters remaps O(log N) times.
+        if HEADER.size + ordinal // 8 >= len(self.map):
+            self._allocate(2 * (len(self.map) - HEADER.size))
+        self.size += 1
+        position = HEADER.size + (ordinal >> 3)
+        if ordinal & 7 == 0:
+            self.map[position] = 0
+        if value:
+            self.map[position] |= 1 << (ordinal & 7)
+            self.count += 1
+        HEADER.pack_into(self.map, 0, MAGIC, self.size)
+        return ordinal
+
+    def load(self, bits: bytes, size: int) -> None:
+        # Replaces the contents in one copy, e.g. from a roster snapshot.
+        with self.lock:
+            capacity = len(self.map) - HEADER.size
+            if capacity < len(bits):
+                while capacity < len(bits):
+                    capacity *= 2
+                self.size = 0
+                self._allocate(capacity)
+            self.map[HEADER.size:HEADER.size + len(bits)] = bits
+            self.size = size
+            self.count = self._popcount()
+            HEADER.pack_into(self.map, 0, MAGIC, self.size)
+
+    def get(self, ordinal: int) -> bool:
+        if not 0 <= ordinal < self.size:
+            raise IndexError(ordinal)
+        return bool(self.map[HEADER.size + (ordinal >> 3)] & (1 << (ordinal & 7)))
+
+    def test_and_set(self, ordinal: int) -> bool:
+        # Returns the previous value, so exactly one caller sees False for any ordinal.
+        if not 0 <= ordinal < self.size:
+            raise IndexError(ordinal)
+        position = HEADER.size + (ordinal >> 3)
+        bit = 1 << (ordinal & 7)
+        with self.lock:
+            previous = self.map[position]
+            if previous & bit:
+                return True
+            self.map[position] = previous | bit
+            self.count += 1
+            return False
+
+    def clear(self, ordinal: int) -> None:
+        if not 0 <= ordinal < self.size:
+            raise IndexError(ordinal)
+        position = HEADER.size + (ordinal >> 3)
+        bit = 1 << (ordinal & 7)
+        with self.lock:
+            if self.map[position] & bit:
+                self.map[position] &= ~bit & 0xFF
+                self.count -= 1
+
+    def bits(self) -> bytes:
+        return self.map[HEADER.size:HEADER.size + (self.size + 7) // 8]
+
+    def nbytes(self) -> int:
+        return (self.size + 7) // 8
+
+    def flush(self) -> None:
+        self.map.flush()
+
+    def close(self) -> None:
+        if not self.map.closed:
+            if self.path:
+                self.map.flush()
+            self.map.close()
+        if self.file:
+            self.file.close()
+            self.file = None
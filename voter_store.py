@@ -0,0 +1,290 @@
+import bisect
+import heapq
+import logging
+import mmap
+import re
+from array import array
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from voted_bitmap import VotedBitmap
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Record separator inside the column blobs, so a substring match can never span two voters.
+SEPARATOR = b"\x00"
+
+# COLLATE "C" sorts by bytes, which is the order VoterStore.ordinal() bisects in.
+ROSTER_QUERY = 'SELECT id, name, has_voted, row_version FROM voters ORDER BY id COLLATE "C"'
+
+class SearchCancelled(Exception):
+    pass
+
+# How many matching rows a scan handles between checks of its `should_stop`.
+CANCEL_CHECK_ROWS = 4096
+
+class _StringColumn:
+    # All values live in one UTF-8 blob with a 4-byte end offset per row: roughly the string's
+    # own length plus 5 bytes per voter, instead of ~60 bytes of str header plus tuple slots.
+    def __init__(self, blob: Optional[memoryview] = None, ends: Optional[memoryview] = None):
+        # blob/ends may be read-only views into a mapped roster snapshot; the first append copies them.
+        self.blob = blob if blob is not None else bytearray()
+        self.ends = ends if ends is not None else array("I")
+
+    def __len__(self) -> int:
+        return len(self.ends)
+
+    @property
+    def mapped(self) -> bool:
+        return isinstance(self.blob, memoryview)
+
+    def append(self, value: str) -> None:
+        if self.mapped:
+            ends = array("I")
+            ends.frombytes(self.ends.cast("B"))
+            self.blob, self.ends = bytearray(self.blob), ends
+        self.blob += value.encode("utf-8") + SEPARATOR
+        if len(self.blob) > 0xFFFFFFFF:
+            raise OverflowError("voter store column exceeds 4 GiB")
+        self.ends.append(len(self.blob))
+
+    def start(self, index: int) -> int:
+        return self.ends[index - 1] if index else 0
+
+    def raw(self, index: int) -> bytes:
+        return bytes(self.blob[self.start(index):self.ends[index] - 1])
+
+    def get(self, index: int) -> str:
+        return self.raw(index).decode("utf-8")
+
+    def values(self) -> List[str]:
+        # One decode and one split in C for the whole column, rather than a slice per row.
+        return str(self.blob[:-1], "utf-8").split(SEPARATOR.decode()) if len(self.blob) else []
+
+    def row_at(self, position: int) -> int:
+        return bisect.bisect_right(self.ends, position)
+
+    def find(self, pattern: "re.Pattern[bytes]", should_stop: Optional[Callable[[], bool]] = None) -> Iterator[int]:
+        # Resumes past the end of each matching row, so a row is located (one bisect) once however
+        # often it matches.
+        blob, ends = self.blob, self.ends
+        position = found = 0
+        while True:
+            match = pattern.search(blob, position)
+            if match is None:
+                return
+            index = self.row_at(match.start())
+            yield index
+            position = ends[index]
+            found += 1
+            if should_stop is not None and found % CANCEL_CHECK_ROWS == 0 and should_stop():
+                raise SearchCancelled()
+
+    def nbytes(self) -> int:
+        return len(self.blob) + self.ends.itemsize * len(self.ends)
+
+    def release(self) -> None:
+        if self.mapped:
+            self.blob.release()
+            self.ends.release()
+
+class VoterStore:
+    # Columnar, read-mostly copy of the roll for in-memory search. Rows are addressed by a dense
+    # ordinal; image URLs stay in the database because only the selected voter ever needs one.
+    def __init__(self, voted: Optional[VotedBitmap] = None):
+        self.ids = _StringColumn()
+        self.names = _StringColumn()
+        self.voted = voted if voted is not None else VotedBitmap()
+        # Ordinals below sorted_count are in id order and bisected; anything appended out of order
+        # (e.g. voters added after the bulk load) goes through the small `unsorted` dict instead.
+        self.sorted_count = 0
+        self.unsorted: Dict[str, int] = {}
+        self._last_id: Optional[bytes] = None
+        # Highest voters.row_version reflected here; deltas are fetched from just above it.
+        self.watermark = 0
+        self.snapshot = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, voter_id: str, name: str, has_voted: bool) -> int:
+        ordinal = len(self.ids)
+        encoded = voter_id.encode("utf-8")
+        if ordinal == self.sorted_count and (self._last_id is None or encoded > self._last_id):
+            self.sorted_count += 1
+            self._last_id = encoded
+        else:
+            self.unsorted[voter_id] = ordinal
+        self.ids.append(voter_id)
+        self.names.append(name)
+        self.voted.append(has_voted)
+        return ordinal
+
+    def extend(self, rows: Iterable[Tuple[str, str, bool]]) -> int:
+        count = 0
+        for voter_id, name, has_voted in rows:
+            self.append(voter_id, name, has_voted)
+            count += 1
+        return count
+
+    def ordinal(self, voter_id: str) -> Optional[int]:
+        if voter_id in self.unsorted:
+            return self.unsorted[voter_id]
+        target = voter_id.encode("utf-8")
+        lo, hi = 0, self.sorted_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ids.raw(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.sorted_count and self.ids.raw(lo) == target:
+            return lo
+        return None
+
+    def has_voted(self, ordinal: int) -> bool:
+        return self.voted.get(ordinal)
+
+    def set_voted(self, ordinal: int, value: bool = True) -> bool:
+        # Returns whether the bit was already set.
+        if value:
+            return self.voted.test_and_set(ordinal)
+        previous = self.voted.get(ordinal)
+        self.voted.clear(ordinal)
+        return previous
+
+    def voted_count(self) -> int:
+        return self.voted.count
+
+    def row(self, ordinal: int) -> Tuple[str, str, None, bool]:
+        # Same shape as the voters SELECT the GUI renders, minus the image URL.
+        return (self.ids.get(ordinal), self.names.get(ordinal), None, self.has_voted(ordinal))
+
+    def rows(self, ordinals: Optional[Iterable[int]] = None) -> List[Tuple[str, str, None, bool]]:
+        if ordinals is not None:
+            return [self.row(ordinal) for ordinal in ordinals]
+        voted = self.voted.bits()
+        return [(voter_id, name, None, bool(voted[ordinal >> 3] & (1 << (ordinal & 7))))
+                for ordinal, (voter_id, name) in enumerate(zip(self.ids.values(), self.names.values()))]
+
+    def search(self, query: str, limit: Optional[int] = None,
+               should_stop: Optional[Callable[[], bool]] = None) -> Sequence[int]:
+        # Same matching as `name ILIKE '%q%' OR id ILIKE '%q%'`; case folding is ASCII-only.
+        # Raises SearchCancelled as soon as `should_stop` returns True, e.g. for a query superseded
+        # by the next keystroke.
+        query = query.replace("\x00", "")
+        if not query:
+            return range(len(self) if limit is None else min(limit, len(self)))
+        pattern = re.compile(re.escape(query.encode("utf-8")), re.IGNORECASE)
+        # Both scans yield ordinals in ascending order, so they merge without a set or a sort.
+        names = list(self.names.find(pattern, should_stop))
+        if should_stop is not None and should_stop():
+            raise SearchCancelled()
+        ids = list(self.ids.find(pattern, should_stop))
+        found = list(dict.fromkeys(heapq.merge(names, ids))) if names and ids else names or ids
+        return found if limit is None else found[:limit]
+
+    def nbytes(self) -> int:
+        return self.ids.nbytes() + self.names.nbytes() + self.voted.nbytes()
+
+    def apply_delta(self, rows: Iterable[Tuple[str, str, bool, int]]) -> bool:
+        # Applies changed voters rows (id, name, has_voted, row_version). Returns False when a row
+        # cannot be patched in place (a renamed voter), in which case the caller reloads.
+        for voter_id, name, has_voted, row_version in rows:
+            ordinal = self.ordinal(voter_id)
+            if ordinal is None:
+                self.append(voter_id, name, has_voted)
+            elif self.names.get(ordinal) != name:
+                return False
+            else:
+                self.set_voted(ordinal, has_voted)
+            self.watermark = max(self.watermark, row_version)
+        return True
+
+    def prefault(self) -> None:
+        # A mapped snapshot is read from disk page by page as searches touch it; this asks for all
+        # of it up front so the first search does not pay for the faults.
+        # May run off the engine lock, so a close() meanwhile shows up as ValueError, not None.
+        snapshot = self.snapshot
+        if snapshot is None:
+            return
+        if hasattr(mmap, "MADV_WILLNEED"):
+            snapshot.madvise(mmap.MADV_WILLNEED)
+            return
+        for offset in range(0, len(snapshot), mmap.PAGESIZE):
+            snapshot[offset]
+
+    def close(self) -> None:
+        self.voted.close()
+        if self.snapshot is not None:
+            self.ids.release()
+            self.names.release()
+            self.snapshot.close()
+            self.snapshot = None
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[str, str, bool, int]], voted: Optional[VotedBitmap] = None) -> "VoterStore":
+        store = cls(voted)
+        for voter_id, name, has_voted, row_version in rows:
+            store.append(voter_id, name, has_voted)
+            if row_version > store.watermark:
+                store.watermark = row_version
+        return store
+
+    @classmethod
+    def from_database(cls, db_manager, bitmap_path: Optional[str] = None,
+                      batch_size: int = 50_000) -> "VoterStore":
+        # The bitmap file is rebuilt from the voters table, which is authoritative.
+        store = cls.from_rows(db_manager.iter_rows(ROSTER_QUERY, batch_size=batch_size),
+                              VotedBitmap(bitmap_path, reset=True))
+        logging.info(f"Loaded {len(store)} voters into the voter store ({store.nbytes() / 2**20:.1f} MiB)")
+        return store
+
+    @classmethod
+    def from_columns(cls, ids: _StringColumn, names: _StringColumn, voted: VotedBitmap, watermark: int) -> "VoterStore":
+        # For columns that are already id-sorted, e.g. straight out of a roster snapshot.
+        store = cls(voted)
+        store.ids = ids
+        store.names = names
+        store.sorted_count = len(ids)
+        store._last_id = ids.raw(len(ids) - 1) if len(ids) else None
+        store.watermark = watermark
+        return store
+
+class VoterRows:
+    # A result list that builds (id, name, None, has_voted) rows only when indexed, so a list of
+    # the whole roll costs nothing until a window of it is shown. Without ordinals it covers
+    # every voter, including any appended later; has_voted is always read live.
+    def __init__(self, store: VoterStore, ordinals: Optional[Sequence[int]] = None):
+        self.store = store
+        self.ordinals = ordinals
+
+    def __len__(self) -> int:
+        return len(self.store) if self.ordinals is None else len(self.ordinals)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self.store.row(self._ordinal(i)) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.store.row(self._ordinal(index))
+
+    def __iter__(self) -> Iterator[Tuple[str, str, None, bool]]:
+        for i in range(len(self)):
+            yield self.store.row(self._ordinal(i))
+
+    def _ordinal(self, index: int) -> int:
+        return index if self.ordinals is None else self.ordinals[index]
+
+    def filter(self, query: str, should_stop: Optional[Callable[[], bool]] = None) -> "VoterRows":
+        # Narrows by the same matching as VoterStore.search without building the rows.
+        folded = query.lower()
+        ordinals = range(len(self.store)) if self.ordinals is None else self.ordinals
+        names, ids = self.store.names, self.store.ids
+        kept = []
+        for start in range(0, len(ordinals), CANCEL_CHECK_ROWS):
+            if should_stop is not None and should_stop():
+                raise SearchCancelled()
+            kept += [ordinal for ordinal in ordinals[start:start + CANCEL_CHECK_ROWS]
+                     if folded in names.get(ordinal).lower() or folded in ids.get(ordinal).lower()]
+        return VoterRows(self.store, kept)
@@ -0,0 +1,134 @@
+import logging
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+import psycopg2
+
+from evm_engine import DatabaseManager, EVMEngine
+from metrics import registry
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+WARMUP_ITEMS = registry.counter("evm_warmup_items_total", "Items preloaded by the startup warm-up", ["kind"])
+WARMUP_PAUSES = registry.counter("evm_warmup_pauses_total", "Times the warm-up yielded to foreground work").labels()
+
+class WarmupScheduler:
+    # Preloads what the first selections would otherwise pay for cold: the mapped roster's pages,
+    # the voter rows (into the engine's cache) and photo thumbnails of voters still to vote, in
+    # id order, which is the order the voter list shows. It takes one small step at a time on a
+    # low-priority thread, and no step starts until `idle_after` seconds after the last
+    # foreground() call, so an officer who starts working is never queued behind it. Queries go
+    # over a session of its own and the engine lock is only taken to install results, so the
+    # niced thread never holds it across a round trip; a photo download in progress is abandoned
+    # between chunks as soon as foreground work arrives, and retried once things are quiet.
+    def __init__(self, engine: EVMEngine, limit: int = 300, batch_size: int = 25, idle_after: float = 1.0,
+                 thumbnail_size: Tuple[int, int] = (200, 200), timeout: Tuple[float, float] = (1.0, 2.0)):
+        self.engine = engine
+        self.limit = limit
+        self.batch_size = batch_size
+        self.idle_after = idle_after
+        self.thumbnail_size = thumbnail_size
+        self.timeout = timeout
+        self.last_foreground = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="evm-warmup", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def foreground(self) -> None:
+        self.last_foreground = time.monotonic()
+
+    def _interrupted(self) -> bool:
+        return self._stop.is_set() or time.monotonic() - self.last_foreground < self.idle_after
+
+    def _wait_idle(self) -> bool:
+        paused = False
+        while not self._stop.is_set():
+            remaining = self.idle_after - (time.monotonic() - self.last_foreground)
+            if remaining <= 0:
+                return True
+            if not paused:
+                WARMUP_PAUSES.inc()
+                paused = True
+            self._stop.wait(remaining)
+        return False
+
+    def _lower_priority(self) -> None:
+        # Linux applies a nice value per thread; elsewhere the idle gating alone has to do.
+        if hasattr(os, "setpriority") and hasattr(threading, "get_native_id"):
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+            except OSError:
+                pass
+
+    def run(self) -> None:
+        self._lower_priority()
+        db = self.engine.db_manager.clone(reconnect_attempts=1)
+        try:
+            self._run(db)
+        finally:
+            db.disconnect()
+
+    def _run(self, db: DatabaseManager) -> None:
+        started = time.perf_counter()
+        if not self._wait_idle():
+            return
+        self.engine.prefault_roster()
+        WARMUP_ITEMS.labels("roster").inc()
+
+        if not self._wait_idle():
+            return
+        # Imported here, on this thread, so requests and PIL are never loaded on the Tk thread.
+        from image_client import FetchCancelled, shared_client
+        client = shared_client()
+        # Photos past what the client keeps would evict the first ones warmed, which belong to the
+        # voters most likely to be called up first.
+        photo_limit = min(self.limit, client.max_entries)
+        if photo_limit < self.limit:
+            logging.info(f"Warm-up will preload {photo_limit} of {self.limit} photos, the image cache's capacity")
+
+        after = None
+        voters = photos = 0
+        while voters < self.limit:
+            if not self._wait_idle():
+                return
+            try:
+                if db.conn is None or db.conn.closed:
+                    db.connect()
+                batch = self.engine.prefetch_voters(after, min(self.batch_size, self.limit - voters), db)
+            except psycopg2.Error as e:
+                logging.warning(f"Warm-up stopped: {e}")
+                return
+            if not batch:
+                break
+            after = batch[-1].id
+            voters += len(batch)
+            WARMUP_ITEMS.labels("voter").inc(len(batch))
+            for voter in batch:
+                if not voter.image_url or photos >= photo_limit:
+                    continue
+                while True:
+                    if not self._wait_idle():
+                        return
+                    try:
+                        client.get_thumbnail(voter.image_url, self.thumbnail_size, self.timeout, self._interrupted)
+                    except FetchCancelled:
+                        continue
+                    except Exception as e:
+                        logging.debug(f"Warm-up could not fetch the photo of voter {voter.id}: {e}")
+                        break
+                    photos += 1
+                    WARMUP_ITEMS.labels("photo").inc()
+                    break
+        logging.info(f"Warm-up preloaded {voters} voter(s) and {photos} photo(s) in "
+                     f"{time.perf_counter() - started:.1f} s")